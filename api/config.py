@@ -27,6 +27,10 @@ LOG_LEVEL = SYS_CONF.get('LOG_LEVEL', 'INFO')
 SYS_LOG_INDEX = SYS_CONF.get('SYS_LOG_INDEX', 'sys_logs')
 INTERFACE_LOG_INDEX = SYS_CONF.get('INTERFACE_LOG_INDEX', 'interface_logs')
 TASK_LOG_INDEX = SYS_CONF.get('TASK_LOG_INDEX', 'task_logs')
+# 系统、接口日志异步批量写入配置：每批条数，最长刷新间隔(秒)，缓冲区最大条数(超出时丢弃最早的日志)
+LOG_FLUSH_SIZE = int(SYS_CONF.get('LOG_FLUSH_SIZE', 500))
+LOG_FLUSH_INTERVAL = float(SYS_CONF.get('LOG_FLUSH_INTERVAL', 1))
+LOG_BUFFER_MAX = int(SYS_CONF.get('LOG_BUFFER_MAX', 10000))
 # es 相关配置
 es_hosts = SYS_CONF.get('ES_HOSTS', '')
 ES_HOSTS = es_hosts.split(',')
@@ -62,6 +66,18 @@ OSS_BUCKET = SYS_CONF.get('OSS_BUCKET')
 USE_TOKEN_REFRESH = SYS_CONF.get('USE_TOKEN_REFRESH') == '1'
 # 用户token过期时间
 TOKEN_EXP_TIME = int(SYS_CONF.get('TOKEN_EXP_TIME', 3600))
+# 数据接口信息redis缓存过期时间
+INTERFACE_CACHE_EXP = int(SYS_CONF.get('INTERFACE_CACHE_EXP', 3600))
+# 数据接口信息进程内缓存过期时间，多进程部署时接口变更最多延迟此时间生效
+INTERFACE_LOCAL_CACHE_EXP = int(SYS_CONF.get('INTERFACE_LOCAL_CACHE_EXP', 5))
+# 向量进程内缓存条数及过期时间
+EMBEDDING_LOCAL_CACHE_SIZE = int(SYS_CONF.get('EMBEDDING_LOCAL_CACHE_SIZE', 10000))
+EMBEDDING_LOCAL_CACHE_EXP = int(SYS_CONF.get('EMBEDDING_LOCAL_CACHE_EXP', 3600))
+# pdf文档解析进程数，默认1为单进程
+# 多进程解析只在celery任务中生效，web请求中同步训练不创建子进程(多线程进程中fork不安全)；
+# celery prefork(worker_process=prefork)的子进程为守护进程，无法创建解析子进程，此时自动退回单进程解析，
+# 需要并行解析时，训练任务所在队列的worker使用worker_process=solo运行
+PDF_EXTRACT_WORKERS = int(SYS_CONF.get('PDF_EXTRACT_WORKERS', 1))
 # sqlalchemy配置
 engine_db_config = 'mysql+pymysql://{}:{}@{}:{}/{}?charset=utf8'.format(
         DB_USER, DB_PWD, DB_HOST, DB_PORT, DB_NAME)
@@ -7,6 +7,8 @@ reader_map = {
     'file:file_table': 'etl.data_models.file_models.TableFileModel',
     'file:file_json': 'etl.data_models.file_models.JsonFileModel',
     'file:file_h5': 'etl.data_models.file_models.H5FileModel',
+    'file:file_parquet': 'etl.data_models.file_models.ParquetFileModel',
+    'file:file_arrow': 'etl.data_models.file_models.ArrowFileModel',
     'http:None': 'etl.data_models.http_models.BaseHttpModel',
     'http:http_json': 'etl.data_models.http_models.HttpApiModel',
     'http:http_html': 'etl.data_models.http_models.HttpHtmlModel',
@@ -14,6 +16,8 @@ reader_map = {
     'minio:minio_table': 'etl.data_models.minio_models.TableMinioModel',
     'minio:minio_json': 'etl.data_models.minio_models.JsonMinioModel',
     'minio:minio_h5': 'etl.data_models.minio_models.H5MinioModel',
+    'minio:minio_parquet': 'etl.data_models.minio_models.ParquetMinioModel',
+    'minio:minio_arrow': 'etl.data_models.minio_models.ArrowMinioModel',
     'redis:None': 'etl.data_models.redis_models.BaseRedisModel',
     'redis:redis_string': 'etl.data_models.redis_models.RedisStringModel',
     'redis:redis_list': 'etl.data_models.redis_models.RedisListModel',
@@ -59,6 +63,8 @@ writer_map = {
     'minio:minio_table': 'etl.data_models.minio_models.TableMinioModel',
     'minio:minio_json': 'etl.data_models.minio_models.JsonMinioModel',
     'minio:minio_h5': 'etl.data_models.minio_models.H5MinioModel',
+    'minio:minio_parquet': 'etl.data_models.minio_models.ParquetMinioModel',
+    'minio:minio_arrow': 'etl.data_models.minio_models.ArrowMinioModel',
     'redis:redis_string': 'etl.data_models.redis_models.RedisStringModel',
     'redis:redis_list': 'etl.data_models.redis_models.RedisListModel',
     'redis:redis_map': 'etl.data_models.redis_models.RedisMapModel',
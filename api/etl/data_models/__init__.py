@@ -3,6 +3,8 @@ from abc import ABC, abstractmethod
 
 class DataModel(ABC):
     default_batch_size = 1000
+    # 是否支持按水位字段watermark_field增量分批读取
+    support_watermark = False
 
     def __init__(self, model_info):
         self.model_info = model_info
@@ -1,5 +1,5 @@
 from etl.data_models import DataModel
-from etl.utils.db_utils import get_database_engine
+from etl.utils.db_utils import get_database_engine, stream_query
 from etl.utils.common_utils import gen_json_response, df_to_list
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import MetaData
@@ -130,11 +130,10 @@ df = reader.query(sql)
         if sql_rules != []:
             self.sql = sql_rules[0].get('value')
 
-    def query(self, sql, limit=1000, offset=0):
+    def check_sql(self, sql):
         '''
-        查询数据
+        检查sql，只允许查询操作
         '''
-        # 解析SQL查询
         parsed = sqlparse.parse(sql)
         if not parsed:
             raise RuntimeError('sql解析失败')
@@ -142,6 +141,14 @@ df = reader.query(sql)
         matches = pattern.findall(sql)
         if matches:
             raise RuntimeError("SQL包含不允许的操作")
+        return parsed
+
+    def query(self, sql, limit=1000, offset=0):
+        '''
+        查询数据
+        '''
+        # 解析SQL查询
+        parsed = self.check_sql(sql)
         if sql.upper().strip().startswith('SELECT'):
             # 获取第一个语句
             stmt = parsed[0]
@@ -202,6 +209,17 @@ df = reader.query(sql)
         self.gen_extract_rules()
         if 'custom_sql' not in self.auth_types and self.sql != self.default_sql:
             yield False, '无修改sql权限'
+        if self._extract_info.get('batch_mode') == 'stream':
+            # 服务端游标流式读取完整结果集
+            self.check_sql(self.sql)
+            stream_format = self._extract_info.get('stream_format', 'records')
+            for records in stream_query(self.db_engine, self.sql, self.batch_size, stream_format):
+                res_data = {
+                    'records': records,
+                    'total': None
+                }
+                yield True, gen_json_response(data=res_data)
+            return
         df = self.query(self.sql, limit=self.batch_size)
         data_li = df_to_list(df)
         total = len(data_li)
@@ -1,7 +1,7 @@
 from etl.data_models import DataModel
-from etl.utils.db_utils import get_database_engine, get_database_model
-from etl.utils.common_utils import trans_rule_value, gen_json_response
-from sqlalchemy import not_
+from etl.utils.db_utils import get_database_engine, get_database_model, stream_query, clear_database_cache
+from etl.utils.common_utils import trans_rule_value, gen_json_response, parse_to_list
+from sqlalchemy import not_, text, and_, or_, bindparam
 from sqlalchemy.sql.schema import Table
 from sqlalchemy import Column, String, Integer, Text, SmallInteger, DateTime, TIMESTAMP, Float
 from sqlalchemy.ext.declarative import declarative_base
@@ -12,6 +12,7 @@ import re
 
 
 class BaseDBTableModel(DataModel):
+    support_watermark = True
 
     def __init__(self, model_info):
         super().__init__(model_info)
@@ -49,6 +50,14 @@ class BaseDBTableModel(DataModel):
         else:
             self.table = None
 
+    def refresh_table_model(self):
+        '''
+        清除表模型缓存后重新获取表模型，表结构变更后调用
+        :return:
+        '''
+        clear_database_cache(self.conn_conf, self.table_name)
+        self.get_table_model()
+
     def connect(self):
         '''
         连通性测试
@@ -221,9 +230,8 @@ df = reader.query(sql)
                 create_sql = str(CreateTable(Model.__table__).compile(self.db_engine))
                 print(create_sql)
                 Model.__table__.create(self.db_engine)
-            self.db_engine.dispose()
             # 重新获取模型
-            self.get_table_model()
+            self.refresh_table_model()
             return True, '创建成功'
         except Exception as e:
             return False, str(e)
@@ -236,7 +244,7 @@ df = reader.query(sql)
             return False, '无删除权限'
         try:
             self.table.drop(self.db_engine)
-            self.db_engine.dispose()
+            clear_database_cache(self.conn_conf, self.table_name)
             return True, '删除表成功'
         except Exception as e:
             return False, str(e)
@@ -269,6 +277,7 @@ df = reader.query(sql)
             c_sql = f"""ALTER TABLE `{self.table_name}` {set_type} COLUMN `{field['field_name']}` {field['type']} COMMENT '{field.get('comment', '')}';"""
             print(c_sql)
             self.db_engine.execute(c_sql)
+            clear_database_cache(self.conn_conf, self.table_name)
             return True, '操作成功'
         except Exception as e:
             return False, str(e)
@@ -389,6 +398,127 @@ df = reader.query(sql)
         }
         return True, gen_json_response(res_data)
 
+    def get_approx_total(self):
+        '''
+        获取表级估算总数，不考虑筛选条件，不支持的数据库返回None
+        :return:
+        '''
+        return None
+
+    def get_total(self, query):
+        '''
+        获取分批读取总数，total_type: exact 精确计数，approx 估算值，none 不计数
+        :param query:
+        :return:
+        '''
+        total_type = self._extract_info.get('total_type', 'exact')
+        if total_type == 'none':
+            return None
+        if total_type == 'approx':
+            try:
+                total = self.get_approx_total()
+            except Exception as e:
+                print(e)
+                total = None
+            if total is not None:
+                return total
+        return query.count()
+
+    def get_seek_column(self):
+        '''
+        获取游标分页字段，优先使用增量水位字段watermark_field，其次seek_field，均未配置时使用单一主键
+        :return:
+        '''
+        seek_field = self._extract_info.get('watermark_field') or self._extract_info.get('seek_field')
+        if seek_field:
+            return self.table.columns.get(seek_field)
+        pk_columns = list(self.table.primary_key.columns)
+        if len(pk_columns) == 1:
+            return pk_columns[0]
+        return None
+
+    def read_batch_seek(self, query):
+        '''
+        按主键或单调递增字段游标分页读取，WHERE seek_field > last_value LIMIT n，避免大偏移量OFFSET扫描
+        配置watermark_field时按水位字段增量读取，从watermark_start(上次提交的检查点)之后开始
+        :param query:
+        :return:
+        '''
+        column = self.get_seek_column()
+        if column is None:
+            yield False, '未找到游标分页字段，请配置seek_field'
+            return
+        total = self.get_total(query)
+        pagesize = self._extract_info.get('batch_size', 1000)
+        # 游标字段非主键时以单一主键为次排序字段，相同游标值的数据跨批次时不遗漏
+        pk_columns = list(self.table.primary_key.columns)
+        tie_column = None
+        if len(pk_columns) == 1 and pk_columns[0].name != column.name:
+            tie_column = pk_columns[0]
+        # 无单一主键时游标值可能重复，整页末尾相同游标值的数据留到下一页读取
+        trim_tail = tie_column is None and not (len(pk_columns) == 1 and pk_columns[0].name == column.name)
+        # 游标分页必须按游标字段排序，忽略筛选规则中的排序；游标字段为空的数据无法定位，不参与读取
+        query = query.filter(column.isnot(None)).order_by(None).order_by(column)
+        if tie_column is not None:
+            query = query.order_by(tie_column)
+        if self._extract_info.get('watermark_field'):
+            last_value = self._extract_info.get('watermark_start')
+        else:
+            last_value = self._extract_info.get('seek_start')
+        last_key = None
+        while True:
+            page_query = query
+            if last_value is not None and last_key is not None:
+                page_query = page_query.filter(
+                    or_(column > last_value, and_(column == last_value, tie_column > last_key)))
+            elif last_value is not None:
+                page_query = page_query.filter(column > last_value)
+            obj_list = page_query.limit(pagesize).all()
+            if not obj_list:
+                break
+            data_li = []
+            for obj in obj_list:
+                dic = {c.name: getattr(obj, c.name) for c in self.table.columns}
+                data_li.append(dic)
+            if trim_tail and len(obj_list) >= pagesize:
+                tail_value = data_li[-1][column.name]
+                head = [i for i in data_li if i[column.name] != tail_value]
+                if head:
+                    data_li = head
+                else:
+                    # 整页为同一游标值，单独读取该值全部数据
+                    data_li = [{c.name: getattr(obj, c.name) for c in self.table.columns}
+                               for obj in query.filter(column == tail_value).all()]
+            last_value = data_li[-1][column.name]
+            if tie_column is not None:
+                last_key = data_li[-1][tie_column.name]
+            res_data = {
+                'records': data_li,
+                'total': total
+            }
+            if self._extract_info.get('watermark_field'):
+                res_data['watermark'] = last_value
+            yield True, gen_json_response(res_data)
+            if len(obj_list) < pagesize:
+                break
+
+    def read_batch_stream(self, query):
+        '''
+        服务端游标流式读取，直接从DB-API游标按批返回，不构建orm对象
+        stream_format: records 字典列表(默认)，dataframe，arrow
+        :param query:
+        :return:
+        '''
+        total = self.get_total(query)
+        pagesize = self._extract_info.get('batch_size', 1000)
+        stream_format = self._extract_info.get('stream_format', 'records')
+        for records in stream_query(self.db_engine, query.statement, pagesize, stream_format):
+            res_data = {
+                'records': records,
+                'total': total
+            }
+            yield True, gen_json_response(res_data)
+
     def read_batch(self):
         '''
         生成器分批读取数据
@@ -399,6 +529,12 @@ df = reader.query(sql)
         flag, query = self.gen_extract_rules(self.db_model)
         if not flag:
             yield False, query
+        if self._extract_info.get('batch_mode') == 'seek' or self._extract_info.get('watermark_field'):
+            yield from self.read_batch_seek(query)
+            return
+        if self._extract_info.get('batch_mode') == 'stream':
+            yield from self.read_batch_stream(query)
+            return
         total = query.count()
         pagesize = self._extract_info.get('batch_size', 1000)
         total_pages = total // pagesize + 1
@@ -419,13 +555,118 @@ df = reader.query(sql)
             }
             yield True, gen_json_response(res_data)
 
+    def gen_upsert_stmt(self, fields, only_fields):
+        '''
+        生成数据库原生批量upsert语句，参数为以字段名为键的字典，不支持的数据库返回None，使用逐条查询更新
+        :param fields: 写入字段列表
+        :param only_fields: 唯一字段列表
+        :return:
+        '''
+        return None
+
+    def gen_merge_stmt(self, fields, only_fields, source_from='', end=''):
+        '''
+        生成MERGE语句，用于sqlserver、oracle批量upsert
+        :param source_from: 源数据子查询FROM子句，如oracle的 FROM dual
+        :param end: 语句结尾，sqlserver要求MERGE以分号结尾
+        :return:
+        '''
+        quote = self.db_engine.dialect.identifier_preparer.quote
+        table_name = quote(self.table_name)
+        update_fields = [k for k in fields if k not in only_fields]
+        source_sql = ', '.join([f":{k} AS {quote(k)}" for k in fields])
+        on_sql = ' AND '.join([f"t.{quote(k)} = s.{quote(k)}" for k in only_fields])
+        merge_sql = f"MERGE INTO {table_name} t USING (SELECT {source_sql}{source_from}) s ON ({on_sql})"
+        if update_fields:
+            set_sql = ', '.join([f"t.{quote(k)} = s.{quote(k)}" for k in update_fields])
+            merge_sql += f" WHEN MATCHED THEN UPDATE SET {set_sql}"
+        insert_fields = ', '.join([quote(k) for k in fields])
+        insert_values = ', '.join([f"s.{quote(k)}" for k in fields])
+        merge_sql += f" WHEN NOT MATCHED THEN INSERT ({insert_fields}) VALUES ({insert_values}){end}"
+        return text(merge_sql)
+
+    def group_records(self, records):
+        '''
+        按字段集合对记录分组，过滤非表字段，保证每组可以executemany批量执行
+        :param records:
+        :return:
+        '''
+        columns = self.table.columns
+        groups = {}
+        for c in records:
+            record = {k: v for k, v in c.items() if k in columns}
+            fields = tuple(sorted(record.keys()))
+            groups.setdefault(fields, []).append(record)
+        return groups
+
+    def bulk_update(self, records, only_fields):
+        '''
+        批量更新，每组记录一次executemany，整批一次提交
+        '''
+        with self.db_engine.begin() as conn:
+            for fields, group in self.group_records(records).items():
+                update_fields = [k for k in fields if k not in only_fields]
+                if not update_fields:
+                    continue
+                where = and_(*[self.table.columns[k] == bindparam(f'w_{k}') for k in only_fields])
+                stmt = self.table.update().where(where).values({k: bindparam(f'b_{k}') for k in update_fields})
+                params = [{**{f'w_{k}': c.get(k) for k in only_fields}, **{f'b_{k}': c[k] for k in update_fields}}
+                          for c in group]
+                conn.execute(stmt, params)
+
+    def bulk_upsert(self, records, only_fields):
+        '''
+        批量upsert，使用数据库原生语句，每组记录一次executemany，整批一次提交
+        :return: 数据库不支持原生upsert时返回False
+        '''
+        groups = self.group_records(records)
+        stmts = []
+        for fields, group in groups.items():
+            if not set(only_fields).issubset(fields):
+                raise RuntimeError(f'数据缺少唯一字段：{",".join(only_fields)}')
+            stmt = self.gen_upsert_stmt(list(fields), only_fields)
+            if stmt is None:
+                return False
+            stmts.append((stmt, group))
+        with self.db_engine.begin() as conn:
+            for stmt, group in stmts:
+                conn.execute(stmt, group)
+        return True
+
+    def upsert_by_query(self, records, only_fields):
+        '''
+        逐条查询更新，用于不支持原生upsert的数据库，返回需要插入的记录
+        '''
+        insert_records = []
+        try:
+            for c in records:
+                query_dict = {k: v for k, v in c.items() if k in only_fields}
+                query = self.session.query(self.db_model)
+                for k in query_dict:
+                    query = query.filter(getattr(self.db_model, k) == query_dict[k])
+                obj = query.first()
+                if obj is not None:
+                    for k in c:
+                        setattr(obj, k, c[k])
+                    self.session.add(obj)
+                elif self.load_type == 'upsert':
+                    insert_records.append(c)
+            self.session.commit()
+        except Exception:
+            # 回滚失败事务，避免session处于不可用状态影响后续批次
+            self.session.rollback()
+            raise
+        return insert_records
+
     def write(self, res_data):
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert', 'update', 'upsert']:
             return False, f'写入类型参数错误,不支持类型{self.load_type}'
-        self.only_fields = self._load_info.get('only_fields', [])
+        self.only_fields = parse_to_list(self._load_info.get('only_fields', []))
         if self.table is None:
             return False, '表不存在'
+        if self.load_type in ['update', 'upsert'] and not self.only_fields:
+            return False, '更新写入需配置唯一字段only_fields'
         columns = self.table.columns
         records = []
         if isinstance(res_data, list) and res_data != []:
@@ -439,20 +680,11 @@ df = reader.query(sql)
             insert_records = []
             if self.load_type == 'insert':
                 insert_records = records
-            elif self.load_type in ['update', 'upsert']:
-                for c in records:
-                    query_dict = {k: v for k, v in c.items() if k in self.only_fields}
-                    query = self.session.query(self.db_model)
-                    for k in query_dict:
-                        query = query.filter(getattr(self.db_model, k) == query_dict[k])
-                    obj = query.first()
-                    if obj is not None:
-                        for k in c:
-                            setattr(obj, k, c[k])
-                        self.session.add(obj)
-                        self.session.commit()
-                    elif self.load_type == 'upsert':
-                        insert_records.append(c)
+            elif self.load_type == 'update':
+                self.bulk_update(records, self.only_fields)
+            elif self.load_type == 'upsert':
+                if not self.bulk_upsert(records, self.only_fields):
+                    insert_records = self.upsert_by_query(records, self.only_fields)
             if insert_records != []:
                 # 创建 insert 对象
                 ins = self.table.insert()
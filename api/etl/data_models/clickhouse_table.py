@@ -1,6 +1,6 @@
 from etl.data_models.base_db_table import BaseDBTableModel
 from clickhouse_sqlalchemy import engines
-from sqlalchemy import Column, TEXT, String
+from sqlalchemy import Column, TEXT, String, text
 
 
 def gen_fixstring_column(i):
@@ -35,6 +35,7 @@ class CkTableModel(BaseDBTableModel):
         }
         model_conf = self._model.get('model_conf', {})
         engine = model_conf.get('engine', 'MergeTree')
+        self.table_engine = engine
         order_by = model_conf.get('order_by', ['id'])
         if engine and engine == 'ReplacingMergeTree':
             self.table_args = (
@@ -45,12 +46,36 @@ class CkTableModel(BaseDBTableModel):
                 engines.MergeTree(order_by=order_by),
             )
 
+    def get_approx_total(self):
+        '''
+        从system.tables获取表行数
+        '''
+        sql = "SELECT total_rows FROM system.tables WHERE database = currentDatabase() AND name = :name"
+        with self.db_engine.connect() as conn:
+            return conn.execute(text(sql), {'name': self.table_name}).scalar()
+
+    def get_table_engine(self):
+        '''
+        从system.tables获取表实际引擎
+        '''
+        sql = "SELECT engine FROM system.tables WHERE database = currentDatabase() AND name = :name"
+        with self.db_engine.connect() as conn:
+            return conn.execute(text(sql), {'name': self.table_name}).scalar()
+
     def write(self, res_data):
         self.load_type = self._load_info.get('load_type', '')
-        if self.load_type not in ['insert']:
+        if self.load_type not in ['insert', 'upsert']:
             return False, f'写入类型参数错误,不支持类型{self.load_type}'
         if self.table is None:
             return False, '表不存在'
+        if self.load_type == 'upsert':
+            # ReplacingMergeTree表按排序键合并去重，upsert直接追加写入新版本数据，以库中实际引擎为准
+            try:
+                table_engine = self.get_table_engine()
+            except Exception as e:
+                return False, f'{str(e)[:100]}'
+            if not table_engine or not table_engine.endswith('ReplacingMergeTree'):
+                return False, f'表引擎{table_engine}不支持upsert写入，需为ReplacingMergeTree'
         columns = self.table.columns
         records = []
         if isinstance(res_data, list) and res_data != []:
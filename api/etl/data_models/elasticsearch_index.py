@@ -1,11 +1,12 @@
 from etl.libs.es import EsClient
 from etl.data_models import DataModel
-from etl.utils.common_utils import trans_rule_value, parse_json
+from etl.utils.common_utils import trans_rule_value, parse_json, parse_to_list, iter_merge
 from etl.utils.es_utils import get_index_mapping
 from etl.utils.es_query_tool import EsQueryTool
 
 
 class EsIndexModel(DataModel):
+    support_watermark = True
 
     def __init__(self, model_info):
         super().__init__(model_info)
@@ -25,6 +26,17 @@ class EsIndexModel(DataModel):
             password = conn_conf.get('password')
             es_conf['http_auth'] = (username, password)
         self.es_client = EsClient(**es_conf)
+        # 并行切片数，大于1时使用sliced scroll并行读取
+        self.slices = int(self._extract_info.get('slices', 1) or 1)
+        self.scroll_time = self._extract_info.get('scroll_time', '5m')
+        # 读取字段，为空时读取全部字段
+        self.fields = parse_to_list(self._extract_info.get('fields', []))
+        # 增量水位字段，按该字段升序读取大于watermark_start的文档，需保证顺序故不使用切片
+        self.watermark_field = self._extract_info.get('watermark_field')
+        if self.watermark_field:
+            self.slices = 1
+            if self.fields != [] and self.watermark_field not in self.fields:
+                self.fields.append(self.watermark_field)
 
     def connect(self):
         '''
@@ -334,29 +346,61 @@ elasticsearch
         res_data = es_tools.query(es=self.es_client)
         return True, res_data
 
+    def gen_scroll_body(self, es_tools):
+        '''
+        生成scroll查询体，不做聚合，未指定排序时按_doc排序
+        '''
+        query_body = es_tools.query_body
+        scroll_body = {
+            'query': query_body['query'] if query_body['query'] != {} else {'match_all': {}},
+            'sort': query_body['sort'] if query_body['sort'] != {} else ['_doc'],
+            'size': self._extract_info.get('batch_size', 1000),
+            'track_total_hits': self.slices <= 1
+        }
+        if '_source' in query_body:
+            scroll_body['_source'] = query_body['_source']
+        elif self.fields != []:
+            scroll_body['_source'] = {'includes': self.fields}
+        return scroll_body
+
+    def gen_watermark_form(self, api_form):
+        '''
+        增量读取条件，水位字段大于watermark_start并按水位字段升序，忽略其他排序
+        '''
+        api_form = {k: v for k, v in api_form.items() if not (k == 'sort' or k.startswith('sort['))}
+        api_form[f'sort[{self.watermark_field}]'] = 'ASC'
+        watermark_start = self._extract_info.get('watermark_start')
+        if watermark_start is not None:
+            if hasattr(watermark_start, 'isoformat'):
+                watermark_start = watermark_start.isoformat()
+            api_form[f'gt[{self.watermark_field}]'] = watermark_start
+        return api_form
+
     def read_batch(self):
         '''
-        生成器分批读取数据
+        生成器分批读取数据，slices大于1时各切片并行scroll读取，按读取先后合并产出
         :return:
         '''
         api_form = self.gen_extract_rules()
         api_form['index_name'] = self.index_name
-        # scroll 获取数据
+        if self.watermark_field:
+            api_form = self.gen_watermark_form(api_form)
         es_tools = EsQueryTool(api_form)
-        query_body = es_tools.query_body
-        if query_body['query'] == {}:
-            query_body['query'] = {'match_all': {}}
-        query_body['size'] = self._extract_info.get('batch_size', 1000)
-        result = self.es_client.scroll_search(self.index_name, query_body)
-        sid = result['_scroll_id']
-        scroll_size = result['hits']['total']['value']
-        while scroll_size > 0:
+        scroll_body = self.gen_scroll_body(es_tools)
+        if self.slices > 1:
+            total = self.es_client.count(self.index_name, scroll_body['query'])
+            pages = iter_merge([
+                self.es_client.iter_scroll(self.index_name, scroll_body, self.scroll_time, i, self.slices)
+                for i in range(self.slices)
+            ], queue_size=self.slices * 2)
+        else:
+            total = None
+            pages = self.es_client.iter_scroll(self.index_name, scroll_body, self.scroll_time)
+        for result in pages:
             res_data = es_tools.gen_result(result)
+            if total is not None:
+                res_data['data']['total'] = total
             yield True, res_data
-            result = self.es_client.scroll(sid)
-            sid = result['_scroll_id']
-            if res_data['data']['records'] == []:
-                break
 
     def write(self, res_data):
         self.load_type = self._load_info.get('load_type', '')
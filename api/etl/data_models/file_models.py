@@ -1,6 +1,8 @@
 import os.path
 from etl.data_models import DataModel
-from etl.utils.common_utils import trans_rule_value, read_file, md5, gen_json_response, parse_json, request_url
+from etl.utils.common_utils import read_file, md5, gen_json_response, parse_json, request_url, parse_to_list
+from etl.utils.file_utils import iter_csv_chunks, iter_excel_chunks, filter_df_by_rules, rebatch_df_chunks, \
+    read_df_chunks_page
 import pandas as pd
 import io
 
@@ -55,6 +57,10 @@ df = reader.df
             file_type = 'json'
         elif self.file_path.endswith('.h5'):
             file_type = 'h5'
+        elif self.file_path.endswith('.parquet'):
+            file_type = 'parquet'
+        elif self.file_path.endswith(('.arrow', '.feather')):
+            file_type = 'arrow'
         else:
             file_type = ''
         if file_type != '':
@@ -73,6 +79,9 @@ class TableFileModel(BaseFileModel):
 
     def __init__(self, model_info):
         super().__init__(model_info)
+        # stream模式分块读取文件，内存占用与文件大小无关
+        self.batch_mode = self._extract_info.get('batch_mode', '')
+        self.chunk_size = self._extract_info.get('chunk_size', max(self.batch_size, 10000))
 
     def connect(self):
         '''
@@ -159,6 +168,18 @@ class TableFileModel(BaseFileModel):
             print(e)
         return df
 
+    def get_df_chunks(self, file_obj, chunksize=10000):
+        '''
+        分块获取pandas df
+        '''
+        if self.file_path.endswith('.csv'):
+            chunks = iter_csv_chunks(file_obj, chunksize)
+        else:
+            chunks = iter_excel_chunks(file_obj, chunksize, self.file_path)
+        for df in chunks:
+            df.fillna("", inplace=True)
+            yield df
+
     def get_search_type_list(self):
         '''
         获取可用高级查询类型
@@ -192,10 +213,9 @@ class TableFileModel(BaseFileModel):
         ]
         return rules
 
-    def gen_extract_rules(self):
+    def get_file_obj(self):
         '''
-        解析筛选规则
-        :return:
+        根据缓存规则获取文件对象
         '''
         cache_rules = [i for i in self.extract_rules if i.get('rule') == 'use_cache']
         cache_size = 0
@@ -205,36 +225,45 @@ class TableFileModel(BaseFileModel):
             except Exception as e:
                 print(e)
         if cache_size > 0:
-            self.file_obj = self.read_file_path(self.file_path, use_cache=True, cache_size=cache_size)
-        else:
-            self.file_obj = self.read_file_path(self.file_path, use_cache=False)
+            return self.read_file_path(self.file_path, use_cache=True, cache_size=cache_size)
+        return self.read_file_path(self.file_path, use_cache=False)
+
+    def gen_extract_rules(self):
+        '''
+        解析筛选规则
+        :return:
+        '''
+        self.file_obj = self.get_file_obj()
         self.df = self.get_df(self.file_obj)
         if self.df is None:
             return False, '文件读取错误'
-        for i in self.extract_rules:
-            print(i)
-            field = i.get('field')
-            rule = i.get('rule')
-            value = i.get('value')
-            value = trans_rule_value(value)
-            if field and value:
-                if rule in ['equal', 'eq']:
-                    self.df = self.df[self.df[field] == value]
-                elif rule in ['f_equal', 'neq']:
-                    self.df = self.df[self.df[field] != value]
-                elif rule == 'gt':
-                    self.df = self.df[self.df[field] > value]
-                elif rule == 'gte':
-                    self.df = self.df[self.df[field] >= value]
-                elif rule == 'lt':
-                    self.df = self.df[self.df[field] < value]
-                elif rule == 'lte':
-                    self.df = self.df[self.df[field] <= value]
-        data_li = []
-        for k, row in self.df.iterrows():
-            data_li.append(row.to_dict())
+        self.df = filter_df_by_rules(self.df, self.extract_rules)
+        data_li = self.df.to_dict(orient='records')
         return True, data_li
 
+    def iter_extract_chunks(self):
+        '''
+        分块读取文件并按筛选规则过滤
+        '''
+        self.file_obj = self.get_file_obj()
+        for df in self.get_df_chunks(self.file_obj, self.chunk_size):
+            yield filter_df_by_rules(df, self.extract_rules)
+
+    def read_page_stream(self, page=1, pagesize=20):
+        '''
+        分块读取指定页数据，读够数据后停止读取，未读完时总数为已读取行数
+        '''
+        try:
+            df, total, finished = read_df_chunks_page(self.iter_extract_chunks(), page, pagesize)
+        except Exception as e:
+            return False, f'文件读取错误：{e}'
+        res_data = {
+            'records': df.to_dict(orient='records'),
+            'total': total,
+            'finished': finished
+        }
+        return True, gen_json_response(data=res_data)
+
     def read_page(self, page=1, pagesize=20):
         '''
         分页读取数据
@@ -242,6 +271,8 @@ class TableFileModel(BaseFileModel):
         :param pagesize:
         :return:
         '''
+        if self.batch_mode == 'stream':
+            return self.read_page_stream(page, pagesize)
         flag, res_data = self.gen_extract_rules()
         if not flag:
             return False, res_data
@@ -260,6 +291,18 @@ class TableFileModel(BaseFileModel):
         :param res_type: 返回形式
         :return:
         '''
+        pagesize = self._extract_info.get('batch_size', 1000)
+        if self.batch_mode == 'stream':
+            try:
+                for df in rebatch_df_chunks(self.iter_extract_chunks(), pagesize):
+                    result = {
+                        'records': df.to_dict(orient='records'),
+                        'total': None
+                    }
+                    yield True, gen_json_response(result)
+            except Exception as e:
+                yield False, f'文件读取错误：{e}'
+            return
         flag, res_data = self.gen_extract_rules()
         if not flag:
             yield False, res_data
@@ -298,6 +341,15 @@ class JsonFileModel(TableFileModel):
             print(e)
         return df
 
+    def get_df_chunks(self, file_obj, chunksize=10000):
+        '''
+        json文件不支持分块读取，整体读取后返回
+        '''
+        df = self.get_df(file_obj)
+        if df is None:
+            raise ValueError('文件读取错误')
+        yield df
+
 
 class H5FileModel(TableFileModel):
 
@@ -340,3 +392,94 @@ class H5FileModel(TableFileModel):
             print(e)
         return df
 
+    def get_df_chunks(self, file_obj, chunksize=10000):
+        '''
+        h5文件整体读取后返回
+        '''
+        df = self.get_df(file_obj)
+        if df is None:
+            raise ValueError('文件读取错误')
+        yield df
+
+
+class ParquetFileModel(TableFileModel):
+    '''
+    parquet文件模型，按需读取字段，筛选条件下推到行组过滤，默认流式分批读取
+    '''
+    file_format = 'parquet'
+
+    def __init__(self, model_info):
+        super().__init__(model_info)
+        self.batch_mode = self._extract_info.get('batch_mode', 'stream')
+        # 读取字段，为空时读取全部字段
+        self.fields = parse_to_list(self._extract_info.get('fields', []))
+
+    def get_dataset(self):
+        '''
+        获取pyarrow数据集，网络文件缓存到本地读取，本地路径可为hive分区目录
+        '''
+        from etl.utils.arrow_utils import open_dataset
+        file_path = self.file_path
+        if file_path.startswith('http'):
+            if not os.path.exists('tmp'):
+                os.mkdir('tmp')
+            file_path = os.path.join('tmp', md5(self.file_path))
+            if not os.path.exists(file_path):
+                res = request_url(self.file_path)
+                f = open(file_path, 'wb')
+                f.write(res.content)
+                f.close()
+        return open_dataset(file_path, self.file_format)
+
+    def get_df(self, file_obj=None, nrows=None):
+        '''
+        获取pandas df
+        '''
+        from etl.utils.arrow_utils import read_dataset_df
+        df = None
+        try:
+            df = read_dataset_df(self.get_dataset(), self.extract_rules, self.fields, nrows)
+        except Exception as e:
+            print(e)
+        return df
+
+    def get_res_fields(self):
+        '''
+        获取字段列表，从文件schema读取，无需读取数据
+        '''
+        res_fields = []
+        try:
+            for column in self.get_dataset().schema.names:
+                dic = {
+                    'field_name': column,
+                    'field_value': column,
+                }
+                res_fields.append(dic)
+        except Exception as e:
+            print(e)
+        return res_fields
+
+    def gen_extract_rules(self):
+        '''
+        解析筛选规则，筛选在读取时完成
+        :return:
+        '''
+        self.df = self.get_df()
+        if self.df is None:
+            return False, '文件读取错误'
+        data_li = self.df.to_dict(orient='records')
+        return True, data_li
+
+    def iter_extract_chunks(self):
+        '''
+        按批读取数据集，筛选条件下推
+        '''
+        from etl.utils.arrow_utils import iter_dataset_dfs
+        yield from iter_dataset_dfs(self.get_dataset(), self.extract_rules, self.fields, self.chunk_size)
+
+
+class ArrowFileModel(ParquetFileModel):
+    '''
+    arrow ipc(feather v2)文件模型
+    '''
+    file_format = 'arrow'
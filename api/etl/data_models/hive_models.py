@@ -38,9 +38,8 @@ class HiveTableModel(BaseDBTableModel):
                     _table.append_column(column)
                 # 执行建表操作
                 metadata.create_all(self.db_engine)
-            self.db_engine.dispose()
             # 重新获取模型
-            self.get_table_model()
+            self.refresh_table_model()
             return True, '创建成功'
         except Exception as e:
             return False, str(e)
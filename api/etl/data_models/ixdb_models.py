@@ -1,15 +1,23 @@
 '''
 influxdb
 '''
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from etl.data_models import DataModel
 from etl.libs.ixdb import IxClient
-from etl.utils.common_utils import trans_rule_value, gen_json_response
+from etl.utils.common_utils import trans_rule_value, gen_json_response, trans_time_length, date_to_timestamp
+
+# 时间精度对应的秒数
+EPOCH_SECONDS = {'h': 3600, 'm': 60, 's': 1, 'ms': 1e-3, 'u': 1e-6, 'ns': 1e-9}
 
 
 class InfluxDBTableModel(DataModel):
     '''
     InfluxDB 表
     '''
+    support_watermark = True
+
     def __init__(self, model_info):
         super().__init__(model_info)
         conn_conf = self._source['conn_conf']
@@ -151,13 +159,15 @@ influxdb
         ]
         return rules
 
-    def gen_extract_rules(self):
+    def gen_extract_rules(self, extra_conditions=None, order=None):
         '''
         解析筛选规则
+        :param extra_conditions: 额外条件列表
+        :param order: 按时间排序方向 asc/desc，设置时忽略筛选规则中的排序
         :return:
         '''
         filter_sql = ""
-        condition_list = []
+        condition_list = list(extra_conditions or [])
         sort_str = ''
         for i in self.extract_rules:
             field = i.get('field')
@@ -196,10 +206,28 @@ influxdb
             else:
                 filter_sql += f" and {i}"
             n += 1
+        if order:
+            sort_str = f'ORDER BY time {order}'
         if sort_str != '':
             filter_sql += f" {sort_str}"
         return True, filter_sql
 
+    def get_total(self, filter_sql):
+        '''
+        获取筛选条件下的数据总数
+        :param filter_sql:
+        :return:
+        '''
+        count_sql = f"select count(*) from {self.table_name} {filter_sql}"
+        print(count_sql)
+        total_df = self.ix_client.query_as_df(count_sql)
+        total = 0
+        for k, row in total_df.iterrows():
+            row = row.to_dict()
+            for k in row:
+                total = int(row[k])
+        return total
+
     def read_page(self, page=1, pagesize=20):
         '''
         分页读取数据
@@ -214,15 +242,7 @@ influxdb
                 'msg': filter_sql
             }
             return False, res_data
-        count_sql = f"select count(*) from {self.table_name} {filter_sql}"
-        print(count_sql)
-        total_df = self.ix_client.query_as_df(count_sql)
-        print(total_df)
-        total = 0
-        for k, row in total_df.iterrows():
-            row = row.to_dict()
-            for k in row:
-                total = int(row[k])
+        total = self.get_total(filter_sql)
         query_sql = f"select * from {self.table_name} {filter_sql} limit {pagesize} offset {(page - 1) * pagesize}"
         print(query_sql)
         df = self.ix_client.query_as_df(query_sql)
@@ -237,11 +257,191 @@ influxdb
         }
         return True, gen_json_response(res_data)
 
+    def read_batch_watermark(self):
+        '''
+        按时间水位增量读取，time升序游标分页，从watermark_start之后开始
+        整页数据末尾时间戳相同的点(多序列同一时刻)留到下一页读取，避免跨页遗漏
+        epoch: 返回时间精度，默认s
+        :return:
+        '''
+        if self._extract_info.get('watermark_field') != 'time':
+            yield False, 'influxdb仅支持按time字段增量读取'
+            return
+        epoch = self._extract_info.get('epoch', 's')
+        pagesize = self._extract_info.get('batch_size', 1000)
+        last_value = self._extract_info.get('watermark_start')
+        total = None
+        while True:
+            conditions = [] if last_value is None else [f"time > {int(last_value)}{epoch}"]
+            if total is None:
+                total = self.get_total(self.gen_extract_rules(conditions)[1])
+            flag, filter_sql = self.gen_extract_rules(conditions, order='asc')
+            query_sql = f"select * from {self.table_name} {filter_sql} limit {pagesize}"
+            print(query_sql)
+            df = self.ix_client.query_as_df(query_sql, epoch=epoch)
+            if df.empty:
+                break
+            records = df.to_dict('records')
+            is_last = len(records) < pagesize
+            if not is_last:
+                tail_time = records[-1]['time']
+                head = [i for i in records if i['time'] != tail_time]
+                if head:
+                    records = head
+                else:
+                    # 整页为同一时刻，单独读取该时刻全部数据
+                    flag, filter_sql = self.gen_extract_rules([f"time = {int(tail_time)}{epoch}"])
+                    query_sql = f"select * from {self.table_name} {filter_sql}"
+                    records = self.ix_client.query_as_df(query_sql, epoch=epoch).to_dict('records')
+            last_value = records[-1]['time']
+            res_data = {
+                'records': records,
+                'total': total,
+                'watermark': last_value
+            }
+            yield True, gen_json_response(res_data)
+            if is_last:
+                break
+
+    def parse_window_time(self, value):
+        '''
+        时间窗口起止时间转为秒级时间戳，支持秒/毫秒/纳秒时间戳、日期字符串及timestamp:-1d等动态值
+        '''
+        value = trans_rule_value(value)
+        if value is None or value == '':
+            return None
+        if isinstance(value, datetime.datetime):
+            return int(value.timestamp())
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if isinstance(value, (int, float)):
+            # 纳秒、毫秒转为秒
+            if value > 1000000000 * 1000 * 1000:
+                value = value / 1000 / 1000 / 1000
+            elif value > 1000000000 * 1000:
+                value = value / 1000
+            return int(value)
+        return date_to_timestamp(value)
+
+    def get_time_bound(self, order='asc', conditions=None):
+        '''
+        获取筛选条件下最早(asc)或最晚(desc)数据时间，秒级时间戳
+        :param conditions: 额外条件，如增量读取的水位条件
+        '''
+        flag, filter_sql = self.gen_extract_rules(conditions, order=order)
+        df = self.ix_client.query_as_df(f"select * from {self.table_name} {filter_sql} limit 1", epoch='s')
+        if df.empty:
+            return None
+        return int(df['time'].iloc[0])
+
+    def gen_time_windows(self, conditions=None, min_start=None):
+        '''
+        按window切分[start_time, end_time)时间范围，未配置起止时间时取筛选条件下最早、最晚数据时间
+        :param conditions: 额外条件，如增量读取的水位条件
+        :param min_start: 最小开始时间，秒级时间戳，增量读取时从水位所在秒开始
+        :return: [(窗口开始, 窗口结束)] 秒级时间戳
+        '''
+        window = trans_time_length(str(self._extract_info.get('window', '1h')))
+        start = self.parse_window_time(self._extract_info.get('start_time'))
+        end = self.parse_window_time(self._extract_info.get('end_time'))
+        if start is None:
+            start = self.get_time_bound('asc', conditions)
+        elif min_start is not None:
+            start = max(start, min_start)
+        if end is None:
+            end = self.get_time_bound('desc', conditions)
+            end = end + 1 if end is not None else None
+        if start is None or end is None:
+            return []
+        return [(i, min(i + window, end)) for i in range(start, end, window)]
+
+    def read_window(self, start, end, epoch, conditions=None):
+        '''
+        读取一个时间窗口内的全部数据，按时间升序
+        '''
+        conditions = list(conditions or []) + [f"time >= {start}s", f"time < {end}s"]
+        flag, filter_sql = self.gen_extract_rules(conditions, order='asc')
+        query_sql = f"select * from {self.table_name} {filter_sql}"
+        print(query_sql)
+        return self.ix_client.query_as_df(query_sql, epoch=epoch)
+
+    def iter_windows(self, windows, epoch, conditions=None):
+        '''
+        按顺序产出各时间窗口数据，window_workers大于1时多线程预读后续窗口，预读数量有上限以控制内存
+        '''
+        workers = max(int(self._extract_info.get('window_workers', 1) or 1), 1)
+        if workers == 1:
+            for start, end in windows:
+                yield self.read_window(start, end, epoch, conditions)
+            return
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = deque()
+        windows = iter(windows)
+        try:
+            for start, end in windows:
+                futures.append(executor.submit(self.read_window, start, end, epoch, conditions))
+                if len(futures) >= workers * 2:
+                    break
+            while futures:
+                df = futures.popleft().result()
+                window = next(windows, None)
+                if window is not None:
+                    futures.append(executor.submit(self.read_window, window[0], window[1], epoch, conditions))
+                yield df
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def read_batch_window(self):
+        '''
+        按时间窗口分区读取，每个窗口一次查询，不做count及OFFSET分页
+        window: 窗口长度，如1h、1d，默认1h
+        start_time/end_time: 读取时间范围，默认表中最早到最晚数据时间
+        window_workers: 并行读取窗口数，默认1，产出顺序保持按时间升序
+        stream_format: records 字典列表(默认)，dataframe 直接返回DataFrame
+        窗口内数据按batch_size切分产出；配置watermark_field为time时只读取水位之后的数据，水位在窗口最后一批时返回
+        :return:
+        '''
+        epoch = self._extract_info.get('epoch', 's')
+        pagesize = self._extract_info.get('batch_size', 1000)
+        stream_format = self._extract_info.get('stream_format', 'records')
+        total_type = self._extract_info.get('total_type', 'none')
+        conditions = []
+        watermark_field = self._extract_info.get('watermark_field')
+        if watermark_field and watermark_field != 'time':
+            yield False, 'influxdb仅支持按time字段增量读取'
+            return
+        watermark_start = self._extract_info.get('watermark_start')
+        min_start = None
+        if watermark_field and watermark_start is not None:
+            conditions.append(f"time > {int(watermark_start)}{epoch}")
+            min_start = int(int(watermark_start) * EPOCH_SECONDS.get(epoch, 1))
+        try:
+            windows = self.gen_time_windows(conditions, min_start)
+            total = self.get_total(self.gen_extract_rules(conditions)[1]) if total_type == 'exact' else None
+            for df in self.iter_windows(windows, epoch, conditions):
+                for i in range(0, len(df), pagesize):
+                    chunk = df.iloc[i:i + pagesize]
+                    res_data = {
+                        'records': chunk if stream_format == 'dataframe' else chunk.to_dict('records'),
+                        'total': total
+                    }
+                    if watermark_field and i + pagesize >= len(df):
+                        res_data['watermark'] = int(chunk['time'].iloc[-1])
+                    yield True, gen_json_response(res_data)
+        except Exception as e:
+            yield False, str(e)[:200]
+
     def read_batch(self):
         '''
         生成器分批读取数据
         :return:
         '''
+        if self._extract_info.get('batch_mode') == 'window':
+            yield from self.read_batch_window()
+            return
+        if self._extract_info.get('watermark_field'):
+            yield from self.read_batch_watermark()
+            return
         flag, filter_sql = self.gen_extract_rules()
         if not flag:
             res_data = {
@@ -249,15 +449,7 @@ influxdb
                 'msg': filter_sql
             }
             return False, res_data
-        count_sql = f"select count(*) from {self.table_name} {filter_sql}"
-        print(count_sql)
-        total_df = self.ix_client.query_as_df(count_sql)
-        print(total_df)
-        total = 0
-        for k, row in total_df.iterrows():
-            row = row.to_dict()
-            for k in row:
-                total = int(row[k])
+        total = self.get_total(filter_sql)
         pagesize = self._extract_info.get('batch_size', 1000)
         total_pages = total // pagesize + 1
         n = 0
@@ -267,17 +459,19 @@ influxdb
             query_sql = f"select * from {self.table_name} {filter_sql} limit {pagesize} offset {(page - 1) * pagesize}"
             print(query_sql)
             df = self.ix_client.query_as_df(query_sql)
-            results = []
-            for k, row in df.iterrows():
-                dic = row.to_dict()
-                results.append(dic)
             res_data = {
-                'records': results,
+                'records': df.to_dict('records'),
                 'total': total
             }
             yield True, gen_json_response(res_data)
 
     def write(self, res_data):
+        '''
+        按write_batch_size分块写入，失败时重试
+        write_batch_size: 每次请求写入点数，默认5000
+        retry: 每块最大重试次数，默认3
+        time_precision: 时间戳精度，如s、ms，写入整数时间戳时需配置
+        '''
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert']:
             return False, f'写入类型参数错误,不支持类型{self.load_type}'
@@ -289,10 +483,17 @@ influxdb
                 records = res_data['records']
             else:
                 records = [res_data]
+        if records == []:
+            return True, res_data
+        write_kwargs = {
+            'batch_size': int(self._load_info.get('write_batch_size', 5000)),
+            'retry': int(self._load_info.get('retry', 3))
+        }
+        if self._load_info.get('time_precision'):
+            write_kwargs['time_precision'] = self._load_info['time_precision']
         try:
             if self.load_type == 'insert':
-                insert_records = records
-                self.ix_client.write_points(insert_records)
+                self.ix_client.write_points(records, **write_kwargs)
         except Exception as e:
             return False, f'{str(e)[:100]}'
         return True, res_data
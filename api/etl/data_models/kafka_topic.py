@@ -1,4 +1,5 @@
 import json
+import time
 import datetime
 from etl.data_models import DataModel
 from kafka import KafkaConsumer, KafkaProducer
@@ -41,6 +42,8 @@ class KafkaTopicModel(DataModel):
             conn_setting[k] = ext_params[k]
         self.err_info = ''
         self.read_type = 'latest'  # 默认从最新开始读
+        # 微批参数，每批最多batch_size条或等待max_wait_ms毫秒
+        self.max_wait_ms = self._extract_info.get('max_wait_ms', 1000)
         self.gen_extract_rules()  # 判断是从头读还是从现在开始读
         conn_setting['auto_offset_reset'] = self.read_type
         if self._extract_info and self.topic:
@@ -167,23 +170,43 @@ class KafkaTopicModel(DataModel):
         生成器分批读取数据
         :return:
         '''
-        for msg in self.consumer:
-            try:
-                data = msg.value
-                if isinstance(data, bytes):
-                    data = data.decode()
-                if isinstance(data, str):
-                    try:
-                        data = json.loads(data)
-                    except Exception as e:
-                        print(e)
+        if self.err_info:
+            yield False, self.err_info
+            return
+        while True:
+            records = []
+            deadline = time.time() + self.max_wait_ms / 1000
+            while len(records) < self.batch_size:
+                timeout_ms = int((deadline - time.time()) * 1000)
+                if timeout_ms <= 0:
+                    break
+                msg_pack = self.consumer.poll(timeout_ms=timeout_ms, max_records=self.batch_size - len(records))
+                for msgs in msg_pack.values():
+                    for msg in msgs:
+                        try:
+                            records.append(self.parse_message(msg))
+                        except Exception as e:
+                            print(e)
+            if records:
                 res_data = {
-                    'records': [data],
-                    'total': 1
+                    'records': records,
+                    'total': len(records)
                 }
                 yield True, gen_json_response(res_data)
+
+    def parse_message(self, msg):
+        '''
+        解析消息内容，json字符串转为对象
+        '''
+        data = msg.value
+        if isinstance(data, bytes):
+            data = data.decode()
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
             except Exception as e:
                 print(e)
+        return data
 
     def write(self, res_data):
         '''
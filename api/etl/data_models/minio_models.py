@@ -1,7 +1,9 @@
 import json
 
 from etl.data_models import DataModel
-from etl.utils.common_utils import trans_rule_value, gen_json_response, parse_json, md5
+from etl.utils.common_utils import gen_json_response, parse_json, md5, parse_to_list
+from etl.utils.file_utils import iter_csv_chunks, iter_excel_chunks, filter_df_by_rules, rebatch_df_chunks, \
+    read_df_chunks_page
 import pandas as pd
 from minio import Minio
 import os
@@ -13,6 +15,7 @@ class BaseMinioModel(DataModel):
     def __init__(self, model_info):
         super().__init__(model_info)
         conn_conf = self._source.get('conn_conf', {})
+        self.conn_conf = conn_conf
         url = conn_conf.get('url')
         access_key = conn_conf.get('username')
         secret_key = conn_conf.get('password')
@@ -61,6 +64,9 @@ class TableMinioModel(BaseMinioModel):
         super().__init__(model_info)
         model_conf = self._model['model_conf']
         self.file_name = model_conf.get('name')
+        # stream模式分块读取对象，内存占用与文件大小无关
+        self.batch_mode = self._extract_info.get('batch_mode', '')
+        self.chunk_size = self._extract_info.get('chunk_size', max(self.batch_size, 10000))
 
     def connect(self):
         '''
@@ -107,6 +113,46 @@ class TableMinioModel(BaseMinioModel):
             print(e)
         return df
 
+    def get_cache_file_path(self):
+        '''
+        下载对象到本地缓存文件，用于需要随机读取的文件格式
+        缓存按对象etag及修改时间区分版本，对象变化后重新下载并清理旧版本缓存
+        '''
+        if not os.path.exists('tmp'):
+            os.mkdir('tmp')
+        stat = self._client.stat_object(self.bucket, self.file_name)
+        prefix = md5(self.bucket + self.file_name)
+        cache_file_name = f"{prefix}_{md5(f'{stat.etag}_{stat.last_modified}')}"
+        cache_file_path = os.path.join('tmp', cache_file_name)
+        if not os.path.exists(cache_file_path):
+            self._client.fget_object(self.bucket, self.file_name, cache_file_path)
+            for file_name in os.listdir('tmp'):
+                # 跳过其他进程下载中的临时文件(带后缀)
+                if file_name.startswith(f"{prefix}_") and file_name != cache_file_name and '.' not in file_name:
+                    try:
+                        os.remove(os.path.join('tmp', file_name))
+                    except Exception as e:
+                        print(e)
+        return cache_file_path
+
+    def get_df_chunks(self, chunksize=10000):
+        '''
+        分块获取pandas df，csv直接流式读取对象，excel下载到本地后只读模式读取
+        '''
+        if self.file_name.endswith('.csv'):
+            file_obj = self._client.get_object(self.bucket, self.file_name)
+            try:
+                for df in iter_csv_chunks(file_obj, chunksize):
+                    df.fillna("", inplace=True)
+                    yield df
+            finally:
+                file_obj.close()
+                file_obj.release_conn()
+        else:
+            for df in iter_excel_chunks(self.get_cache_file_path(), chunksize, self.file_name):
+                df.fillna("", inplace=True)
+                yield df
+
     def get_search_type_list(self):
         '''
         获取可用高级查询类型
@@ -148,30 +194,32 @@ class TableMinioModel(BaseMinioModel):
         self.df = self.get_df()
         if self.df is None:
             return False, '文件读取错误'
-        for i in self.extract_rules:
-            print(i)
-            field = i.get('field')
-            rule = i.get('rule')
-            value = i.get('value')
-            value = trans_rule_value(value)
-            if field and value:
-                if rule in ['equal', 'eq']:
-                    self.df = self.df[self.df[field] == value]
-                elif rule in ['f_equal', 'neq']:
-                    self.df = self.df[self.df[field] != value]
-                elif rule == 'gt':
-                    self.df = self.df[self.df[field] > value]
-                elif rule == 'gte':
-                    self.df = self.df[self.df[field] >= value]
-                elif rule == 'lt':
-                    self.df = self.df[self.df[field] < value]
-                elif rule == 'lte':
-                    self.df = self.df[self.df[field] <= value]
-        data_li = []
-        for k, row in self.df.iterrows():
-            data_li.append(row.to_dict())
+        self.df = filter_df_by_rules(self.df, self.extract_rules)
+        data_li = self.df.to_dict(orient='records')
         return True, data_li
 
+    def iter_extract_chunks(self):
+        '''
+        分块读取对象并按筛选规则过滤
+        '''
+        for df in self.get_df_chunks(self.chunk_size):
+            yield filter_df_by_rules(df, self.extract_rules)
+
+    def read_page_stream(self, page=1, pagesize=20):
+        '''
+        分块读取指定页数据，读够数据后停止读取，未读完时总数为已读取行数
+        '''
+        try:
+            df, total, finished = read_df_chunks_page(self.iter_extract_chunks(), page, pagesize)
+        except Exception as e:
+            return False, f'文件读取错误：{e}'
+        res_data = {
+            'records': df.to_dict(orient='records'),
+            'total': total,
+            'finished': finished
+        }
+        return True, gen_json_response(data=res_data)
+
     def read_page(self, page=1, pagesize=20):
         '''
         分页读取数据
@@ -179,6 +227,8 @@ class TableMinioModel(BaseMinioModel):
         :param pagesize:
         :return:
         '''
+        if self.batch_mode == 'stream':
+            return self.read_page_stream(page, pagesize)
         flag, res_data = self.gen_extract_rules()
         if not flag:
             return False, res_data
@@ -197,9 +247,22 @@ class TableMinioModel(BaseMinioModel):
         :param res_type: 返回形式
         :return:
         '''
+        pagesize = self._extract_info.get('batch_size', 1000)
+        if self.batch_mode == 'stream':
+            try:
+                for df in rebatch_df_chunks(self.iter_extract_chunks(), pagesize):
+                    result = {
+                        'records': df.to_dict(orient='records'),
+                        'total': None
+                    }
+                    yield True, gen_json_response(result)
+            except Exception as e:
+                yield False, f'文件读取错误：{e}'
+            return
         flag, res_data = self.gen_extract_rules()
         if not flag:
-            return False, res_data
+            yield False, res_data
+            return
         total = len(res_data)
         pagesize = self._extract_info.get('batch_size', 1000)
         total_pages = total // pagesize + 1
@@ -261,6 +324,15 @@ class JsonMinioModel(TableMinioModel):
             print(e)
         return df
 
+    def get_df_chunks(self, chunksize=10000):
+        '''
+        json文件不支持分块读取，整体读取后返回
+        '''
+        df = self.get_df()
+        if df is None:
+            raise ValueError('文件读取错误')
+        yield df
+
     def write(self, res_data):
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert']:
@@ -307,6 +379,15 @@ class H5MinioModel(TableMinioModel):
             print(e)
         return df
 
+    def get_df_chunks(self, chunksize=10000):
+        '''
+        h5文件整体读取后返回
+        '''
+        df = self.get_df()
+        if df is None:
+            raise ValueError('文件读取错误')
+        yield df
+
     def write(self, res_data):
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert']:
@@ -330,3 +411,101 @@ class H5MinioModel(TableMinioModel):
         return True, res_data
 
 
+class ParquetMinioModel(TableMinioModel):
+    '''
+    parquet对象模型，直接按范围读取对象，按需读取字段，筛选条件下推到行组过滤，默认流式分批读取；
+    对象名可为单个文件或数据集目录，写入时对象名作为目录，每批追加分片文件，可按partition_cols分区
+    '''
+    file_format = 'parquet'
+
+    def __init__(self, model_info):
+        super().__init__(model_info)
+        model_conf = self._model['model_conf']
+        self.batch_mode = self._extract_info.get('batch_mode', 'stream')
+        # 读取字段，为空时读取全部字段
+        self.fields = parse_to_list(self._extract_info.get('fields', []))
+        self.partition_cols = parse_to_list(model_conf.get('partition_cols', []))
+        self.write_schema = None
+
+    def get_dataset(self):
+        '''
+        获取pyarrow数据集
+        '''
+        from etl.utils.arrow_utils import open_dataset, get_minio_filesystem
+        return open_dataset(f"{self.bucket}/{self.file_name}", self.file_format,
+                            get_minio_filesystem(self.conn_conf))
+
+    def get_df(self, nrows=None):
+        '''
+        获取pandas df
+        '''
+        from etl.utils.arrow_utils import read_dataset_df
+        df = None
+        try:
+            df = read_dataset_df(self.get_dataset(), self.extract_rules, self.fields, nrows)
+        except Exception as e:
+            print(e)
+        return df
+
+    def get_res_fields(self):
+        '''
+        获取字段列表，从对象schema读取，无需读取数据
+        '''
+        res_fields = []
+        try:
+            for column in self.get_dataset().schema.names:
+                dic = {
+                    'field_name': column,
+                    'field_value': column,
+                }
+                res_fields.append(dic)
+        except Exception as e:
+            print(e)
+        return res_fields
+
+    def gen_extract_rules(self):
+        '''
+        解析筛选规则，筛选在读取时完成
+        :return:
+        '''
+        self.df = self.get_df()
+        if self.df is None:
+            return False, '文件读取错误'
+        data_li = self.df.to_dict(orient='records')
+        return True, data_li
+
+    def iter_extract_chunks(self):
+        '''
+        按批读取数据集，筛选条件下推
+        '''
+        from etl.utils.arrow_utils import iter_dataset_dfs
+        yield from iter_dataset_dfs(self.get_dataset(), self.extract_rules, self.fields, self.chunk_size)
+
+    def write(self, res_data):
+        self.load_type = self._load_info.get('load_type', '')
+        if self.load_type not in ['insert']:
+            return False, f'写入类型参数错误,不支持类型{self.load_type}'
+        records = []
+        if isinstance(res_data, list) and res_data != []:
+            records = res_data
+        if isinstance(res_data, dict):
+            if 'records' in res_data and res_data['records'] != []:
+                records = res_data['records']
+            else:
+                records = [res_data]
+        try:
+            from etl.utils.arrow_utils import write_dataset_records, get_minio_filesystem
+            # 首批写入时确定schema，后续批次复用
+            self.write_schema = write_dataset_records(records, f"{self.bucket}/{self.file_name}", self.file_format,
+                                                      get_minio_filesystem(self.conn_conf), self.partition_cols,
+                                                      self.write_schema)
+        except Exception as e:
+            return False, f'{str(e)[:100]}'
+        return True, res_data
+
+
+class ArrowMinioModel(ParquetMinioModel):
+    '''
+    arrow ipc(feather v2)对象模型
+    '''
+    file_format = 'arrow'
@@ -1,49 +1,139 @@
-import json
-import mongoengine
+import decimal
+import threading
+from urllib.parse import quote_plus
+from bson import ObjectId, Decimal128
+from pymongo import MongoClient, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
 from etl.data_models import DataModel
-from etl.utils.common_utils import trans_rule_value, gen_json_response, parse_json
+from etl.utils.common_utils import trans_rule_value, gen_json_response, parse_to_list
+from etl.utils.db_utils import gen_conn_key
+
+# 按连接配置复用的进程内MongoClient，自带连接池且线程安全
+_client_cache = {}
+_client_lock = threading.Lock()
+# 游标读取中断(游标超时、网络断开)时按_id续读的最大次数
+CURSOR_RESUME_TIMES = 3
+
+
+def get_mongo_client(conn_conf):
+    '''
+    获取mongo客户端，按连接配置复用
+    :param conn_conf: 数据源连接配置
+    :return:
+    '''
+    conn_key = gen_conn_key(conn_conf)
+    with _client_lock:
+        client = _client_cache.get(conn_key)
+        if client is None:
+            username = conn_conf.get('username')
+            auth = f"{quote_plus(str(username))}:{quote_plus(str(conn_conf.get('password', '')))}@" if username else ''
+            conn_url = f"mongodb://{auth}{conn_conf.get('host')}:{conn_conf.get('port')}"
+            # 认证库（authSource），优先取传入的auth_db/authSource，否则默认admin
+            auth_db = conn_conf.get('auth_db') or conn_conf.get('authSource') or conn_conf.get(
+                'authenticationDatabase') or 'admin'
+            client_kwargs = {'maxPoolSize': int(conn_conf.get('max_pool_size', 20))}
+            if username:
+                client_kwargs['authSource'] = auth_db
+            client = MongoClient(conn_url, **client_kwargs)
+            _client_cache[conn_key] = client
+    return client
+
+
+def clear_mongo_cache(conn_conf=None):
+    '''
+    关闭并清除缓存的mongo客户端
+    :param conn_conf: 数据源连接配置，为空时清除全部
+    :return:
+    '''
+    with _client_lock:
+        conn_keys = [gen_conn_key(conn_conf)] if conn_conf is not None else list(_client_cache.keys())
+        for conn_key in conn_keys:
+            client = _client_cache.pop(conn_key, None)
+            if client is not None:
+                client.close()
+
+
+def parse_document(value):
+    '''
+    文档转为普通python对象，ObjectId转为字符串，Decimal128转为Decimal，日期保持datetime
+    '''
+    if isinstance(value, dict):
+        return {k: parse_document(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [parse_document(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return value
+
+
+def parse_object_id(value):
+    '''
+    24位十六进制字符串转为ObjectId，用于_id筛选及回写
+    '''
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    if isinstance(value, list):
+        return [parse_object_id(v) for v in value]
+    return value
+
+
+def parse_write_value(value):
+    '''
+    写入值转换，Decimal转为Decimal128
+    '''
+    if isinstance(value, decimal.Decimal):
+        return Decimal128(value)
+    if isinstance(value, dict):
+        return {k: parse_write_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [parse_write_value(v) for v in value]
+    return value
+
+
+def gen_seek_filter(sort_keys, last_doc):
+    '''
+    生成游标续读条件，按排序字段组合(a, b, _id)大于上次读取的最后一条
+    :param sort_keys: 升序排序字段列表，最后一个为_id
+    :param last_doc: 上次读取的最后一条原始文档
+    :return:
+    '''
+    or_list = []
+    for i, key in enumerate(sort_keys):
+        condition = {k: last_doc.get(k) for k in sort_keys[:i]}
+        condition[key] = {'$gt': last_doc.get(key)}
+        or_list.append(condition)
+    if len(or_list) == 1:
+        return or_list[0]
+    return {'$or': or_list}
 
 
 class MongoModel(DataModel):
+    support_watermark = True
 
     def __init__(self, model_info):
         super().__init__(model_info)
-        conn_conf = self._source['conn_conf']
+        self.conn_conf = self._source['conn_conf']
         model_conf = self._model.get('model_conf', {})
-        conn_url = f"mongodb://{conn_conf.get('username')}:{conn_conf.get('password')}@{conn_conf.get('host')}:{conn_conf.get('port')}"
-        # 认证库（authSource），优先取传入的auth_db/authSource，否则默认admin
-        auth_db = conn_conf.get('auth_db') or conn_conf.get('authSource') or conn_conf.get('authenticationDatabase') or 'admin'
-        # 避免已存在的默认连接导致报错：A different connection with alias `default` was already registered
-        try:
-            mongoengine.disconnect(alias='default')
-        except Exception:
-            pass
-        self.conn = mongoengine.connect(
-            host=conn_url,
-            db=conn_conf.get('database_name'),
-            alias='default',
-            authentication_source=auth_db
-        )
+        self.conn = get_mongo_client(self.conn_conf)
+        self.db = self.conn[self.conn_conf.get('database_name')]
         self.collection = model_conf.get('name', '')
         if self.collection != '':
-            class Model(mongoengine.DynamicDocument):
-                meta = {'collection': model_conf.get('name', '')}
-            self.model = Model
+            self.model = self.db[self.collection]
         else:
             self.model = None
+        # 读取字段，为空时读取全部字段
+        self.fields = parse_to_list(self._extract_info.get('fields', []))
 
     def connect(self):
         '''
         连通性测试
         '''
         try:
-            db = mongoengine.connection.get_db()
-            collection_names = db.list_collection_names()
+            collection_names = self.db.list_collection_names()
             if self.collection == '':
-                if db is not None:
-                    return True, '连接成功'
-                else:
-                    return False, '连接失败'
+                return True, '连接成功'
             else:
                 if self.collection in collection_names:
                     return True, '连接成功'
@@ -58,27 +148,26 @@ class MongoModel(DataModel):
         获取使用提示及数据库元数据信息
         '''
         # 查询元数据信息
-        metadata = self.model._meta
-        first_obj = self.model.objects.first()
+        first_obj = self.model.find_one()
         metadata_info = f"""
-{metadata}
+database: {self.db.name}
+collection: {self.collection}
 {f'''document demo:
-{str(first_obj.to_json())[:1000]} 
+{str(parse_document(first_obj))[:1000]}
 ''' if first_obj else ""}
         """
         info_prompt = f"""
-一个mongoengine封装类，并且提供了一些数据操作的方法
+一个pymongo封装类，并且提供了一些数据操作的方法
 类中部分参数如下:
 collection：集合名称
-model: python mongoengine库 集合 实例，可用此对象，执行数据操作，如查询数据
+model: python pymongo库 Collection 实例，可用此对象，执行数据操作，如查询数据
 # 使用示例：
 实例化此类的reader对象，查询数据转为dataframe：
-obj_list = reader.model.objects().all()
-data_li = [json.loads(obj.to_json()) for obj in obj_list]
-df = pd.DataFrame(data_li)
-reader.conn.close()
+from etl.data_models.mongo_models import parse_document
+docs = reader.model.find({{}}, limit=1000)
+df = pd.DataFrame([parse_document(doc) for doc in docs])
 
-# DataSource type: 
+# DataSource type:
 mongodb
 # MetaData:
 {metadata_info}
@@ -89,8 +178,7 @@ mongodb
         '''
         生成子数据模型
         '''
-        db = mongoengine.connection.get_db()
-        collection_names = db.list_collection_names()
+        collection_names = self.db.list_collection_names()
         model_list = []
         for collection_name in collection_names:
             dic = {
@@ -105,16 +193,15 @@ mongodb
 
     def get_res_fields(self):
         '''
-        获取字段列表
+        获取字段列表，按首条文档字段
         '''
         res_fields = []
         try:
-            # todo: 获取不到具体字段
-            fields = self.model._fields
-            for k, v in fields.items():
+            first_obj = self.model.find_one() or {}
+            for k in first_obj:
                 dic = {
-                    'field_name': v.name,
-                    'field_value': v.name
+                    'field_name': k,
+                    'field_value': k
                 }
                 res_fields.append(dic)
         except Exception as e:
@@ -135,9 +222,7 @@ mongodb
         删除
         '''
         try:
-            db = mongoengine.connection.get_db()
-            table = getattr(db, self.collection)
-            table.drop()
+            self.db.drop_collection(self.collection)
             return True, '删除成功'
         except Exception as e:
             return False, str(e)
@@ -199,43 +284,61 @@ mongodb
     def gen_extract_rules(self):
         '''
         解析筛选规则
-        :return:
+        :return: (flag, (查询条件, 排序列表))
         '''
         if self.model is None:
             return False, '表不存在'
-        query = self.model.objects()
+        rule_op_map = {
+            'equal': '$eq', 'eq': '$eq', 'f_equal': '$ne', 'neq': '$ne', 'gt': '$gt', 'lt': '$lt',
+            'gte': '$gte', 'lte': '$lte', 'contain': '$in', 'f_contain': '$nin'
+        }
+        query_filter = {}
+        sort = []
         for i in self.extract_rules:
             field = i.get('field')
             rule = i.get('rule')
             value = i.get('value')
             value = trans_rule_value(value)
             if field and field not in ['sql', 'search_key']:
+                # 兼容mongoengine的id字段
+                if field in ['id', '_id']:
+                    field = '_id'
+                    value = parse_object_id(value)
                 if value:
-                    q_dict = {}
-                    if rule in ['equal', 'eq']:
-                        q_dict = {field: value}
-                    elif rule in ['f_equal', 'neq']:
-                        q_dict = {f"{field}__ne": value}
-                    elif rule == 'gt':
-                        q_dict = {f"{field}__gt": value}
-                    elif rule == 'lt':
-                        q_dict = {f"{field}__lt": value}
-                    elif rule == 'gte':
-                        q_dict = {f"{field}__gte": value}
-                    elif rule == 'lte':
-                        q_dict = {f"{field}__lte": value}
-                    elif rule == 'contain':
-                        q_dict = {f"{field}__in": value}
-                    elif rule == 'f_contain':
-                        q_dict = {f"{field}__nin": value}
-                    if q_dict != {}:
-                        query = query.filter(**q_dict)
+                    if rule in rule_op_map:
+                        op = rule_op_map[rule]
+                        if op in ['$in', '$nin'] and not isinstance(value, list):
+                            value = parse_to_list(value)
+                        query_filter.setdefault(field, {})[op] = value
                 else:
                     if rule == 'sort_asc':
-                        query = query.order_by(field)
+                        sort.append((field, ASCENDING))
                     elif rule == 'sort_desc':
-                        query = query.order_by(f"-{field}")
-        return True, query
+                        sort.append((field, DESCENDING))
+        return True, (query_filter, sort)
+
+    def get_projection(self):
+        '''
+        获取读取字段
+        '''
+        if self.fields == []:
+            return None
+        projection = {k: 1 for k in self.fields}
+        watermark_field = self._extract_info.get('watermark_field')
+        if watermark_field:
+            projection[watermark_field] = 1
+        return projection
+
+    def get_total(self, query_filter):
+        '''
+        获取分批读取总数，total_type: exact 精确计数，approx 集合估算值，none 不计数
+        '''
+        total_type = self._extract_info.get('total_type', 'exact')
+        if total_type == 'none':
+            return None
+        if total_type == 'approx':
+            return self.model.estimated_document_count()
+        return self.model.count_documents(query_filter)
 
     def read_page(self, page=1, pagesize=20):
         '''
@@ -244,61 +347,126 @@ mongodb
         :param pagesize:
         :return:
         '''
-        if self.model is False:
-            return False, '数据库链接错误'
+        if self.model is None:
+            return False, '表不存在'
         flag, query = self.gen_extract_rules()
         if not flag:
             return False, query
-        total = query.count()
-        query = query.skip((page - 1) * pagesize)
-        query = query.limit(pagesize)
-        obj_list = query.all()
-        data_li = []
-        for obj in obj_list:
-            dic = json.loads(obj.to_json())
-            data_li.append(dic)
+        query_filter, sort = query
+        total = self.model.count_documents(query_filter)
+        cursor = self.model.find(query_filter, self.get_projection(), skip=(page - 1) * pagesize, limit=pagesize)
+        if sort != []:
+            cursor = cursor.sort(sort)
+        data_li = [parse_document(doc) for doc in cursor]
         res_data = {
             'records': data_li,
             'total': total
         }
         return True, gen_json_response(res_data)
 
+    def iter_cursor(self, query_filter, sort, pagesize):
+        '''
+        单个游标按batch_size分批读取，按(排序字段..., _id)升序时游标中断可从最后一条续读
+        :param query_filter: 查询条件
+        :param sort: 排序列表
+        :param pagesize: 每批数量
+        :return: 原始文档列表生成器
+        '''
+        resumable = sort != [] and sort[-1][0] == '_id' and all(i[1] == ASCENDING for i in sort)
+        sort_keys = [i[0] for i in sort]
+        projection = self.get_projection()
+        last_doc = None
+        resume_times = 0
+        while True:
+            page_filter = query_filter
+            if last_doc is not None:
+                page_filter = {'$and': [query_filter, gen_seek_filter(sort_keys, last_doc)]}
+            cursor = self.model.find(page_filter, projection, batch_size=pagesize)
+            if sort != []:
+                cursor = cursor.sort(sort)
+            docs = []
+            try:
+                for doc in cursor:
+                    docs.append(doc)
+                    if len(docs) >= pagesize:
+                        last_doc = docs[-1]
+                        yield docs
+                        docs = []
+                if docs:
+                    yield docs
+                return
+            except PyMongoError as e:
+                if not resumable or resume_times >= CURSOR_RESUME_TIMES:
+                    raise e
+                print(e)
+                resume_times += 1
+                # 丢弃未产出的部分批次，从已产出的最后一条之后续读
+            finally:
+                cursor.close()
+
     def read_batch(self):
         '''
-        生成器分批读取数据
-        :param res_type: 返回形式
+        生成器分批读取数据，单个游标读取，默认按_id升序，配置watermark_field时按(水位字段, _id)升序增量读取
         :return:
         '''
-        if self.model is False:
-            yield False, '数据库链接错误'
+        if self.model is None:
+            yield False, '表不存在'
+            return
         flag, query = self.gen_extract_rules()
         if not flag:
             yield False, query
-        total = query.count()
+            return
+        query_filter, sort = query
         pagesize = self._extract_info.get('batch_size', 1000)
-        total_pages = total // pagesize + 1
-        n = 0
-        while n < total_pages:
-            page = n + 1
-            n += 1
-            query = query.skip((page - 1) * pagesize)
-            query = query.limit(pagesize)
-            obj_list = query.all()
-            data_li = []
-            for obj in obj_list:
-                dic = json.loads(obj.to_json())
-                data_li.append(dic)
-            res_data = {
-                'records': data_li,
-                'total': total
-            }
-            yield True, gen_json_response(res_data)
+        watermark_field = self._extract_info.get('watermark_field')
+        if watermark_field:
+            watermark_start = self._extract_info.get('watermark_start')
+            condition = {'$ne': None}
+            if watermark_start is not None:
+                condition['$gt'] = watermark_start
+            query_filter = {'$and': [query_filter, {watermark_field: condition}]}
+            sort = [(watermark_field, ASCENDING), ('_id', ASCENDING)]
+        elif all(i[1] == ASCENDING for i in sort) and '_id' not in [i[0] for i in sort]:
+            # 以_id为末位排序字段，游标中断时可续读
+            sort = sort + [('_id', ASCENDING)]
+        try:
+            total = self.get_total(query_filter)
+            for docs in self.iter_cursor(query_filter, sort, pagesize):
+                res_data = {
+                    'records': [parse_document(doc) for doc in docs],
+                    'total': total
+                }
+                if watermark_field:
+                    res_data['watermark'] = docs[-1].get(watermark_field)
+                yield True, gen_json_response(res_data)
+        except Exception as e:
+            yield False, str(e)[:200]
+
+    def gen_write_ops(self, contents):
+        '''
+        按only_fields生成批量更新操作，upsert时不存在则插入
+        '''
+        upsert = self.load_type == 'upsert'
+        ops = []
+        for c in contents:
+            c = {k: parse_write_value(v) for k, v in c.items()}
+            if '_id' in c:
+                c['_id'] = parse_object_id(c['_id'])
+            query_filter = {k: c.get(k) for k in self.only_fields}
+            update = {'$set': {k: v for k, v in c.items() if k != '_id'}}
+            if '_id' in c and '_id' not in query_filter:
+                update['$setOnInsert'] = {'_id': c['_id']}
+            ops.append(UpdateOne(query_filter, update, upsert=upsert))
+        return ops
 
     def write(self, res_data):
+        '''
+        批量写入，insert使用无序insert_many，update/upsert按only_fields使用无序bulk_write
+        '''
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert', 'update', 'upsert']:
             return False, '写入类型参数错误'
-        self.only_fields = self._load_info.get('only_fields', [])
+        self.only_fields = ['_id' if k == 'id' else k for k in parse_to_list(self._load_info.get('only_fields', []))]
         if self.model is None:
             return False, '表不存在'
         contents = []
@@ -309,29 +477,26 @@ mongodb
                 contents = res_data['contents']
             else:
                 contents = [res_data]
+        if contents == []:
+            return True, res_data
         try:
-            insert_contents = []
             if self.load_type == 'insert':
-                insert_contents = contents
-            elif self.load_type in ['update', 'upsert']:
+                docs = []
                 for c in contents:
-                    query_dict = {k: v for k, v in c.items() if k in self.only_fields}
-                    query = self.model.objects()
-                    for k in query_dict:
-                        query = query.filter(**{k: query_dict[k]})
-                    obj = query.first()
-                    if obj is not None:
-                        for k in c:
-                            setattr(obj, k, c[k])
-                        obj.save()
-                    elif self.load_type == 'upsert':
-                        insert_contents.append(c)
-            if insert_contents != []:
-                # 创建 insert 对象
-                for c in insert_contents:
-                    obj = self.model(**c)
-                    obj.save()
+                    # 复制后写入，避免insert_many向原数据中添加_id
+                    doc = {k: parse_write_value(v) for k, v in c.items()}
+                    if '_id' in doc:
+                        doc['_id'] = parse_object_id(doc['_id'])
+                    docs.append(doc)
+                self.model.insert_many(docs, ordered=False)
+            else:
+                if self.only_fields == []:
+                    return False, '更新写入需配置only_fields'
+                self.model.bulk_write(self.gen_write_ops(contents), ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            msg = write_errors[0].get('errmsg') if write_errors else str(e)
+            return False, f'{len(write_errors)}条写入失败：{str(msg)[:100]}'
         except Exception as e:
             return False, f'{str(e)[:100]}'
         return True, res_data
-
@@ -1,6 +1,6 @@
 import random
 from etl.data_models import DataModel
-from etl.utils.common_utils import gen_json_response
+from etl.utils.common_utils import gen_json_response, iter_micro_batches
 from pymysqlreplication import BinLogStreamReader
 from pymysqlreplication.row_event import (
     DeleteRowsEvent,
@@ -45,6 +45,8 @@ class MysqlBinlogModel(DataModel):
             if event == 'update':
                 self.only_events.append(UpdateRowsEvent)
         self.read_type = 'latest'  # 默认从最新开始读
+        # 微批参数，每批最多batch_size条或等待max_wait_ms毫秒
+        self.max_wait_ms = self._extract_info.get('max_wait_ms', 1000)
 
     def connect(self):
         '''
@@ -121,23 +123,12 @@ class MysqlBinlogModel(DataModel):
             # 设定只监控写操作：增、删、改
             only_events=self.only_events
         )
-        for binlogevent in stream:
-            for row in binlogevent.rows:
-                event = {"schema": binlogevent.schema, "table": binlogevent.table}
-                if isinstance(binlogevent, DeleteRowsEvent):
-                    event["action"] = "delete"
-                    event["data"] = row["values"]
-                elif isinstance(binlogevent, UpdateRowsEvent):
-                    event["action"] = "update"
-                    event["data"] = row["after_values"]
-                elif isinstance(binlogevent, WriteRowsEvent):
-                    event["action"] = "insert"
-                    event["data"] = row["values"]
-                res_data = {
-                    'records': [event],
-                    'total': 1
-                }
-                return True, gen_json_response(data=res_data)
+        for event in self.iter_events(stream):
+            res_data = {
+                'records': [event],
+                'total': 1
+            }
+            return True, gen_json_response(data=res_data)
 
     def read_batch(self):
         '''
@@ -156,20 +147,35 @@ class MysqlBinlogModel(DataModel):
             # 设定只监控写操作：增、删、改
             only_events=self.only_events
         )
+        for records in iter_micro_batches(self.iter_events(stream), self.batch_size, self.max_wait_ms):
+            res_data = {
+                'records': records,
+                'total': len(records)
+            }
+            yield True, gen_json_response(data=res_data)
+
+    def iter_events(self, stream):
+        '''
+        逐行产出binlog变更事件
+        :param stream:
+        :return:
+        '''
         for binlogevent in stream:
             for row in binlogevent.rows:
-                event = {"schema": binlogevent.schema, "table": binlogevent.table}
-                if isinstance(binlogevent, DeleteRowsEvent):
-                    event["action"] = "delete"
-                    event["data"] = row["values"]
-                elif isinstance(binlogevent, UpdateRowsEvent):
-                    event["action"] = "update"
-                    event["data"] = row["after_values"]
-                elif isinstance(binlogevent, WriteRowsEvent):
-                    event["action"] = "insert"
-                    event["data"] = row["values"]
-                res_data = {
-                    'records': [event],
-                    'total': 1
-                }
-                yield True, gen_json_response(data=res_data)
+                yield self.gen_event(binlogevent, row)
+
+    def gen_event(self, binlogevent, row):
+        '''
+        将binlog行转为变更事件
+        '''
+        event = {"schema": binlogevent.schema, "table": binlogevent.table}
+        if isinstance(binlogevent, DeleteRowsEvent):
+            event["action"] = "delete"
+            event["data"] = row["values"]
+        elif isinstance(binlogevent, UpdateRowsEvent):
+            event["action"] = "update"
+            event["data"] = row["after_values"]
+        elif isinstance(binlogevent, WriteRowsEvent):
+            event["action"] = "insert"
+            event["data"] = row["values"]
+        return event
@@ -1,6 +1,6 @@
 from etl.data_models.base_db_table import BaseDBTableModel
-from sqlalchemy import Column
-from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy import Column, text
+from sqlalchemy.dialects.mysql import LONGTEXT, insert
 
 
 def gen_longtext_column(i):
@@ -19,3 +19,19 @@ class MysqlTableModel(BaseDBTableModel):
         self.column_gen_map = {
             'LONGTEXT': gen_longtext_column
         }
+
+    def get_approx_total(self):
+        '''
+        从information_schema获取表行数估算值
+        '''
+        sql = "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        with self.db_engine.connect() as conn:
+            return conn.execute(text(sql), {'name': self.table_name}).scalar()
+
+    def gen_upsert_stmt(self, fields, only_fields):
+        '''
+        INSERT ... ON DUPLICATE KEY UPDATE，唯一字段需建有主键或唯一索引
+        '''
+        stmt = insert(self.table)
+        update_fields = [k for k in fields if k not in only_fields] or only_fields[:1]
+        return stmt.on_duplicate_key_update({k: stmt.inserted[k] for k in update_fields})
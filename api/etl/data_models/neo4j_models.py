@@ -1,7 +1,15 @@
 from py2neo import NodeMatcher, RelationshipMatcher
 from etl.data_models import DataModel
-from etl.utils.common_utils import trans_rule_value, flatten_dict, gen_json_response
-from etl.libs.n4j import NjClient
+from etl.utils.common_utils import trans_rule_value, flatten_dict, gen_json_response, parse_to_list
+from etl.libs.n4j import NjClient, escape_name, WRITE_BATCH_SIZE
+
+try:
+    from py2neo.errors import ConnectionBroken, ConnectionUnavailable
+    RESUME_ERRORS = (ConnectionBroken, ConnectionUnavailable, ConnectionError)
+except ImportError:
+    RESUME_ERRORS = (ConnectionError,)
+# 游标读取连接中断时按内部id续读的最大次数
+CURSOR_RESUME_TIMES = 3
 
 
 class N4jGraphModel(DataModel):
@@ -178,6 +186,45 @@ neo4j
                         query = query.where(f"{'NOT ' if rule == 'f_contain' else ''}_.{field} =~ {value}")
         return True, query
 
+    def gen_cypher_where(self):
+        '''
+        解析筛选规则为参数化cypher条件，节点变量为n
+        :return: (条件字符串, 参数)
+        '''
+        rule_op_map = {'equal': '=', 'eq': '=', 'gt': '>', 'lt': '<', 'gte': '>=', 'lte': '<='}
+        conditions = []
+        params = {}
+        for idx, i in enumerate(self.extract_rules):
+            field = i.get('field')
+            rule = i.get('rule')
+            value = i.get('value')
+            value = trans_rule_value(value)
+            if field and field not in ['sql'] and value:
+                param = f'p{idx}'
+                prop = f'n.{escape_name(field)}'
+                if rule in rule_op_map:
+                    conditions.append(f'{prop} {rule_op_map[rule]} ${param}')
+                elif rule in ['f_equal', 'neq']:
+                    conditions.append(f'NOT {prop} = ${param}')
+                elif rule in ['contain', 'f_contain']:
+                    conditions.append(f"{'NOT ' if rule == 'f_contain' else ''}toString({prop}) CONTAINS ${param}")
+                    value = str(value)
+                else:
+                    continue
+                params[param] = value
+        return ' AND '.join(conditions), params
+
+    def get_total(self, where, params):
+        '''
+        获取分批读取总数，total_type为none时不计数
+        '''
+        if self._extract_info.get('total_type', 'exact') == 'none':
+            return None
+        where_str = f'WHERE {where}' if where else ''
+        results = self.n4j_client.query_params(
+            f'MATCH (n:{escape_name(self.label)}) {where_str} RETURN count(n) AS total', **params)
+        return results[0]['total'] if results else 0
+
     def trans_obj_to_dict(self, obj):
         '''
         将结果转为字典类型
@@ -225,41 +272,96 @@ neo4j
 
     def read_batch(self):
         '''
-        生成器分批读取数据
+        生成器分批读取数据，单个查询游标按内部id升序流式读取，连接中断时从最后一个节点之后续读
         :return:
         '''
         if self.n4j_client is False:
             yield False, '数据库链接错误'
-        flag, query = self.gen_extract_rules()
-        if not flag:
-            yield False, query
-        total = query.count()
+            return
+        where, params = self.gen_cypher_where()
         pagesize = self._extract_info.get('batch_size', 1000)
-        total_pages = total // pagesize + 1
-        n = 0
-        while n < total_pages:
-            page = n + 1
-            n += 1
-            query = query.skip((page - 1) * pagesize)
-            query = query.limit(pagesize)
-            obj_list = query.all()
-            data_li = []
-            for obj in obj_list:
-                dic = self.trans_obj_to_dict(obj)
-                # 将参数带入字典
-                dic = flatten_dict(dic, 'properties')
-                data_li.append(dic)
-            res_data = {
-                'records': data_li,
-                'total': total
-            }
-            yield True, gen_json_response(res_data)
+        try:
+            total = self.get_total(where, params)
+        except Exception as e:
+            yield False, str(e)[:200]
+            return
+        last_id = None
+        resume_times = 0
+        while True:
+            try:
+                for obj_list in self.n4j_client.iter_nodes([self.label], where, pagesize, last_id, **params):
+                    data_li = []
+                    for obj in obj_list:
+                        dic = self.trans_obj_to_dict(obj)
+                        # 将参数带入字典
+                        dic = flatten_dict(dic, 'properties')
+                        data_li.append(dic)
+                    last_id = obj_list[-1].identity
+                    res_data = {
+                        'records': data_li,
+                        'total': total
+                    }
+                    yield True, gen_json_response(res_data)
+                return
+            except RESUME_ERRORS as e:
+                if resume_times >= CURSOR_RESUME_TIMES:
+                    yield False, str(e)[:200]
+                    return
+                print(e)
+                resume_times += 1
+            except Exception as e:
+                yield False, str(e)[:200]
+                return
+
+    def gen_relation_rows(self, records, relation_conf):
+        '''
+        记录转为关系写入行，start_fields/end_fields为 {节点属性: 记录字段} 或字段列表，其余字段作为关系属性
+        '''
+        start_fields = relation_conf.get('start_fields', {})
+        end_fields = relation_conf.get('end_fields', {})
+        if not isinstance(start_fields, dict):
+            start_fields = {k: k for k in parse_to_list(start_fields)}
+        if not isinstance(end_fields, dict):
+            end_fields = {k: k for k in parse_to_list(end_fields)}
+        node_fields = set(start_fields.values()) | set(end_fields.values())
+        rows = []
+        for record in records:
+            rows.append({
+                'start': {k: record.get(v) for k, v in start_fields.items()},
+                'end': {k: record.get(v) for k, v in end_fields.items()},
+                'properties': {k: v for k, v in record.items() if k not in node_fields}
+            })
+        return list(start_fields.keys()), list(end_fields.keys()), rows
+
+    def write_relations(self, records):
+        '''
+        批量写入关系
+        relation: {'type': 关系类型, 'start_label': 起点label, 'start_fields': 起点匹配字段,
+                   'end_label': 终点label, 'end_fields': 终点匹配字段}，label默认为当前模型label
+        '''
+        relation_conf = self._load_info.get('relation', {})
+        if not relation_conf.get('type'):
+            return False, '写入关系需配置relation.type'
+        start_keys, end_keys, rows = self.gen_relation_rows(records, relation_conf)
+        if start_keys == [] or end_keys == []:
+            return False, '写入关系需配置start_fields及end_fields'
+        action = {'insert': 'CREATE', 'update': 'MATCH', 'upsert': 'MERGE'}[self.load_type]
+        self.n4j_client.merge_relations(relation_conf['type'], relation_conf.get('start_label', self.label), start_keys,
+                                        relation_conf.get('end_label', self.label), end_keys, rows, action,
+                                        self.write_batch_size)
+        return True, records
 
     def write(self, res_data):
+        '''
+        批量写入，每批数据执行一条参数化UNWIND语句
+        write_type: node 写入节点(默认)，relation 写入关系
+        insert 直接创建，update 按only_fields匹配更新，upsert 按only_fields合并
+        '''
         self.load_type = self._load_info.get('load_type', '')
         if self.load_type not in ['insert', 'update', 'upsert']:
             return False, '写入类型参数错误'
-        self.only_fields = self._load_info.get('only_fields', [])
+        self.only_fields = parse_to_list(self._load_info.get('only_fields', []))
+        self.write_batch_size = int(self._load_info.get('write_batch_size', WRITE_BATCH_SIZE))
         records = []
         if isinstance(res_data, list) and res_data != []:
             records = res_data
@@ -268,13 +370,20 @@ neo4j
                 records = res_data['records']
             else:
                 records = [res_data]
+        if records == []:
+            return True, res_data
         try:
-            insert_records = []
-            if self.load_type == 'insert':
-                insert_records = records
-            if insert_records != []:
-                for record in records:
-                    self.n4j_client.create_node([self.label], record)
+            if self._load_info.get('write_type', 'node') == 'relation':
+                flag, msg = self.write_relations(records)
+                if not flag:
+                    return False, msg
+            elif self.load_type == 'insert':
+                self.n4j_client.create_nodes([self.label], records, self.write_batch_size)
+            else:
+                if self.only_fields == []:
+                    return False, '更新写入需配置only_fields'
+                self.n4j_client.merge_nodes([self.label], self.only_fields, records, self.load_type == 'upsert',
+                                            self.write_batch_size)
         except Exception as e:
             return False, f'{str(e)[:100]}'
         return True, res_data
@@ -49,13 +49,18 @@ class OracleTableModel(BaseDBTableModel):
                 create_sql = str(CreateTable(Model.__table__).compile(self.db_engine))
                 print(create_sql)
                 Model.__table__.create(self.db_engine)
-            self.db_engine.dispose()
             # 重新获取模型
-            self.get_table_model()
+            self.refresh_table_model()
             return True, '创建成功'
         except Exception as e:
             return False, str(e)
 
+    def gen_upsert_stmt(self, fields, only_fields):
+        '''
+        MERGE语句批量upsert
+        '''
+        return self.gen_merge_stmt(fields, only_fields, source_from=' FROM dual')
+
 
 class OracleSqlModel(BaseDBSqlModel):
 
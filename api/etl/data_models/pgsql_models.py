@@ -1,6 +1,7 @@
 from etl.data_models.base_db_table import BaseDBTableModel
 from etl.data_models.base_db_sql import BaseDBSqlModel
-from sqlalchemy import Column, TEXT
+from sqlalchemy import Column, TEXT, text
+from sqlalchemy.dialects.postgresql import insert
 
 
 def gen_string_column(i):
@@ -20,6 +21,34 @@ class PgsqlTableModel(BaseDBTableModel):
             'String': gen_string_column
         }
 
+    def get_approx_total(self):
+        '''
+        从pg_class统计信息获取表行数估算值
+        '''
+        # 按带schema的表名定位，避免其他schema下同名表
+        qualified_name = '"{}"'.format(self.table_name.replace('"', '""'))
+        schema = getattr(self.table, 'schema', None)
+        if schema:
+            qualified_name = '"{}".{}'.format(schema.replace('"', '""'), qualified_name)
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:qualified_name)"
+        with self.db_engine.connect() as conn:
+            total = conn.execute(text(sql), {'qualified_name': qualified_name}).scalar()
+        # 从未analyze的表reltuples为-1
+        if total is None or total < 0:
+            return None
+        return total
+
+    def gen_upsert_stmt(self, fields, only_fields):
+        '''
+        INSERT ... ON CONFLICT，唯一字段需建有主键或唯一索引
+        '''
+        stmt = insert(self.table)
+        update_fields = [k for k in fields if k not in only_fields]
+        if not update_fields:
+            return stmt.on_conflict_do_nothing(index_elements=only_fields)
+        return stmt.on_conflict_do_update(index_elements=only_fields,
+                                          set_={k: stmt.excluded[k] for k in update_fields})
+
 
 class PgsqlSqlModel(BaseDBSqlModel):
 
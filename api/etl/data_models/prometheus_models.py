@@ -1,6 +1,25 @@
+import threading
 from etl.data_models import DataModel
 from etl.utils.common_utils import trans_rule_value, gen_json_response, format_date
-from etl.libs.prometheus import PrometheusClient
+from etl.libs.prometheus import PrometheusClient, MAX_RANGE_POINTS
+
+# 按地址复用的进程内prometheus客户端，共享http连接池
+_client_cache = {}
+_client_lock = threading.Lock()
+# 区间查询默认并发分片数
+QUERY_WORKERS = 4
+
+
+def get_prometheus_client(url, pool_size=10):
+    '''
+    获取prometheus客户端，按地址复用
+    '''
+    with _client_lock:
+        client = _client_cache.get(url)
+        if client is None:
+            client = PrometheusClient(pool_size=pool_size, **{"url": url, 'disable_ssl': True})
+            _client_cache[url] = client
+    return client
 
 
 class BasePromModel(DataModel):
@@ -11,7 +30,10 @@ class BasePromModel(DataModel):
         self.model_conf = self._model.get('model_conf', {})
         self.url = self.conn_conf.get('url')
         self.auth_types = self.model_conf.get('auth_type', '').split(',')
-        self._client = PrometheusClient(**{"url": self.url, 'disable_ssl': True})
+        # 区间查询分片：每片每条序列最大点数及并发数
+        self.max_points = int(self._extract_info.get('max_points', MAX_RANGE_POINTS))
+        self.query_workers = int(self._extract_info.get('query_workers', QUERY_WORKERS))
+        self._client = get_prometheus_client(self.url, max(self.query_workers, 10))
 
     def connect(self):
         '''
@@ -42,6 +64,108 @@ promtheus
         """
         return info_prompt
 
+    def gen_query_dict(self):
+        '''
+        解析开始时间、结束时间、步长规则
+        '''
+        query_dict = {}
+        for i in self.extract_rules:
+            field = i.get('field')
+            rule = i.get('rule')
+            value = i.get('value')
+            value = trans_rule_value(value)
+            if field and value:
+                if rule == 'start_time':
+                    start_time = format_date(value, res_type='timestamp')
+                    if start_time is not None:
+                        query_dict['start_time'] = start_time
+                if rule == 'end_time':
+                    end_time = format_date(value, res_type='timestamp')
+                    if end_time is not None:
+                        query_dict['end_time'] = end_time
+                if rule == 'step':
+                    try:
+                        query_dict['step'] = float(value)
+                    except Exception as e:
+                        print(e)
+        return query_dict
+
+    def iter_records(self, promql, query_dict):
+        '''
+        逐个分片产出查询结果记录，区间查询按步长切分为多个分片并发查询，每个采样点为一条记录
+        :return: 记录列表生成器，记录格式同即时查询 {'metric': {...}, 'value': [时间戳, 值]}
+        '''
+        if query_dict.get('start_time') is None or query_dict.get('end_time') is None:
+            yield self._client.query(promql)
+            return
+        for series_list in self._client.iter_query_range(promql, query_dict['start_time'], query_dict['end_time'],
+                                                         query_dict.get('step', 60), self.max_points,
+                                                         self.query_workers):
+            yield [{'metric': series.get('metric', {}), 'value': value}
+                   for series in series_list for value in series.get('values', [])]
+
+    def read_page(self, page=1, pagesize=20):
+        '''
+        分页读取数据，区间查询只读取到当前页所需的分片，未读取全部分片时总数未知，返回None
+        :param page:
+        :param pagesize:
+        :return:
+        '''
+        flag, query = self.gen_extract_rules()
+        if not flag:
+            return False, query
+        promql, query_dict = query
+        end = page * pagesize
+        records = []
+        is_all = True
+        shard_iter = self.iter_records(promql, query_dict)
+        try:
+            for shard_records in shard_iter:
+                records.extend(shard_records)
+                if len(records) > end and query_dict.get('start_time') is not None \
+                        and query_dict.get('end_time') is not None:
+                    # 区间查询已满足当前页，不再读取后续分片
+                    is_all = False
+                    break
+        except Exception as e:
+            return False, str(e)[:500]
+        finally:
+            shard_iter.close()
+        res_data = {
+            'records': records[(page - 1) * pagesize:end],
+            'total': len(records) if is_all else None
+        }
+        return True, gen_json_response(data=res_data)
+
+    def read_batch(self):
+        '''
+        生成器分批读取数据，分片查询结果按batch_size流式产出，不整体加载
+        :return:
+        '''
+        flag, query = self.gen_extract_rules()
+        if not flag:
+            yield False, query
+            return
+        promql, query_dict = query
+        pagesize = self._extract_info.get('batch_size', 1000)
+        buffer = []
+        try:
+            for shard_records in self.iter_records(promql, query_dict):
+                buffer.extend(shard_records)
+                while len(buffer) >= pagesize:
+                    result = {
+                        'records': buffer[:pagesize],
+                        'total': None
+                    }
+                    buffer = buffer[pagesize:]
+                    yield True, gen_json_response(result)
+        except Exception as e:
+            yield False, str(e)[:500]
+            return
+        if buffer:
+            yield True, gen_json_response({'records': buffer, 'total': None})
+
+
 class PromMetricModel(BasePromModel):
 
     def __init__(self, model_info):
@@ -101,73 +225,13 @@ class PromMetricModel(BasePromModel):
     def gen_extract_rules(self):
         '''
         解析筛选规则
-        :return:
+        :return: (promql, 查询参数)
         '''
         try:
-            query_dict = {}
-            for i in self.extract_rules:
-                field = i.get('field')
-                rule = i.get('rule')
-                value = i.get('value')
-                value = trans_rule_value(value)
-                if field and value:
-                    if rule == 'start_time':
-                        start_time = format_date(value, res_type='timestamp')
-                        if start_time is not None:
-                            query_dict['start_time'] = start_time
-                    if rule == 'end_time':
-                        end_time = format_date(value, res_type='timestamp')
-                        if end_time is not None:
-                            query_dict['end_time'] = end_time
-                    if rule == 'step':
-                        try:
-                            query_dict['step'] = float(value)
-                        except Exception as e:
-                            print(e)
-            data_li = self._client.query(self.metric, **query_dict)
-            return True, data_li
+            return True, (self.metric, self.gen_query_dict())
         except Exception as e:
             return False, str(e)[:500]
 
-    def read_page(self, page=1, pagesize=20):
-        '''
-        分页读取数据
-        :param page:
-        :param pagesize:
-        :return:
-        '''
-        flag, res_data = self.gen_extract_rules()
-        if not flag:
-            return False, res_data
-        total = len(res_data)
-        data_li = res_data[(page - 1) * pagesize:page * pagesize]
-        res_data = {
-            'records': data_li,
-            'total': total
-        }
-        return True, gen_json_response(data=res_data)
-
-    def read_batch(self):
-        '''
-        生成器分批读取数据
-        :return:
-        '''
-        flag, res_data = self.gen_extract_rules()
-        if not flag:
-            yield False, res_data
-        total = len(res_data)
-        pagesize = self._extract_info.get('batch_size', 1000)
-        total_pages = total // pagesize + 1
-        n = 0
-        while n < total_pages:
-            page = n + 1
-            n += 1
-            result = {
-                'records': res_data[(page - 1) * pagesize:page * pagesize],
-                'total': total
-            }
-            yield True, gen_json_response(result)
-
 
 class PromQlModel(BasePromModel):
 
@@ -221,7 +285,7 @@ class PromQlModel(BasePromModel):
     def gen_extract_rules(self):
         '''
         解析筛选规则
-        :return:
+        :return: (promql, 查询参数)
         '''
         try:
             rules = [i for i in self.extract_rules if i['field'] == 'search_text' and i['rule'] == 'promql' and i['value']]
@@ -229,66 +293,6 @@ class PromQlModel(BasePromModel):
                 self.promql = rules[0].get('value')
             if 'custom_sql' not in self.auth_types and self.promql != self.default_promql:
                 return False, '无修改promql权限'
-            query_dict = {}
-            for i in self.extract_rules:
-                field = i.get('field')
-                rule = i.get('rule')
-                value = i.get('value')
-                value = trans_rule_value(value)
-                if field and value:
-                    if rule == 'start_time':
-                        start_time = format_date(value, res_type='timestamp')
-                        if start_time is not None:
-                            query_dict['start_time'] = start_time
-                    if rule == 'end_time':
-                        end_time = format_date(value, res_type='timestamp')
-                        if end_time is not None:
-                            query_dict['end_time'] = end_time
-                    if rule == 'step':
-                        try:
-                            query_dict['step'] = float(value)
-                        except Exception as e:
-                            print(e)
-            data_li = self._client.query(self.promql, **query_dict)
-            return True, data_li
+            return True, (self.promql, self.gen_query_dict())
         except Exception as e:
             return False, str(e)[:500]
-
-    def read_page(self, page=1, pagesize=20):
-        '''
-        分页读取数据
-        :param page:
-        :param pagesize:
-        :return:
-        '''
-        flag, res_data = self.gen_extract_rules()
-        if not flag:
-            return False, res_data
-        total = len(res_data)
-        data_li = res_data[(page - 1) * pagesize:page * pagesize]
-        res_data = {
-            'records': data_li,
-            'total': total
-        }
-        return True, gen_json_response(data=res_data)
-
-    def read_batch(self):
-        '''
-        生成器分批读取数据
-        :return:
-        '''
-        flag, res_data = self.gen_extract_rules()
-        if not flag:
-            yield False, res_data
-        total = len(res_data)
-        pagesize = self._extract_info.get('batch_size', 1000)
-        total_pages = total // pagesize + 1
-        n = 0
-        while n < total_pages:
-            page = n + 1
-            n += 1
-            result = {
-                'records': res_data[(page - 1) * pagesize:page * pagesize],
-                'total': total
-            }
-            yield True, gen_json_response(result)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import json
+import time
 from etl.data_models import DataModel
 from etl.utils.common_utils import gen_json_response
 import redis
@@ -234,10 +235,22 @@ class RedisListStreamModel(RedisListModel):
 
     def __init__(self, model_info):
         super().__init__(model_info)
+        # 微批参数，每批最多batch_size条或等待max_wait_ms毫秒
+        self.max_wait_ms = self._extract_info.get('max_wait_ms', 1000)
+
+    def pop_values(self, count):
+        '''
+        事务中从列表右侧批量弹出最多count条数据，按弹出顺序返回，兼容不支持RPOP count的redis版本
+        '''
+        pipe = self._client.pipeline(transaction=True)
+        pipe.lrange(self.redis_key, -count, -1)
+        pipe.ltrim(self.redis_key, 0, -count - 1)
+        values, _ = pipe.execute()
+        return values[::-1]
 
     def read_batch(self):
         '''
-        生成器分批读取数据
+        生成器分批读取数据，阻塞等待首条数据，之后批量弹出至batch_size条或等待max_wait_ms毫秒
         :param res_type: 返回形式
         :return:
         '''
@@ -247,9 +260,18 @@ class RedisListStreamModel(RedisListModel):
         while True:
             try:
                 _, v = self._client.brpop(self.redis_key)
+                values = [v]
+                deadline = time.time() + self.max_wait_ms / 1000
+                while len(values) < self.batch_size:
+                    popped = self.pop_values(self.batch_size - len(values))
+                    values.extend(popped)
+                    if len(values) >= self.batch_size or time.time() >= deadline:
+                        break
+                    if not popped:
+                        time.sleep(min(0.05, max(deadline - time.time(), 0)))
                 res_data = {
-                    'records': [{'value': v.decode()}],
-                    'total': 1
+                    'records': [{'value': i.decode()} for i in values],
+                    'total': len(values)
                 }
                 yield True, gen_json_response(res_data)
             except Exception as e:
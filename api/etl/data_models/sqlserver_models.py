@@ -50,13 +50,18 @@ class SqlServerTableModel(BaseDBTableModel):
                 create_sql = str(CreateTable(Model.__table__).compile(self.db_engine))
                 print(create_sql)
                 Model.__table__.create(self.db_engine)
-            self.db_engine.dispose()
             # 重新获取模型
-            self.get_table_model()
+            self.refresh_table_model()
             return True, '创建成功'
         except Exception as e:
             return False, str(e)
 
+    def gen_upsert_stmt(self, fields, only_fields):
+        '''
+        MERGE语句批量upsert
+        '''
+        return self.gen_merge_stmt(fields, only_fields, end=';')
+
     def read_page(self, page=1, pagesize=20):
         '''
         分页读取数据
@@ -94,6 +99,12 @@ class SqlServerTableModel(BaseDBTableModel):
         flag, query = self.gen_extract_rules(self.db_model)
         if not flag:
             yield False, query
+        if self._extract_info.get('batch_mode') == 'seek' or self._extract_info.get('watermark_field'):
+            yield from self.read_batch_seek(query)
+            return
+        if self._extract_info.get('batch_mode') == 'stream':
+            yield from self.read_batch_stream(query)
+            return
         total = query.count()
         pagesize = self._extract_info.get('batch_size', 1000)
         total_pages = total // pagesize + 1
@@ -1,8 +1,29 @@
 # -*- coding: utf-8 -*-
 import logging
+import queue
+import threading
 from etl.utils import get_reader, get_writer, get_res_fields
-from etl.transform_algs import transform_alg_dict, df_to_data
+from etl.transform_algs import transform_alg_dict, df_to_data, df_alg_codes, records_to_df, df_to_records, \
+    compile_rule_dict
 from etl.utils.common_utils import gen_json_response
+from etl.utils.checkpoint_utils import FileCheckpointStore, WatermarkTracker, gen_checkpoint_key, get_batch_watermark
+
+
+def to_load_data(res_data, with_df=True):
+    '''
+    DataFrame、arrow RecordBatch/Table转为字典列表，写入数据模型只接收字典列表
+    :param with_df: 是否转换DataFrame，为False时只转换arrow数据
+    '''
+    if isinstance(res_data, dict) and 'records' in res_data:
+        records = to_load_data(res_data['records'], with_df)
+        if records is res_data['records']:
+            return res_data
+        return dict(res_data, records=records)
+    if hasattr(res_data, 'to_pylist'):
+        return res_data.to_pylist()
+    if with_df and hasattr(res_data, 'columns') and hasattr(res_data, 'iloc'):
+        return df_to_records(res_data)
+    return res_data
 
 
 class EtlTask(object):
@@ -13,33 +34,145 @@ class EtlTask(object):
         self.extract_type = self.extract_info.get('extract_type', 'once')
         self.process_rules = task_params.get('process_rules', [])
         self.load_info = self.params.get('load')
+        # 执行模式，serial 串行执行，pipeline 抽取、转换、装载多线程流水线执行
+        self.run_mode = task_params.get('run_mode', 'serial')
+        self.pipeline_conf = task_params.get('pipeline_conf', {})
         self.error_list = []
-        # 拓展处理算法
-        self.transform_alg_dict = transform_alg_dict
+        # 拓展处理算法，复制全局算法表使拓展算法仅对当前任务生效
+        self.transform_alg_dict = dict(transform_alg_dict)
         extend_alg_dict = task_params.get('extend_alg_dict', {})
+        self.extend_alg_codes = set()
         if isinstance(extend_alg_dict, dict):
             for k, v in extend_alg_dict.items():
                 self.transform_alg_dict[k] = v
+            self.extend_alg_codes = set(extend_alg_dict.keys())
+        # 自动dataframe处理(默认关闭)，从df_start条规则起剩余规则均支持dataframe时，批数据转换一次dataframe后向量化处理
+        # 开启后字段不一致的记录会补齐缺失字段为None
+        self.auto_df = task_params.get('auto_df', False)
+        self.df_start = self.get_df_start()
+        # 预编译转换规则，每批数据只执行数据处理
+        self.compile_flag, self.compiled_rules = self.compile_rules()
+        # 增量抽取水位检查点，抽取配置watermark_field时启用，每批装载成功后推进
+        self.watermark_field = None
+        self.watermark_tracker = None
+
+    def compile_rules(self):
+        '''
+        预编译转换规则，解析规则配置并预编译自定义代码，任务内只执行一次
+        :return: 成功时返回(算法函数, 解析后配置)列表
+        '''
+        compiled_rules = []
+        idx = 1
+        for rule in self.process_rules:
+            method_code = rule.get('code')
+            alg_method = self.transform_alg_dict.get(method_code)
+            if not alg_method:
+                return False, f'数据转换第{idx}条规则出错：未找到处理函数{method_code}'
+            rule_dict = rule.get('rule_dict')
+            # 拓展算法自行解析配置
+            if method_code not in self.extend_alg_codes:
+                try:
+                    flag, rule_dict = compile_rule_dict(method_code, rule_dict)
+                except Exception as e:
+                    flag, rule_dict = False, str(e)
+                if not flag:
+                    return False, f'数据转换第{idx}条规则出错：{rule_dict}'
+            compiled_rules.append((alg_method, rule_dict))
+            idx += 1
+        return True, compiled_rules
+
+    def get_df_start(self):
+        '''
+        获取可自动转为dataframe处理的起始规则序号，剩余规则少于2条时不转换
+        :return:
+        '''
+        df_codes = df_alg_codes - self.extend_alg_codes
+        df_start = len(self.process_rules)
+        while df_start > 0 and self.process_rules[df_start - 1].get('code') in df_codes:
+            df_start -= 1
+        if len(self.process_rules) - df_start < 2:
+            return None
+        return df_start
 
     def gen_data_models(self):
         '''
         获取读取或写入数据模型
         :return:
         '''
+        self.init_watermark()
         flag, reader = get_reader(self.extract)
         if flag:
             self.reader = reader
         else:
             self.error_list.append(reader)
             self.reader = None
-        if self.load_info is not None:
-            flag, writer = get_writer(self.load_info)
-            if flag:
-                self.writer = writer
-            else:
-                self.writer = None
+        self.check_watermark()
+        self.writer = self.new_writer()
+
+    def get_checkpoint_store(self):
+        '''
+        获取水位检查点存储，默认本地文件
+        :return:
+        '''
+        return FileCheckpointStore(self.params.get('checkpoint_path'))
+
+    def init_watermark(self):
+        '''
+        读取上次提交的水位检查点，写入抽取配置watermark_start作为本次增量抽取起点，无检查点时使用配置的watermark_start
+        :return:
+        '''
+        self.watermark_field = self.extract_info.get('watermark_field')
+        if not self.watermark_field:
+            return
+        store = self.get_checkpoint_store()
+        key = gen_checkpoint_key(self.params, self.watermark_field)
+        watermark = store.get(key)
+        if watermark is None:
+            watermark = self.extract_info.get('watermark_start')
         else:
-            self.writer = None
+            self.extract_info['watermark_start'] = watermark
+        self.watermark_tracker = WatermarkTracker(store, key, watermark)
+
+    def check_watermark(self):
+        '''
+        检查读取模型是否支持水位增量抽取
+        :return:
+        '''
+        if self.watermark_field and self.reader is not None and not self.reader.support_watermark:
+            self.error_list.append('数据模型不支持按watermark_field增量抽取')
+
+    def get_watermark(self, res_data):
+        '''
+        获取一批抽取数据的最大水位值，需在数据转换前获取
+        :return:
+        '''
+        if not self.watermark_field:
+            return None
+        return get_batch_watermark(res_data, self.watermark_field)
+
+    def commit_watermark(self, seq, watermark):
+        '''
+        第seq批数据装载成功后提交水位，之前批次均已装载时推进检查点
+        :return:
+        '''
+        if self.watermark_tracker is None:
+            return
+        try:
+            self.watermark_tracker.commit(seq, watermark)
+        except Exception as e:
+            print(e)
+
+    def new_writer(self):
+        '''
+        创建写入数据模型，流水线模式下每个装载线程使用独立的写入对象
+        :return:
+        '''
+        if self.load_info is None:
+            return None
+        flag, writer = get_writer(self.load_info)
+        if flag:
+            return writer
+        return None
 
     def process_batch(self, res_data, run_load=True):
         '''
@@ -47,27 +180,151 @@ class EtlTask(object):
         :param run_load: 是否执行数据装载
         :return:
         '''
-        # 数据转换
+        flag, res_data = self.transform_batch(res_data)
+        if not flag:
+            return False, res_data
+        if run_load:
+            return self.load_batch(res_data)
+        return True, res_data
+
+    def transform_batch(self, res_data):
+        '''
+        按处理规则转换一批数据
+        :return:
+        '''
+        if not self.compile_flag:
+            return False, self.compiled_rules
+        # 处理规则不支持arrow数据，stream_format为arrow时先转为字典列表
+        if self.compiled_rules:
+            res_data = to_load_data(res_data, with_df=False)
         idx = 1
         context = {}
-        for rule in self.process_rules:
-            method_code = rule.get('code')
-            alg_method = self.transform_alg_dict.get(method_code)
-            if not alg_method:
-                return False, f'数据转换第{idx}条规则出错：未找到处理函数{method_code}'
-            rule_dict = rule.get('rule_dict')
+        is_auto_df = False
+        for alg_method, rule_dict in self.compiled_rules:
+            if self.auto_df and idx - 1 == self.df_start and isinstance(res_data, list) \
+                    and res_data != [] and isinstance(res_data[0], dict):
+                res_data = records_to_df(res_data)
+                is_auto_df = True
             flag, res_data = alg_method(res_data, rule_dict, context)
             if not flag:
                 return False, f'数据转换第{idx}条规则出错：{res_data}'
             idx += 1
-        if run_load:
-            if not self.writer:
-                return False, f'数据装载出错：未找到数据装载对象'
-            flag, res_data = self.writer.write(res_data)
-            if not flag:
-                return False, f'数据装载出错：{res_data}'
+        if is_auto_df and not isinstance(res_data, (list, dict)):
+            res_data = df_to_records(res_data)
         return True, res_data
 
+    def load_batch(self, res_data, writer=None):
+        '''
+        装载一批数据，stream_format为dataframe、arrow的批数据先转为字典列表
+        :param writer: 写入数据模型，默认使用self.writer
+        :return:
+        '''
+        if writer is None:
+            writer = self.writer
+        if not writer:
+            return False, f'数据装载出错：未找到数据装载对象'
+        flag, res_data = writer.write(to_load_data(res_data))
+        if not flag:
+            return False, f'数据装载出错：{res_data}'
+        return True, res_data
+
+    def process_pipeline(self, run_load=True):
+        '''
+        流水线处理数据，抽取、转换、装载分别在独立线程中执行，阶段间使用有界队列衔接
+        pipeline_conf:
+            queue_size: 队列深度，默认4
+            load_workers: 装载线程数，默认1，keep_order为True时固定为1
+            keep_order: 是否保持批次写入顺序，默认True
+        任一阶段出错时停止全部阶段，并返回第一个错误
+        :param run_load: 是否执行数据装载
+        :return:
+        '''
+        queue_size = self.pipeline_conf.get('queue_size', 4)
+        keep_order = self.pipeline_conf.get('keep_order', True)
+        load_workers = 1 if keep_order else max(int(self.pipeline_conf.get('load_workers', 1)), 1)
+        transform_queue = queue.Queue(maxsize=queue_size)
+        load_queue = queue.Queue(maxsize=queue_size)
+        stop_event = threading.Event()
+        errors = []
+        error_lock = threading.Lock()
+
+        def set_error(msg):
+            with error_lock:
+                if not errors:
+                    errors.append(msg)
+            stop_event.set()
+
+        def extract_stage():
+            try:
+                seq = 0
+                for flag, res_data in self.reader.read_batch():
+                    if not flag:
+                        set_error(f"数据抽取出错：{res_data}")
+                        return
+                    res_data = res_data['data']
+                    # 批次序号及水位随批数据传递，装载成功后提交
+                    item = (seq, self.get_watermark(res_data), res_data)
+                    if not _queue_put(transform_queue, item, stop_event):
+                        return
+                    seq += 1
+            except Exception as e:
+                set_error(f"数据抽取出错：{e}")
+                return
+            _queue_put(transform_queue, _PIPELINE_END, stop_event)
+
+        def transform_stage():
+            try:
+                while True:
+                    item = _queue_get(transform_queue, stop_event)
+                    if item is _PIPELINE_END:
+                        break
+                    seq, watermark, res_data = item
+                    flag, res_data = self.transform_batch(res_data)
+                    if not flag:
+                        set_error(f"数据处理出错：{res_data}")
+                        return
+                    if run_load and not _queue_put(load_queue, (seq, watermark, res_data), stop_event):
+                        return
+            except Exception as e:
+                set_error(f"数据处理出错：{e}")
+                return
+            if run_load:
+                for _ in range(load_workers):
+                    _queue_put(load_queue, _PIPELINE_END, stop_event)
+
+        def load_stage(writer):
+            try:
+                while True:
+                    item = _queue_get(load_queue, stop_event)
+                    if item is _PIPELINE_END:
+                        break
+                    seq, watermark, res_data = item
+                    flag, res_data = self.load_batch(res_data, writer)
+                    if not flag:
+                        set_error(res_data)
+                        return
+                    self.commit_watermark(seq, watermark)
+            except Exception as e:
+                set_error(f"数据装载出错：{e}")
+
+        threads = [
+            threading.Thread(target=extract_stage, name='etl-extract', daemon=True),
+            threading.Thread(target=transform_stage, name='etl-transform', daemon=True)
+        ]
+        if run_load:
+            for i in range(load_workers):
+                writer = self.writer if i == 0 else self.new_writer()
+                threads.append(threading.Thread(target=load_stage, args=(writer,), name=f'etl-load-{i}', daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads[1:]:
+            t.join()
+        # 出错时抽取线程可能阻塞在流式数据源读取中，不再等待其结束
+        threads[0].join(timeout=1 if errors else None)
+        if errors:
+            return False, errors[0]
+        return True, '数据处理完成'
+
     def process_once(self, page=1, pagesize=20, run_load=True):
         '''
         单次处理数据
@@ -83,18 +340,9 @@ class EtlTask(object):
         # 抽取成功，取出其中的数据
         res_data = res_data['data']
         # 数据转换
-        idx = 1
-        context = {}
-        for rule in self.process_rules:
-            method_code = rule.get('code')
-            rule_dict = rule.get('rule_dict')
-            alg_method = self.transform_alg_dict.get(method_code)
-            if not alg_method:
-                return False, f'数据转换第{idx}条规则出错：未找到处理函数{method_code}'
-            flag, res_data = alg_method(res_data, rule_dict, context)
-            if not flag:
-                return False, f'数据转换第{idx}条规则出错：{res_data}'
-            idx += 1
+        flag, res_data = self.transform_batch(res_data)
+        if not flag:
+            return False, res_data
         if run_load:
             if not self.writer:
                 return False, f'数据装载出错：未找到数据装载对象'
@@ -129,26 +377,13 @@ class EtlTask(object):
         # 抽取成功，取出其中的数据
         res_data = res_data['data']
         # 数据转换
-        idx = 1
-        context = {}
-        for rule in self.process_rules:
-            method_code = rule.get('code')
-            rule_dict = rule.get('rule_dict')
-            alg_method = self.transform_alg_dict.get(method_code)
-            if not alg_method:
-                res_info = {
-                    'code': 500,
-                    'msg': f'数据转换第{idx}条规则出错：未找到处理函数{method_code}'
-                }
-                return res_info
-            flag, res_data = alg_method(res_data, rule_dict, context)
-            if not flag:
-                res_info = {
-                    'code': 500,
-                    'msg': f'数据转换第{idx}条规则出错：{res_data}'
-                }
-                return res_info
-            idx += 1
+        flag, res_data = self.transform_batch(res_data)
+        if not flag:
+            res_info = {
+                'code': 500,
+                'msg': res_data
+            }
+            return res_info
         if run_load:
             if not self.writer:
                 res_info = {
@@ -185,6 +420,34 @@ class EtlTask(object):
         return gen_json_response(data=res_data)
 
 
+_PIPELINE_END = object()
+
+
+def _queue_put(q, item, stop_event, timeout=0.5):
+    '''
+    向有界队列写入数据，流水线停止时放弃写入
+    '''
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=timeout)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _queue_get(q, stop_event, timeout=0.5):
+    '''
+    从队列读取数据，流水线停止时返回结束标记
+    '''
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            continue
+    return _PIPELINE_END
+
+
 def etl_task_process(params, run_load=False, logger=None, task_class=EtlTask):
     '''
     执行处理任务
@@ -203,9 +466,16 @@ def etl_task_process(params, run_load=False, logger=None, task_class=EtlTask):
         flag, res_data = etl_task.process_once(pagesize=batch_size, run_load=run_load)
         if not flag:
             logger.error(f'数据装载出错：{res_data}')
+    elif extract_type in ['batch', 'flow'] and etl_task.run_mode == 'pipeline':
+        flag, res_data = etl_task.process_pipeline(run_load=run_load)
+        if flag:
+            logger.info(res_data)
+        else:
+            logger.error(res_data)
     elif extract_type in ['batch', 'flow']:
         # 数据抽取
         reader_gen = etl_task.reader.read_batch()
+        seq = 0
         while reader_gen:
             try:
                 flag, res_data = next(reader_gen)
@@ -214,10 +484,15 @@ def etl_task_process(params, run_load=False, logger=None, task_class=EtlTask):
                     break
                 # 抽取成功，取出其中的数据
                 res_data = res_data['data']
+                watermark = etl_task.get_watermark(res_data)
                 flag, res_data = etl_task.process_batch(res_data, run_load=run_load)
                 if not flag:
                     logger.error(f"数据处理出错：{res_data}")
                     break
+                # 装载成功后推进水位检查点
+                if run_load:
+                    etl_task.commit_watermark(seq, watermark)
+                seq += 1
             except StopIteration:
                 logger.info('数据处理完成')
                 break
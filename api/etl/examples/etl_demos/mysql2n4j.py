@@ -60,8 +60,14 @@ load_info = {
         "fields": []
     },
     'load_info': {
+        # insert: 批量创建，update/upsert: 按only_fields匹配更新/合并
         'load_type': 'insert',
-        'only_fields': []
+        'only_fields': [],
+        # 每条UNWIND语句写入行数
+        # 'write_batch_size': 5000,
+        # 写入关系：起止节点按字段匹配，其余字段作为关系属性
+        # 'write_type': 'relation',
+        # 'relation': {'type': 'NEXT', 'start_fields': {'time': 'time'}, 'end_fields': {'time': 'next_time'}},
     }
 }
 _, writer = get_writer(load_info)
@@ -28,6 +28,19 @@ task_params = {
         },
         'extract_info': {
             'batch_size': 100,  # 每批读取数量
+            # 分批方式，offset: 偏移量分页(默认)，seek: 按主键或seek_field游标分页，适合大表
+            # stream: 服务端游标流式读取，不构建orm对象
+            # 'batch_mode': 'seek',
+            # 'seek_field': 'id',
+            # stream模式返回格式，records: 字典列表(默认)，dataframe: pandas DataFrame，arrow: pyarrow RecordBatch
+            # dataframe批数据可直接用于向量化处理规则；arrow批数据在配置处理规则时先转为字典列表；装载前统一转为字典列表
+            # 'stream_format': 'records',
+            # 总数计算方式，exact: 精确计数(默认)，approx: 表级估算值，none: 不计数
+            # 'total_type': 'approx',
+            # 增量抽取水位字段，按该字段升序只读取上次检查点之后的数据，每批装载成功后推进检查点
+            # 支持数据库表、es索引、mongo集合、influxdb表(仅time)，首次运行无检查点时从watermark_start开始
+            # 'watermark_field': 'update_time',
+            # 'watermark_start': '2024-01-01 00:00:00',
             # 查询过滤条件 close >= 20000 and high < 40000
             # 可简化为字典形式 'extract_rules': {"get[close]": 30000, "lt[high]": 40000}
             'extract_rules': [
@@ -36,6 +49,12 @@ task_params = {
             ]
         }
     },
+    # 执行模式，serial: 串行(默认)，pipeline: 抽取、转换、装载多线程流水线执行
+    # 'run_mode': 'pipeline',
+    # 'pipeline_conf': {'queue_size': 4, 'load_workers': 2, 'keep_order': False},
+    # 水位检查点键，调度任务默认为任务id，直接运行时按抽取、装载模型及水位字段生成；检查点文件目录，默认当前目录.etl_checkpoints
+    # 'checkpoint_key': 'btc_history_to_kafka',
+    # 'checkpoint_path': '/data/etl_checkpoints',
     'process_rules': [  # 转换流程列表及参数
         {
             "code": "gen_records_list",
@@ -28,7 +28,8 @@ task_params = {
         },
         'extract_info': {
             'extract_type': 'flow',  # 处理类型为流式处理
-            'batch_size': 1,
+            'batch_size': 100,  # 微批处理，每批最多100条
+            'max_wait_ms': 1000,  # 每批最长等待1000毫秒
             'extract_rules': []
         }
     },
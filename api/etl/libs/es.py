@@ -43,6 +43,13 @@ class EsClient(object):
         l_result = self.base_query(index=p_index, body=p_query, headers=headers)
         return l_result['hits'].get('total')
 
+    def count(self, index_name, query=None):
+        """
+        按查询条件统计文档数
+        """
+        body = {'query': query} if query else None
+        return self._client.count(index=index_name, body=body)['count']
+
     def query_data(self, p_index, p_query, headers=None):
         """
         常用计数函数
@@ -167,30 +174,68 @@ class EsClient(object):
             request_timeout=600)
         return result
 
-    def scroll_search(self, index_name, query_dict):
+    def scroll_search(self, index_name, query_dict, scroll='1m'):
         '''
         针对大量数据使用scroll迭代查询
         :param index_name:
         :param query_dict:
+        :param scroll: scroll上下文保留时间
         :return:
         '''
         result = self._client.search(
             index=index_name,
             body=query_dict,
-            scroll="1m",
+            scroll=scroll,
             request_timeout=600)
         return result
 
-    def scroll(self, sid):
+    def scroll(self, sid, scroll='10m'):
         '''
         根据scroll id查询
         :param sid:
+        :param scroll: scroll上下文保留时间
         :return:
         '''
         result = self._client.scroll(
-            scroll_id=sid, scroll='10m', request_timeout=600)
+            scroll_id=sid, scroll=scroll, request_timeout=600)
         return result
 
+    def clear_scroll(self, sid):
+        '''
+        清除scroll上下文，释放服务端资源
+        :param sid:
+        :return:
+        '''
+        try:
+            return self._client.clear_scroll(body={'scroll_id': [sid]}, ignore=(404,))
+        except Exception as e:
+            print(e)
+
+    def iter_scroll(self, index_name, query_dict, scroll='5m', slice_id=None, slice_max=None):
+        '''
+        scroll迭代查询生成器，逐页返回结果，结束或中断时清除scroll上下文
+        :param index_name:
+        :param query_dict:
+        :param scroll: scroll上下文保留时间
+        :param slice_id: 切片序号，与slice_max同时设置时使用sliced scroll只读取该切片
+        :param slice_max: 切片总数
+        :return:
+        '''
+        query_dict = dict(query_dict)
+        if slice_max is not None and slice_max > 1:
+            query_dict['slice'] = {'id': slice_id, 'max': slice_max}
+        sid = None
+        try:
+            result = self.scroll_search(index_name, query_dict, scroll=scroll)
+            sid = result.get('_scroll_id')
+            while result['hits']['hits']:
+                yield result
+                result = self.scroll(sid, scroll=scroll)
+                sid = result.get('_scroll_id', sid)
+        finally:
+            if sid:
+                self.clear_scroll(sid)
+
     def deleteAllDocByIndex(self, index_name):
         '''
         根据索引删除所有记录
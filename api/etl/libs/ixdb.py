@@ -5,6 +5,7 @@
 import time
 import pandas as pd
 from influxdb import InfluxDBClient
+from influxdb.exceptions import InfluxDBClientError
 
 
 class IxClient(object):
@@ -102,8 +103,31 @@ class IxClient(object):
             kwargs['epoch'] = 's'
         return pd.DataFrame(self.query_as_points(p_sql, **kwargs))
 
-    def write_points(self, p_points):
-        self._client.write_points(p_points, batch_size=5000)
+    def write_points(self, p_points, batch_size=5000, retry=3, retry_interval=1, **kwargs):
+        """
+        按batch_size分块写入，单块失败时指数退避重试，已写入的块不重复写入
+        :param retry: 每块最大重试次数
+        :param retry_interval: 首次重试间隔秒数，之后每次翻倍
+        :param kwargs: 透传write_points参数，如time_precision、tags
+        """
+        for start in range(0, len(p_points), batch_size):
+            chunk = p_points[start:start + batch_size]
+            attempt = 0
+            while True:
+                try:
+                    self._client.write_points(chunk, **kwargs)
+                    break
+                except InfluxDBClientError as e:
+                    # 数据格式等客户端错误重试无效，服务端错误(5xx)及限流(429)重试
+                    if (e.code is not None and e.code < 500 and e.code != 429) or attempt >= retry:
+                        raise e
+                except Exception as e:
+                    if attempt >= retry:
+                        raise e
+                print(f'influxdb写入失败，第{attempt + 1}次重试')
+                time.sleep(retry_interval * 2 ** attempt)
+                attempt += 1
+        return len(p_points)
 
 
 class IxOutput(object):
@@ -5,6 +5,32 @@ neo4j 操作封装类
 from py2neo import Graph, Node, Relationship
 import time
 
+# UNWIND批量写入时单条语句的默认行数
+WRITE_BATCH_SIZE = 5000
+
+
+def escape_name(name):
+    """
+    转义label、关系类型、属性名，用于拼接cypher
+    """
+    return '`' + str(name).replace('`', '``') + '`'
+
+
+def gen_labels_str(p_labels):
+    """
+    生成label字符串，如 :`A`:`B`
+    """
+    if isinstance(p_labels, str):
+        p_labels = [p_labels]
+    return ''.join(f':{escape_name(i)}' for i in p_labels if i)
+
+
+def gen_key_map(p_keys, p_row='row'):
+    """
+    生成属性匹配字符串，如 {`name`: row.`name`}
+    """
+    return '{' + ', '.join(f'{escape_name(k)}: {p_row}.{escape_name(k)}' for k in p_keys) + '}'
+
 
 class NjClient(object):
     def __init__(self, p_url, **kwargs):
@@ -24,6 +50,12 @@ class NjClient(object):
     def query(self, p_query):
         return self._client.run(p_query).data()
 
+    def query_params(self, p_query, **p_params):
+        """
+        参数化查询
+        """
+        return self._client.run(p_query, **p_params).data()
+
     def find(self, p_labels, p_properties):
         return self._client.nodes.match(*p_labels, **p_properties)
 
@@ -142,4 +174,70 @@ class NjClient(object):
         relation = Relationship(start_node, label, end_node, **relation_info)
         return self._client.create(relation)
 
+    def run_batch(self, p_query, p_rows, p_batch_size=WRITE_BATCH_SIZE):
+        """
+        参数化批量执行，每批rows作为$rows参数执行一次语句
+        p_query 包含 UNWIND $rows AS row 的cypher语句
+        """
+        for start in range(0, len(p_rows), p_batch_size):
+            self._client.run(p_query, rows=p_rows[start:start + p_batch_size])
+        return len(p_rows)
+
+    def create_nodes(self, p_labels, p_rows, p_batch_size=WRITE_BATCH_SIZE):
+        """
+        批量创建节点
+        p_rows 节点属性字典列表
+        """
+        query = f"UNWIND $rows AS row CREATE (n{gen_labels_str(p_labels)}) SET n = row"
+        return self.run_batch(query, p_rows, p_batch_size)
 
+    def merge_nodes(self, p_labels, p_key_fields, p_rows, p_create=True, p_batch_size=WRITE_BATCH_SIZE):
+        """
+        按唯一属性批量更新节点，p_create为True时不存在则创建
+        p_key_fields 确定节点唯一性属性
+        """
+        action = 'MERGE' if p_create else 'MATCH'
+        query = f"UNWIND $rows AS row {action} (n{gen_labels_str(p_labels)} {gen_key_map(p_key_fields)}) SET n += row"
+        return self.run_batch(query, p_rows, p_batch_size)
+
+    def merge_relations(self, p_type, p_start_labels, p_start_keys, p_end_labels, p_end_keys, p_rows,
+                        p_action='MERGE', p_batch_size=WRITE_BATCH_SIZE):
+        """
+        批量创建或更新关系，起止节点按唯一属性匹配，不存在的节点跳过
+        p_rows [{'start': {起点属性}, 'end': {终点属性}, 'properties': {关系属性}}]
+        p_action CREATE 直接创建，MERGE 不存在则创建，MATCH 只更新已有关系
+        """
+        query = f"""UNWIND $rows AS row
+MATCH (a{gen_labels_str(p_start_labels)} {gen_key_map(p_start_keys, 'row.start')})
+MATCH (b{gen_labels_str(p_end_labels)} {gen_key_map(p_end_keys, 'row.end')})
+{p_action} (a)-[r:{escape_name(p_type)}]->(b) SET r += row.properties"""
+        return self.run_batch(query, p_rows, p_batch_size)
+
+    def iter_query(self, p_query, p_batch_size=1000, **p_params):
+        """
+        单个查询游标流式读取，按批返回记录列表
+        """
+        cursor = self._client.run(p_query, **p_params)
+        records = []
+        for record in cursor:
+            records.append(record)
+            if len(records) >= p_batch_size:
+                yield records
+                records = []
+        if records:
+            yield records
+
+    def iter_nodes(self, p_labels, p_where='', p_batch_size=1000, p_start_id=None, **p_params):
+        """
+        按内部id升序流式读取节点，按批返回节点列表
+        p_where 额外筛选条件，节点变量为n
+        p_start_id 从该内部id之后开始读取，用于中断后续读
+        """
+        conditions = [p_where] if p_where else []
+        if p_start_id is not None:
+            conditions.append('id(n) > $start_id')
+            p_params['start_id'] = p_start_id
+        where_str = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = f"MATCH (n{gen_labels_str(p_labels)}) {where_str} RETURN n ORDER BY id(n)"
+        for records in self.iter_query(query, p_batch_size, **p_params):
+            yield [record['n'] for record in records]
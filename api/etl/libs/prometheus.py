@@ -2,17 +2,30 @@
 """
 @Description: prometheus 操作封装类
 """
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+from requests.adapters import HTTPAdapter
 from prometheus_api_client import PrometheusConnect
 
+# 单序列单次区间查询最大点数，prometheus默认上限11000
+MAX_RANGE_POINTS = 10000
+
 
 class PrometheusClient(object):
     """
     Prometheus 查询封装
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, pool_size=10, **kwargs):
         self._client = PrometheusConnect(**kwargs)
+        # 扩大连接池，保证并发分片查询复用长连接
+        session = getattr(self._client, '_session', None)
+        if session is not None:
+            max_retries = session.get_adapter(self._client.url).max_retries
+            session.mount(self._client.url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                                        max_retries=max_retries))
 
     def conn_test(self):
         return self._client.check_prometheus_connection()
@@ -25,10 +38,72 @@ class PrometheusClient(object):
 
     def query(self, p_sql, **kwargs):
         """
-        返回查询结果列表
+        返回查询结果列表，有start_time及end_time时执行区间查询
         """
+        if kwargs.get('start_time') is not None and kwargs.get('end_time') is not None:
+            return self.query_range(p_sql, kwargs['start_time'], kwargs['end_time'], kwargs.get('step', 60))
         return self._client.custom_query(query=p_sql)
 
+    def query_range(self, p_sql, start_time, end_time, step=60):
+        """
+        区间查询
+        :param start_time: 开始时间戳(秒)
+        :param end_time: 结束时间戳(秒)
+        :param step: 步长秒数
+        :return: [{'metric': {...}, 'values': [[时间戳, 值], ...]}]
+        """
+        return self._client.custom_query_range(query=p_sql,
+                                               start_time=datetime.datetime.fromtimestamp(start_time),
+                                               end_time=datetime.datetime.fromtimestamp(end_time),
+                                               step=str(step))
+
+    def format_step(self, step):
+        """
+        步长取整为秒，查询时间按秒传递，非整数步长会使分片无法对齐
+        """
+        return max(int(round(float(step))), 1)
+
+    def gen_range_shards(self, start_time, end_time, step=60, max_points=MAX_RANGE_POINTS):
+        """
+        按步长对齐切分区间，每个分片每条序列不超过max_points个点，分片间首尾相接不重复
+        起止时间及步长均取整为秒
+        :return: [(分片开始, 分片结束)]
+        """
+        step = self.format_step(step)
+        start_time = int(start_time)
+        end_time = int(end_time)
+        total_points = (end_time - start_time) // step + 1
+        shards = []
+        for i in range(0, total_points, max_points):
+            shard_start = start_time + i * step
+            shard_end = start_time + (min(i + max_points, total_points) - 1) * step
+            shards.append((shard_start, shard_end))
+        return shards
+
+    def iter_query_range(self, p_sql, start_time, end_time, step=60, max_points=MAX_RANGE_POINTS, workers=4):
+        """
+        分片并发区间查询，按时间顺序逐个分片返回结果，预读分片数有上限以控制内存
+        :param workers: 并发查询数
+        :return: 分片查询结果生成器
+        """
+        step = self.format_step(step)
+        shards = iter(self.gen_range_shards(start_time, end_time, step, max_points))
+        executor = ThreadPoolExecutor(max_workers=max(int(workers), 1))
+        futures = deque()
+        try:
+            for shard_start, shard_end in shards:
+                futures.append(executor.submit(self.query_range, p_sql, shard_start, shard_end, step))
+                if len(futures) >= workers * 2:
+                    break
+            while futures:
+                result = futures.popleft().result()
+                shard = next(shards, None)
+                if shard is not None:
+                    futures.append(executor.submit(self.query_range, p_sql, shard[0], shard[1], step))
+                yield result
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def query_metric_value(self, metric_name, label_config, **kwargs):
         """
         返回查询结果列表
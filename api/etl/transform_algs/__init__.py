@@ -1,5 +1,6 @@
 from etl.transform_algs import filter_algs, count_algs, map_algs, content_algs
-from etl.transform_algs.content_algs import df_to_data
+from etl.transform_algs.content_algs import df_to_data, records_to_df, df_to_records, compile_code_transform
+from etl.utils.common_utils import parse_json, parse_to_list
 
 # 算法字典
 transform_alg_dict = {
@@ -25,3 +26,53 @@ transform_alg_dict = {
     # 统计聚合类算法
     'group_agg_count': count_algs.group_agg_count
 }
+
+# 支持dataframe向量化处理的算法，转换链全部由这些算法组成时，批数据只转换一次dataframe
+df_alg_codes = {
+    'df_to_data',
+    'map_field_names',
+    'map_values',
+    'trans_time_format',
+    'trans_field_type',
+    'gen_only_id',
+    'add_field',
+    'empty_to_null',
+    'group_agg_count',
+}
+
+# 算法配置预解析，(列表参数, json参数)，任务初始化时解析一次，避免每批数据重复解析
+rule_parse_dict = {
+    'gen_records_list': (['fields'], []),
+    'gen_contents_first': (['fields'], []),
+    'map_field_names': ([], ['field_map']),
+    'map_values': (['fields'], ['value_map']),
+    'trans_time_format': (['fields'], []),
+    'trans_field_type': (['fields'], []),
+    'gen_only_id': (['only_fields'], []),
+    'clean_empty': (['fields'], []),
+    'empty_to_null': (['fields'], []),
+    'group_agg_count': (['group_fields'], []),
+}
+
+
+def compile_rule_dict(method_code, rule_dict):
+    '''
+    预解析转换规则配置，返回解析后的配置副本，自定义代码预编译为transform函数
+    :param method_code: 算法代码
+    :param rule_dict: 规则配置
+    :return:
+    '''
+    rule_dict = dict(rule_dict or {})
+    list_keys, json_keys = rule_parse_dict.get(method_code, ([], []))
+    for k in list_keys:
+        if k in rule_dict:
+            rule_dict[k] = parse_to_list(rule_dict[k])
+    for k in json_keys:
+        if k in rule_dict:
+            rule_dict[k] = parse_json(rule_dict[k])
+    if method_code == 'code_transform' and rule_dict.get('language', 'python') == 'python':
+        flag, transform = compile_code_transform(rule_dict.get('code'))
+        if not flag:
+            return False, transform
+        rule_dict['_transform'] = transform
+    return True, rule_dict
@@ -28,12 +28,14 @@ def code_transform(source_data=[], rule_dict={}, context={}):
     :return:
     '''
     language = rule_dict.get('language', 'python')
-    code = trans_rule_value(rule_dict.get('code'))
-    if not code:
-        return False, '代码不能为空'
     if language == 'python':
         try:
-            exec(code, globals())
+            # 优先使用预编译的transform函数
+            transform = rule_dict.get('_transform')
+            if transform is None:
+                flag, transform = compile_code_transform(rule_dict.get('code'))
+                if not flag:
+                    return False, transform
             # 调用动态代码中transform函数转换数据
             results = transform(source_data)
             return True, results
@@ -42,6 +44,23 @@ def code_transform(source_data=[], rule_dict={}, context={}):
     return False, '处理失败'
 
 
+def compile_code_transform(code):
+    '''
+    在独立命名空间中执行自定义代码，返回其中的transform函数
+    :param code:
+    :return:
+    '''
+    code = trans_rule_value(code)
+    if not code:
+        return False, '代码不能为空'
+    namespace = {}
+    exec(compile(code, '<code_transform>', 'exec'), namespace)
+    transform = namespace.get('transform')
+    if not callable(transform):
+        return False, '代码中未定义transform函数'
+    return True, transform
+
+
 def data_to_df(source_data=[], rule_dict={}, context={}):
     '''
     将数据转为dataframe
@@ -85,6 +104,22 @@ def df_to_data(source_data=[], rule_dict={}, context={}):
         return False, str(e)[:500]
 
 
+def records_to_df(records):
+    '''
+    字典列表转为dataframe，使用object类型保留原始值，便于无损转回
+    '''
+    import pandas as pd
+    return pd.DataFrame(records, dtype=object)
+
+
+def df_to_records(df):
+    '''
+    dataframe转为字典列表，空值转为None
+    '''
+    df = df.astype(object)
+    return df.where(df.notna(), None).to_dict(orient='records')
+
+
 def gen_records_list(source_data=[], rule_dict={}, context={}):
     '''
     解析接口返回内容列表信息
@@ -40,7 +40,8 @@ def empty_to_null(source_data={}, rule_dict={}, context={}):
         if fields == []:
             fields = source_data.columns
         for k in fields:
-            source_data[k] = source_data[k].apply(lambda x: None if x == '' else x)
+            if k in source_data.columns:
+                source_data[k] = source_data[k].where(source_data[k] != '', None)
     return True, source_data
 
 
@@ -1,9 +1,32 @@
 '''
 映射类转换算法，字段映射，值映射
 '''
+import warnings
+import pandas as pd
 from etl.utils.common_utils import format_date, md5, trans_rule_value, parse_json, parse_to_list, trans_value_type
 
 
+def parse_datetime_series(series, source_format=None):
+    '''
+    向量化解析日期列，无法批量解析的值逐个使用format_date兜底
+    :param series:
+    :param source_format: 原始日期格式，为空时自动推断
+    :return:
+    '''
+    if pd.api.types.infer_dtype(series, skipna=True) not in ['string', 'datetime', 'datetime64', 'date', 'empty']:
+        # 数值时间戳按本地时区转换，与format_date保持一致
+        return pd.to_datetime(series.apply(lambda x: format_date(x, res_type='datetime')), errors='coerce')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        parsed = pd.to_datetime(series, format=source_format, errors='coerce')
+    failed = parsed.isna() & series.notna()
+    if failed.any():
+        parsed = parsed.astype(object)
+        parsed[failed] = series[failed].apply(lambda x: format_date(x, res_type='datetime'))
+        parsed = pd.to_datetime(parsed, errors='coerce')
+    return parsed
+
+
 def map_field_names(source_data={}, rule_dict={}, context={}):
     '''
     字段映射
@@ -104,7 +127,9 @@ def map_values(source_data={}, rule_dict={}, context={}):
         for field in fields:
             if field in source_data.columns:
                 try:
-                    source_data[field] = source_data[field].apply(lambda x: value_map.get(x, x))
+                    keys = source_data[field].astype(str)
+                    mask = keys.isin(value_map.keys())
+                    source_data[field] = source_data[field].where(~mask, keys.map(value_map))
                 except Exception as e:
                     return False, str(e)[:500]
     return True, source_data
@@ -131,12 +156,21 @@ def trans_time_format(source_data={}, rule_dict={}, context={}):
         "required": true,
         "default": "%Y-%m-%d %H:%M:%S",
         "tips": ""
+      },
+      {
+        "name": "原始日期格式",
+        "value": "source_format",
+        "form_type": "input",
+        "required": false,
+        "default": "",
+        "tips": "dataframe处理时指定可加快解析"
       }
     ]
     :return:
     '''
     fields = parse_to_list(rule_dict.get('fields', ''))
     time_format = rule_dict.get('format', '%Y-%m-%d %H:%M:%S')
+    source_format = rule_dict.get('source_format') or None
     if not fields:
         return False, '缺少必填参数：处理字段'
     if isinstance(source_data, list):
@@ -160,12 +194,58 @@ def trans_time_format(source_data={}, rule_dict={}, context={}):
         for field in fields:
             if field in source_data.columns:
                 try:
-                    source_data[field] = source_data[field].apply(lambda x: format_date(x, format=time_format))
+                    parsed = parse_datetime_series(source_data[field], source_format)
+                    source_data[field] = parsed.dt.strftime(time_format).astype(object).where(parsed.notna(), None)
                 except Exception as e:
                     return False, str(e)[:500]
     return True, source_data
 
 
+def trans_series_type(series, trans_type='str'):
+    '''
+    向量化转换列类型，无法转换的值保留原值，与trans_value_type保持一致
+    :param series:
+    :param trans_type:
+    :return:
+    '''
+    if trans_type == 'str':
+        return series.astype(str)
+    if trans_type == 'int':
+        # 与int()一致：'3.5'等非整数字符串保留原值，数值截断取整，结果为python int
+        if pd.api.types.is_numeric_dtype(series) and series.notna().all():
+            return series.astype('int64')
+        values = pd.to_numeric(series, errors='coerce')
+        ok = values.notna() & values.abs().ne(float('inf'))
+        if series.dtype == object:
+            try:
+                # 字符串需为整数形式，非字符串元素的结果为NaN，按数值截断处理
+                ok &= series.str.fullmatch(r'\s*[+-]?\d+\s*').ne(False)
+            except AttributeError:
+                pass
+        if ok.all():
+            return values.astype('int64')
+        result = series.astype(object)
+        result[ok] = values[ok].astype('int64').astype(object)
+        return result
+    if trans_type == 'float':
+        values = pd.to_numeric(series, errors='coerce')
+        ok = values.notna()
+        values = values[ok].astype('float64')
+        if ok.all():
+            return values
+        result = series.astype(object)
+        result[ok] = values
+        return result
+    if trans_type in ['date', 'datetime']:
+        parsed = parse_datetime_series(series)
+        if trans_type == 'datetime':
+            values = parsed.astype(object)
+        else:
+            values = parsed.dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+        return values.where(parsed.notna(), None)
+    return series.apply(lambda x: trans_value_type(x, trans_type))
+
+
 def trans_field_type(source_data={}, rule_dict={}, context={}):
     '''
     转换字段格式
@@ -223,7 +303,7 @@ def trans_field_type(source_data={}, rule_dict={}, context={}):
         for field in fields:
             if field in source_data.columns:
                 try:
-                    source_data[field] = source_data[field].apply(lambda x: trans_value_type(x, trans_type))
+                    source_data[field] = trans_series_type(source_data[field], trans_type)
                 except Exception as e:
                     return False, str(e)[:500]
     return True, source_data
@@ -248,11 +328,23 @@ def gen_only_id(source_data={}, rule_dict={}, context={}):
         "required": true,
         "default": "_id",
         "tips": ""
+    },{
+        "name": "哈希方式",
+        "value": "hash_type",
+        "form_type": "select",
+        "required": false,
+        "default": "md5",
+        "options": [
+            {"label": "md5", "value": "md5"},
+            {"label": "快速哈希(仅dataframe)", "value": "fast"}
+        ],
+        "tips": "快速哈希生成16位十六进制id，与md5结果不同"
     }]
     :return:
     '''
     only_fields = parse_to_list(rule_dict.get('only_fields', ''))
     output_field = rule_dict.get('output_field')
+    hash_type = rule_dict.get('hash_type', 'md5')
     if only_fields == []:
         return False, '唯一字段列表不能为空'
     if not output_field:
@@ -275,11 +367,15 @@ def gen_only_id(source_data={}, rule_dict={}, context={}):
     else:
         # dataframe处理
         try:
-            source_data[output_field] = ''
-            for field in only_fields:
-                if field in source_data.columns:
-                    source_data[output_field] += source_data[field].apply(lambda x: str(x))
-            source_data[output_field] = source_data[output_field].apply(lambda x: md5(x))
+            fields = [field for field in only_fields if field in source_data.columns]
+            if hash_type == 'fast':
+                hashes = pd.util.hash_pandas_object(source_data[fields], index=False)
+                source_data[output_field] = [f'{h:016x}' for h in hashes]
+            else:
+                keys = pd.Series('', index=source_data.index)
+                for field in fields:
+                    keys = keys.str.cat(source_data[field].astype(str))
+                source_data[output_field] = [md5(k) for k in keys]
         except Exception as e:
             return False, str(e)[:500]
     return True, source_data
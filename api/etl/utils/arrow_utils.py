@@ -0,0 +1,177 @@
+'''
+parquet、arrow ipc文件数据集相关工具函数
+'''
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+from etl.utils.common_utils import trans_rule_value, gen_uuid
+
+# 文件格式对应的pyarrow dataset格式及文件后缀
+format_dict = {
+    'parquet': ('parquet', 'parquet'),
+    'arrow': ('ipc', 'arrow'),
+}
+
+
+def get_minio_filesystem(conn_conf):
+    '''
+    根据minio连接信息生成pyarrow S3文件系统
+    :param conn_conf:
+    :return:
+    '''
+    return fs.S3FileSystem(
+        access_key=conn_conf.get('username'),
+        secret_key=conn_conf.get('password'),
+        endpoint_override=conn_conf.get('url'),
+        scheme='http'
+    )
+
+
+def open_dataset(path, file_format='parquet', filesystem=None):
+    '''
+    打开单个文件或分区目录数据集，目录按hive风格分区解析
+    :param path: 文件或目录路径
+    :param file_format: parquet 或 arrow
+    :param filesystem: 文件系统，默认本地
+    :return:
+    '''
+    return ds.dataset(path, format=format_dict[file_format][0], filesystem=filesystem, partitioning='hive')
+
+
+def gen_dataset_filter(dataset, extract_rules):
+    '''
+    将筛选规则转为dataset过滤表达式，下推至行组统计信息过滤
+    :param dataset:
+    :param extract_rules:
+    :return:
+    '''
+    expr = None
+    schema = dataset.schema
+    for i in extract_rules:
+        field = i.get('field')
+        rule = i.get('rule')
+        value = trans_rule_value(i.get('value'))
+        if not field or not value or field not in schema.names:
+            continue
+        # 筛选值按字段类型转换，避免字符串与数值比较出错
+        try:
+            value = pa.scalar(value).cast(schema.field(field).type)
+        except Exception as e:
+            print(e)
+        column = ds.field(field)
+        if rule in ['equal', 'eq']:
+            cond = column == value
+        elif rule in ['f_equal', 'neq']:
+            cond = column != value
+        elif rule == 'gt':
+            cond = column > value
+        elif rule == 'gte':
+            cond = column >= value
+        elif rule == 'lt':
+            cond = column < value
+        elif rule == 'lte':
+            cond = column <= value
+        else:
+            continue
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def format_arrow_df(df):
+    '''
+    arrow转出的dataframe日期转字符串，空值填充空字符串，与其他文件模型保持一致
+    '''
+    for col in df.select_dtypes(include=['datetime', 'datetimetz']).columns:
+        df[col] = df[col].astype(str)
+    df.fillna("", inplace=True)
+    return df
+
+
+def iter_dataset_dfs(dataset, extract_rules, columns=None, batch_size=10000):
+    '''
+    按批流式读取数据集，只读取所需字段，筛选条件下推
+    :param dataset:
+    :param extract_rules: 筛选规则
+    :param columns: 读取字段列表，为空时读取全部字段
+    :param batch_size: 每批最大行数
+    :return:
+    '''
+    scanner = dataset.scanner(columns=columns or None, filter=gen_dataset_filter(dataset, extract_rules),
+                              batch_size=batch_size)
+    for batch in scanner.to_batches():
+        if batch.num_rows > 0:
+            yield format_arrow_df(batch.to_pandas())
+
+
+def read_dataset_df(dataset, extract_rules, columns=None, limit=None):
+    '''
+    读取数据集为dataframe
+    :param limit: 最大行数，为空时读取全部
+    :return:
+    '''
+    scanner = dataset.scanner(columns=columns or None, filter=gen_dataset_filter(dataset, extract_rules))
+    table = scanner.head(limit) if limit else scanner.to_table()
+    return format_arrow_df(table.to_pandas())
+
+
+def gen_write_schema(table):
+    '''
+    生成新数据集的写入schema，全为空值的字段(null类型)按字符串写入，避免后续批次有值时类型冲突
+    '''
+    return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+
+
+def conform_table(table, schema):
+    '''
+    按已有数据集schema转换数据，缺少的字段补空值，字段类型按schema转换
+    '''
+    extra_fields = [i for i in table.schema.names if i not in schema.names]
+    if extra_fields:
+        raise ValueError(f'字段{",".join(extra_fields)}不在已有数据集字段中')
+    columns = []
+    for field in schema:
+        if field.name in table.schema.names:
+            columns.append(table.column(field.name).cast(field.type))
+        else:
+            columns.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def write_dataset_records(records, path, file_format='parquet', filesystem=None, partition_cols=None, schema=None):
+    '''
+    写入数据，path作为数据集目录(以文件后缀结尾时同样作为目录)，每次写入追加一个新的分片文件，
+    分批装载时各批数据均保留，可按字段hive风格分区；各分片使用同一schema，保证数据集可读取
+    :param records: 字典列表
+    :param path: 目录路径
+    :param file_format: parquet 或 arrow
+    :param filesystem: 文件系统，默认本地
+    :param partition_cols: 分区字段列表
+    :param schema: 写入schema，为空时使用已有数据集schema，新数据集按本批数据生成
+    :return: 写入使用的schema，后续批次传入复用
+    '''
+    ds_format, suffix = format_dict[file_format]
+    if filesystem is None:
+        filesystem = fs.LocalFileSystem()
+    if schema is None:
+        file_info = filesystem.get_file_info(path)
+        if file_info.type == fs.FileType.File:
+            raise ValueError(f'{path}为已存在的单个文件，无法追加写入')
+        if file_info.type == fs.FileType.Directory:
+            dataset = open_dataset(path, file_format, filesystem)
+            if dataset.files:
+                schema = dataset.schema
+    table = pa.Table.from_pylist(records)
+    if schema is None:
+        schema = gen_write_schema(table)
+    table = conform_table(table, schema)
+    ds.write_dataset(
+        table,
+        base_dir=path,
+        format=ds_format,
+        filesystem=filesystem,
+        partitioning=partition_cols or None,
+        partitioning_flavor='hive' if partition_cols else None,
+        basename_template=f'part-{gen_uuid(res_type="base")}-{{i}}.{suffix}',
+        existing_data_behavior='overwrite_or_ignore'
+    )
+    return schema
@@ -0,0 +1,184 @@
+'''
+增量抽取水位检查点工具
+'''
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import threading
+
+
+def encode_watermark(value):
+    '''
+    水位值转为可json序列化的检查点值，日期时间类型带类型标记
+    '''
+    if value is None:
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (datetime.date, decimal.Decimal)):
+        # numpy标量
+        value = value.item()
+    if isinstance(value, datetime.datetime):
+        return {'type': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'type': 'date', 'value': value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {'type': 'decimal', 'value': str(value)}
+    return {'type': 'raw', 'value': value}
+
+
+def decode_watermark(checkpoint):
+    '''
+    检查点值还原为水位值
+    '''
+    if checkpoint is None:
+        return None
+    if not isinstance(checkpoint, dict) or 'type' not in checkpoint:
+        return checkpoint
+    value_type = checkpoint['type']
+    value = checkpoint.get('value')
+    if value_type == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    if value_type == 'date':
+        return datetime.date.fromisoformat(value)
+    if value_type == 'decimal':
+        return decimal.Decimal(value)
+    return value
+
+
+def get_batch_watermark(data, field):
+    '''
+    获取一批抽取数据中水位字段的最大值
+    :param data: 抽取结果，{'records': [...]}、字典列表、DataFrame或arrow RecordBatch，读取时已返回watermark的直接使用
+    :param field: 水位字段
+    :return: 最大水位值，无数据时返回None
+    '''
+    if isinstance(data, dict):
+        if data.get('watermark') is not None:
+            return data['watermark']
+        data = data.get('records', [])
+    if data is None:
+        return None
+    if isinstance(data, list):
+        values = [i.get(field) for i in data if isinstance(i, dict) and i.get(field) is not None]
+        return max(values) if values else None
+    if hasattr(data, 'schema') and hasattr(data, 'column'):
+        # arrow RecordBatch/Table
+        import pyarrow.compute as pc
+        return pc.max(data.column(field)).as_py()
+    if hasattr(data, 'columns'):
+        # pandas DataFrame
+        if len(data) == 0 or field not in data.columns:
+            return None
+        value = data[field].max()
+        return None if value != value else value
+    return None
+
+
+def gen_checkpoint_key(task_params, watermark_field):
+    '''
+    生成检查点键，调度任务默认以任务id作为checkpoint_key
+    未配置checkpoint_key时(如直接调用etl_task_process)按抽取、装载配置及水位字段生成，配置变化后重新开始
+    '''
+    checkpoint_key = task_params.get('checkpoint_key')
+    if checkpoint_key:
+        return str(checkpoint_key)
+    extract = task_params.get('extract', {})
+    load = task_params.get('load') or {}
+    model_keys = ['source', 'model', 'datasource_id', 'model_id']
+    key_info = {
+        'extract': {k: v for k, v in extract.items() if k in model_keys},
+        'extract_rules': extract.get('extract_info', extract).get('extract_rules', []),
+        'watermark_field': watermark_field,
+        'load': {k: v for k, v in load.items() if k in model_keys},
+    }
+    key_str = json.dumps(key_info, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(key_str.encode('utf-8')).hexdigest()
+
+
+class CheckpointStore(object):
+    '''
+    进程内检查点存储
+    '''
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        return decode_watermark(self._data.get(key))
+
+    def set(self, key, value):
+        self._data[key] = encode_watermark(value)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+
+class FileCheckpointStore(CheckpointStore):
+    '''
+    本地文件检查点存储，每个检查点一个json文件，先写临时文件再替换保证原子性
+    '''
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or os.environ.get('ETL_CHECKPOINT_PATH', os.path.join(os.getcwd(), '.etl_checkpoints'))
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        return os.path.join(self.path, f'{key}.json')
+
+    def get(self, key):
+        try:
+            with open(self._file(key), 'r', encoding='utf-8') as f:
+                return decode_watermark(json.load(f).get('watermark'))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(e)
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            file_path = self._file(key)
+            tmp_path = f'{file_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'watermark': encode_watermark(value),
+                           'update_time': datetime.datetime.now().isoformat()}, f)
+            os.replace(tmp_path, file_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+
+class WatermarkTracker(object):
+    '''
+    按批次序号跟踪已装载批次，仅当之前批次全部装载成功时推进水位，保证乱序装载时检查点不越过未写入数据
+    '''
+    def __init__(self, store, key, start=None):
+        self.store = store
+        self.key = key
+        self.watermark = start
+        self._next_seq = 0
+        self._done = {}
+        self._lock = threading.Lock()
+
+    def commit(self, seq, watermark):
+        '''
+        标记批次装载成功，返回是否推进了检查点
+        :param seq: 批次序号，从0开始连续递增
+        :param watermark: 该批次最大水位值
+        '''
+        with self._lock:
+            self._done[seq] = watermark
+            advanced = False
+            while self._next_seq in self._done:
+                value = self._done.pop(self._next_seq)
+                self._next_seq += 1
+                if value is not None and (self.watermark is None or value > self.watermark):
+                    self.watermark = value
+                    advanced = True
+            if advanced:
+                self.store.set(self.key, self.watermark)
+            return advanced
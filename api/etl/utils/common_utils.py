@@ -3,7 +3,9 @@
 '''
 import hashlib
 import os.path
+import queue
 import re
+import threading
 import time
 import json
 import requests
@@ -669,3 +671,127 @@ def df_to_list(df):
     return data_li
 
 
+class _IterError(object):
+    '''
+    后台读取线程中的异常
+    '''
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_micro_batches(iterable, batch_size=1000, max_wait_ms=1000):
+    '''
+    将逐条阻塞产出的迭代器聚合为批，达到batch_size条或首条数据等待max_wait_ms毫秒后产出一批
+    源迭代器在后台线程中读取，保证等待时间不受阻塞读取影响，调用方提前结束迭代时通知线程停止并关闭源迭代器
+    :param iterable: 源迭代器
+    :param batch_size: 每批最大数量
+    :param max_wait_ms: 每批最长等待毫秒数
+    :return:
+    '''
+    q = queue.Queue(maxsize=batch_size * 2)
+    stop_event = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    break
+        except Exception as e:
+            put(_IterError(e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        put(end)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    batch = []
+    deadline = None
+    try:
+        while True:
+            timeout = max(deadline - time.time(), 0) if batch else None
+            try:
+                item = q.get(timeout=timeout)
+            except queue.Empty:
+                yield batch
+                batch = []
+                continue
+            if item is end:
+                break
+            if isinstance(item, _IterError):
+                raise item.error
+            batch.append(item)
+            if len(batch) == 1:
+                deadline = time.time() + max_wait_ms / 1000
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        stop_event.set()
+        thread.join(timeout=1)
+
+
+def iter_merge(iterables, queue_size=10):
+    '''
+    多个迭代器各自在后台线程中并行读取，按产出先后合并为一个迭代器
+    任一迭代器出错时停止其余线程并抛出异常，调用方提前结束迭代时同样通知各线程停止
+    :param iterables: 源迭代器列表
+    :param queue_size: 合并队列最大长度，控制内存占用
+    :return:
+    '''
+    q = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(iterable):
+        try:
+            for item in iterable:
+                if not put(item):
+                    break
+        except Exception as e:
+            put(_IterError(e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+        put(end)
+
+    threads = [threading.Thread(target=produce, args=(i,), daemon=True) for i in iterables]
+    for t in threads:
+        t.start()
+    running = len(threads)
+    try:
+        while running > 0:
+            item = q.get()
+            if item is end:
+                running -= 1
+                continue
+            if isinstance(item, _IterError):
+                raise item.error
+            yield item
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join(timeout=1)
@@ -6,9 +6,20 @@ from sqlalchemy import Column, String, Integer, Text, SmallInteger, DateTime, TI
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy import create_engine, Table, MetaData
+from sqlalchemy import create_engine, Table, MetaData, text
 from sshtunnel import SSHTunnelForwarder
+import hashlib
+import json
+import threading
+import time
 Base = declarative_base()
+# 进程级数据库连接缓存，按数据源连接配置复用连接池引擎及ssh隧道
+_engine_cache = {}
+# 反射表模型缓存，key为(连接配置key, 表名)，value为(表模型, 过期时间)
+_model_cache = {}
+_cache_lock = threading.RLock()
+# 反射表模型缓存有效期(秒)
+MODEL_CACHE_TTL = 600
 
 
 class BaseModel(Base):
@@ -104,10 +115,38 @@ def create_orm_table(obj_db, params, table_args=None):
     return Model
 
 
-def get_database_engine(db_info, res_type='engine'):
+def gen_conn_key(db_info):
     '''
-    获取数据库链接引擎
-    :param db_obj: 数据库模型
+    根据数据源连接配置生成缓存key
+    :param db_info:
+    :return:
+    '''
+    conn_str = json.dumps(db_info, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(conn_str.encode()).hexdigest()
+
+
+def start_ssh_tunnel(db_info):
+    '''
+    启动ssh隧道
+    :param db_info:
+    :return:
+    '''
+    ssh_info = db_info.get('ssh_tunnel')
+    server = SSHTunnelForwarder(
+        (ssh_info['ssh_host'], int(ssh_info['ssh_port'])),
+        ssh_username=ssh_info['ssh_user'],
+        ssh_password=ssh_info['ssh_passwd'],
+        remote_bind_address=(db_info.get('host'), int(db_info.get('port')))
+    )
+    server.start()
+    return server
+
+
+def gen_engine_url(db_info, tunnel=None):
+    '''
+    生成数据库链接地址
+    :param db_info: 数据源连接配置
+    :param tunnel: ssh隧道，有值时连接隧道本地端口
     :return:
     '''
     ENGINE_DICT = {
@@ -119,71 +158,169 @@ def get_database_engine(db_info, res_type='engine'):
         'hive': 'hive'
     }
     DB_TYPE = db_info.get('type')
-    db_engine_url = None
-    if DB_TYPE in ENGINE_DICT:
-        DB_USER = db_info.get('username')
-        DB_PWD = db_info.get('password', '')
-        DB_HOST = db_info.get('host')
-        DB_PORT = db_info.get('port')
-        DB_NAME = db_info.get('database_name')
-        if db_info.get('use_tunnel'):
-            ssh_info = db_info.get('ssh_tunnel')
-            print(ssh_info)
-            ssh_host = ssh_info['ssh_host']
-            ssh_port = ssh_info['ssh_port']
-            ssh_user = ssh_info['ssh_user']
-            ssh_passwd = ssh_info['ssh_passwd']
-            server = SSHTunnelForwarder(
-                (ssh_host, int(ssh_port)),
-                ssh_username=ssh_user,
-                ssh_password=ssh_passwd,
-                remote_bind_address=(DB_HOST, int(DB_PORT))
-            )
-            server.start()
-            DB_PORT = str(server.local_bind_port)
-            # server.close()
-        if DB_TYPE == 'hive':
-            if DB_PWD == '':
-                db_engine_url = f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-            else:
-                db_engine_url = f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?auth=LDAP"
-        else:
-            db_engine_url = f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    if res_type == 'engine_url':
-        return db_engine_url
-    if db_engine_url is not None:
-        db_engine = create_engine(db_engine_url)
-        return db_engine
-    else:
+    if DB_TYPE not in ENGINE_DICT:
+        return None
+    DB_USER = db_info.get('username')
+    DB_PWD = db_info.get('password', '')
+    DB_HOST = db_info.get('host')
+    DB_PORT = db_info.get('port')
+    DB_NAME = db_info.get('database_name')
+    if tunnel is not None:
+        DB_PORT = str(tunnel.local_bind_port)
+    if DB_TYPE == 'hive':
+        if DB_PWD == '':
+            return f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        return f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?auth=LDAP"
+    return f"{ENGINE_DICT[DB_TYPE]}://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+
+def get_database_engine(db_info, res_type='engine', use_cache=True):
+    '''
+    获取数据库链接引擎，默认按连接配置复用进程内连接池引擎及ssh隧道
+    :param db_info: 数据源连接配置
+    :param res_type: engine 返回引擎，engine_url 返回链接地址
+    :param use_cache: 是否复用缓存引擎
+    :return:
+    '''
+    if gen_engine_url(db_info) is None:
         return None
+    conn_key = gen_conn_key(db_info)
+    with _cache_lock:
+        db_engine = None
+        if use_cache and conn_key in _engine_cache:
+            db_engine, tunnel = _engine_cache[conn_key]
+            if tunnel is not None and not tunnel.is_active:
+                # 隧道已断开，重建引擎
+                clear_database_cache(db_info)
+                db_engine = None
+        if db_engine is None:
+            tunnel = start_ssh_tunnel(db_info) if db_info.get('use_tunnel') else None
+            # 长期复用的连接池，取用前检测连接可用，定期回收连接
+            engine_kwargs = {'pool_recycle': 3600}
+            if db_info.get('type') not in ['clickhouse', 'hive']:
+                engine_kwargs['pool_pre_ping'] = True
+            db_engine = create_engine(gen_engine_url(db_info, tunnel), **engine_kwargs)
+            if use_cache:
+                _engine_cache[conn_key] = (db_engine, tunnel)
+    if res_type == 'engine_url':
+        return db_engine.url.render_as_string(hide_password=False)
+    return db_engine
 
 
-def get_database_model(table_name, db_engine=None, db_type='mysql'):
+def get_engine_key(db_engine):
+    '''
+    获取缓存引擎对应的连接配置key，非缓存引擎返回None
     '''
-    根据表名反射出database数据库中的表模型
+    with _cache_lock:
+        for conn_key, (engine, tunnel) in _engine_cache.items():
+            if engine is db_engine:
+                return conn_key
+    return None
+
+
+def clear_database_cache(db_info=None, table_name=None):
+    '''
+    清除数据库缓存
+    :param db_info: 数据源连接配置，为空时清除全部缓存
+    :param table_name: 表名，有值时只清除该表反射模型缓存，否则同时释放引擎及隧道
+    :return:
+    '''
+    with _cache_lock:
+        conn_key = gen_conn_key(db_info) if db_info is not None else None
+        for key in list(_model_cache.keys()):
+            if conn_key is not None and key[0] != conn_key:
+                continue
+            if table_name is not None and key[1] != table_name:
+                continue
+            _model_cache.pop(key, None)
+        if table_name is not None:
+            return
+        conn_keys = [conn_key] if conn_key is not None else list(_engine_cache.keys())
+        for key in conn_keys:
+            if key not in _engine_cache:
+                continue
+            db_engine, tunnel = _engine_cache.pop(key)
+            try:
+                db_engine.dispose()
+                if tunnel is not None:
+                    tunnel.stop()
+            except Exception as e:
+                print(e)
+
+
+def reflect_database_model(table_name, db_engine=None, db_type='mysql'):
+    '''
+    根据表名反射出表模型
+    '''
+    if db_type in ['oracle', 'clickhouse', 'hive']:
+        metadata = MetaData()
+        table = Table(table_name, metadata, autoload_with=db_engine)
+        return table
+    metadata = MetaData()
+    metadata.reflect(db_engine, only=[table_name])
+    Base = automap_base(metadata=metadata)  # 从metadata中生成所有的映射关系为Base
+    Base.prepare()  # 设置被映射的类和关系
+    model = getattr(Base.classes, table_name)  # 将表映射到类上
+    return model
+
+
+def get_database_model(table_name, db_engine=None, db_type='mysql', use_cache=True):
+    '''
+    根据表名反射出database数据库中的表模型，缓存引擎的反射结果在MODEL_CACHE_TTL内复用
     :param table_name:
     :return:
     '''
     try:
         DBSession = sessionmaker(bind=db_engine)
         session = DBSession()
-        if db_type in ['oracle', 'clickhouse', 'hive']:
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=db_engine)
-            return session, table
-        else:
-            metadata = MetaData()
-            metadata.reflect(db_engine, only=[table_name])
-            Base = automap_base(metadata=metadata)  # 从metadata中生成所有的映射关系为Base
-            Base.prepare()  # 设置被映射的类和关系
-            print(Base.classes)
-            model = getattr(Base.classes, table_name)  # 将表映射到类上
-            return session, model
+        conn_key = get_engine_key(db_engine) if use_cache else None
+        if conn_key is None:
+            return session, reflect_database_model(table_name, db_engine, db_type)
+        cache_key = (conn_key, table_name)
+        with _cache_lock:
+            cached = _model_cache.get(cache_key)
+        if cached is not None and cached[1] > time.time():
+            return session, cached[0]
+        model = reflect_database_model(table_name, db_engine, db_type)
+        with _cache_lock:
+            _model_cache[cache_key] = (model, time.time() + MODEL_CACHE_TTL)
+        return session, model
     except Exception as e:
         print(e)
         return False, False
 
 
+def rows_to_batch(rows, columns, res_format='records'):
+    '''
+    将数据库游标返回的行转为批数据
+    :param rows: 行元组列表
+    :param columns: 列名列表
+    :param res_format: records 字典列表，dataframe pandas DataFrame，arrow pyarrow RecordBatch
+    :return:
+    '''
+    if res_format == 'dataframe':
+        import pandas as pd
+        return pd.DataFrame.from_records(rows, columns=columns)
+    if res_format == 'arrow':
+        import pyarrow as pa
+        arrays = [pa.array(list(col)) for col in zip(*rows)] if rows else [pa.array([]) for _ in columns]
+        return pa.RecordBatch.from_arrays(arrays, names=columns)
+    return [dict(zip(columns, row)) for row in rows]
 
 
-
+def stream_query(db_engine, stmt, batch_size=1000, res_format='records'):
+    '''
+    使用服务端游标流式执行查询，跳过orm对象构建，按批返回数据
+    :param db_engine: 数据库链接引擎
+    :param stmt: sqlalchemy查询语句或sql字符串
+    :param batch_size: 每批数量
+    :param res_format: 返回格式，见rows_to_batch
+    :return:
+    '''
+    if isinstance(stmt, str):
+        stmt = text(stmt)
+    with db_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        columns = list(result.keys())
+        for rows in result.partitions(batch_size):
+            yield rows_to_batch(rows, columns, res_format)
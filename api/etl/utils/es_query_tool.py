@@ -487,8 +487,8 @@ class EsQueryTool(object):
         组合返回结果
         :return:
         '''
-        print(result)
-        total = result['hits']['total']['value']
+        # 未统计总数(track_total_hits为false)时不返回hits.total
+        total = result['hits'].get('total', {}).get('value')
         data_li = result['hits']['hits']
         contents = self.gen_contents(data_li, valid_fields)
         aggregations = result.get('aggregations', {})
@@ -0,0 +1,118 @@
+'''
+表格文件分块读取相关工具函数
+'''
+import pandas as pd
+from etl.utils.common_utils import trans_rule_value
+
+
+def iter_csv_chunks(file_obj, chunksize=10000):
+    '''
+    分块读取csv文件
+    :param file_obj: 文件路径或文件对象
+    :param chunksize: 每块行数
+    :return:
+    '''
+    for df in pd.read_csv(file_obj, dtype=object, chunksize=chunksize):
+        yield df
+
+
+def iter_excel_chunks(file_obj, chunksize=10000, file_name=''):
+    '''
+    分块读取excel文件，xlsx使用openpyxl只读模式逐行读取，xls不支持流式读取，读取后分块返回
+    :param file_obj: 文件路径或文件对象，xlsx需可seek
+    :param chunksize: 每块行数
+    :param file_name: 文件名，用于判断文件格式
+    :return:
+    '''
+    if file_name.endswith('.xls'):
+        df = pd.read_excel(file_obj, dtype=object)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+    import openpyxl
+    wb = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(v) if v is not None else f'Unnamed: {i}' for i, v in enumerate(header)]
+        chunk = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            chunk.append(row[:len(columns)])
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        wb.close()
+
+
+def filter_df_by_rules(df, extract_rules):
+    '''
+    按筛选规则生成向量化掩码过滤dataframe
+    :param df:
+    :param extract_rules:
+    :return:
+    '''
+    mask = pd.Series(True, index=df.index)
+    for i in extract_rules:
+        field = i.get('field')
+        rule = i.get('rule')
+        value = trans_rule_value(i.get('value'))
+        if field and value:
+            if rule in ['equal', 'eq']:
+                mask &= df[field] == value
+            elif rule in ['f_equal', 'neq']:
+                mask &= df[field] != value
+            elif rule == 'gt':
+                mask &= df[field] > value
+            elif rule == 'gte':
+                mask &= df[field] >= value
+            elif rule == 'lt':
+                mask &= df[field] < value
+            elif rule == 'lte':
+                mask &= df[field] <= value
+    return df[mask]
+
+
+def rebatch_df_chunks(chunks, batch_size=1000):
+    '''
+    将大小不一的dataframe块重新切分为batch_size行的批
+    :param chunks: dataframe迭代器
+    :param batch_size: 每批行数
+    :return:
+    '''
+    buffer = None
+    for df in chunks:
+        buffer = df if buffer is None else pd.concat([buffer, df], ignore_index=True)
+        while len(buffer) >= batch_size:
+            yield buffer.iloc[:batch_size]
+            buffer = buffer.iloc[batch_size:]
+    if buffer is not None and len(buffer) > 0:
+        yield buffer
+
+
+def read_df_chunks_page(chunks, page=1, pagesize=20):
+    '''
+    从dataframe块中读取指定页，读够数据后停止读取
+    :param chunks: dataframe迭代器
+    :return: 当前页dataframe，已读取行数，是否读取完毕
+    '''
+    need_rows = page * pagesize + 1
+    dfs = []
+    rows = 0
+    finished = True
+    for df in chunks:
+        dfs.append(df)
+        rows += len(df)
+        if rows >= need_rows:
+            finished = False
+            break
+    if dfs == []:
+        return pd.DataFrame(), 0, True
+    df = pd.concat(dfs, ignore_index=True)
+    return df.iloc[(page - 1) * pagesize:page * pagesize], rows, finished
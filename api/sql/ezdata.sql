@@ -220,6 +220,7 @@ CREATE TABLE `data_interface`  (
   `review_time_length` varchar(50) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL COMMENT '授权时长',
   `status` smallint NOT NULL COMMENT '状态0禁用1启用',
   `valid_time` bigint NULL DEFAULT NULL COMMENT '有效期限',
+  `cache_time` int NULL DEFAULT 0 COMMENT '结果缓存时间(秒)，0不缓存',
   `tenant_id` int NULL DEFAULT 1 COMMENT '租户id',
   PRIMARY KEY (`id`) USING BTREE,
   INDEX `ix_data_interface_api_key`(`api_key` ASC) USING BTREE,
@@ -460,6 +461,7 @@ CREATE TABLE `rag_chunk`  (
   `content` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL COMMENT '内容',
   `hash` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL COMMENT '内容hash',
   `position` int NULL DEFAULT NULL COMMENT '分段位置',
+  `chunk_source` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT 'manual' COMMENT '来源(train：训练生成 manual：手动添加)',
   `status` smallint NULL DEFAULT NULL COMMENT '状态( 1已同步 0未同步)',
   `star_flag` smallint NULL DEFAULT NULL COMMENT '标星状态( 1为标星 0没有标星)',
   `description` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL COMMENT '简介',
@@ -476,6 +478,7 @@ CREATE TABLE `rag_chunk`  (
   INDEX `ix_rag_chunk_hash`(`hash` ASC) USING BTREE,
   INDEX `ix_rag_chunk_status`(`status` ASC) USING BTREE,
   INDEX `ix_rag_chunk_star_flag`(`star_flag` ASC) USING BTREE,
+  INDEX `ix_rag_chunk_chunk_source`(`chunk_source` ASC) USING BTREE,
   INDEX `ix_rag_chunk_question_hash`(`question_hash` ASC) USING BTREE,
   INDEX `ix_rag_chunk_datasource_id`(`datasource_id` ASC) USING BTREE,
   INDEX `ix_rag_chunk_dataset_id`(`dataset_id` ASC) USING BTREE,
@@ -525,6 +528,8 @@ CREATE TABLE `rag_document`  (
   `document_type` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL COMMENT '文档类型',
   `name` varchar(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT NULL COMMENT '名称',
   `status` smallint NULL DEFAULT NULL COMMENT '状态( 1为启用 0禁用)',
+  `progress` smallint NULL DEFAULT 0 COMMENT '训练进度(0-100)',
+  `fingerprint` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT '' COMMENT '上次训练成功时的源文件指纹',
   `meta_data` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL COMMENT '文档元信息',
   `chunk_strategy` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL COMMENT '分段策略',
   `description` text CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL COMMENT '简介',
@@ -557,7 +562,7 @@ CREATE TABLE `rag_embedding`  (
   `created_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `tenant_id` int NULL DEFAULT 1 COMMENT '租户id',
   PRIMARY KEY (`id`) USING BTREE,
-  INDEX `ix_rag_embedding_hash`(`hash` ASC) USING BTREE,
+  UNIQUE INDEX `ix_rag_embedding_hash`(`hash` ASC) USING BTREE,
   INDEX `ix_rag_embedding_tenant_id`(`tenant_id` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_general_ci ROW_FORMAT = DYNAMIC;
 
@@ -1716,6 +1721,10 @@ INSERT INTO `sys_dict_item` VALUES (1002, '', 10, 0, 'admin', '2024-07-21 10:52:
 INSERT INTO `sys_dict_item` VALUES (1003, '', 1, 0, 'admin', '2024-07-21 10:52:31', '', '2024-07-21 10:52:31', 34, 'notion导入', 'notion_import', '{}', 1, 1);
 INSERT INTO `sys_dict_item` VALUES (1004, '', 9, 0, 'admin', '2024-07-21 10:52:51', 'admin', '2024-07-21 10:53:03', 34, '网络爬取', 'website_crawl', '{}', 1, 1);
 INSERT INTO `sys_dict_item` VALUES (1005, '', 1, 0, 'admin', '2025-07-31 07:47:20', '', '2025-07-31 07:47:20', 35, '默认模型', 'default', '{}', 1, 1);
+INSERT INTO `sys_dict_item` VALUES (1006, '', 1, 0, 'admin', '2025-08-01 10:00:00', '', '2025-08-01 10:00:00', 18, 'parquet文件', 'file_parquet', '{}', 1, 1);
+INSERT INTO `sys_dict_item` VALUES (1007, '', 1, 0, 'admin', '2025-08-01 10:00:00', '', '2025-08-01 10:00:00', 18, 'arrow文件', 'file_arrow', '{}', 1, 1);
+INSERT INTO `sys_dict_item` VALUES (1008, '', 1, 0, 'admin', '2025-08-01 10:00:00', '', '2025-08-01 10:00:00', 18, 'minio parquet文件', 'minio_parquet', '{}', 1, 1);
+INSERT INTO `sys_dict_item` VALUES (1009, '', 1, 0, 'admin', '2025-08-01 10:00:00', '', '2025-08-01 10:00:00', 18, 'minio arrow文件', 'minio_arrow', '{}', 1, 1);
 
 -- ----------------------------
 -- Table structure for sys_file
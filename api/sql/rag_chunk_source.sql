@@ -0,0 +1,7 @@
+-- 已部署环境升级：rag_chunk 增加来源字段 chunk_source，重新训练时只清理训练生成(train)的知识段
+-- 已有记录无法区分来源，统一标记为手动添加(manual)，避免被当作已消失的分段删除；
+-- 之后重新训练时内容仍存在的分段会被重新标记为train
+
+ALTER TABLE `rag_chunk` ADD COLUMN `chunk_source` varchar(32) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL DEFAULT 'manual' COMMENT '来源(train：训练生成 manual：手动添加)' AFTER `position`;
+UPDATE `rag_chunk` SET `chunk_source` = 'manual' WHERE `chunk_source` IS NULL;
+ALTER TABLE `rag_chunk` ADD INDEX `ix_rag_chunk_chunk_source`(`chunk_source` ASC) USING BTREE;
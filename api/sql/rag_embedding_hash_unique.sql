@@ -0,0 +1,8 @@
+-- 已部署环境升级：rag_embedding.hash 改为唯一索引，向量缓存批量写入依赖该约束忽略重复
+-- 先删除重复hash的记录(保留id最小的一条)，再重建唯一索引
+
+DELETE e1 FROM `rag_embedding` e1
+    INNER JOIN `rag_embedding` e2 ON e1.`hash` = e2.`hash` AND e1.`id` > e2.`id`;
+
+ALTER TABLE `rag_embedding` DROP INDEX `ix_rag_embedding_hash`;
+ALTER TABLE `rag_embedding` ADD UNIQUE INDEX `ix_rag_embedding_hash`(`hash` ASC) USING BTREE;
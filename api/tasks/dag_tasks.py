@@ -150,6 +150,9 @@ def dag_node_task(self, node_id, task_id, parent_uuid):
                     if Runner is None:
                         raise ValueError(f'处理失败:未找到任务执行器')
                     else:
+                        if template_code == 'EtlTask' and isinstance(task_conf, dict):
+                            # 增量水位按任务节点隔离，配置相同的不同任务互不影响
+                            task_conf.setdefault('checkpoint_key', f'{task_id}:{node_id}')
                         task_runner = Runner(params=task_conf, logger=logger)
                 else:
                     runner_code = task_template_obj.runner_code
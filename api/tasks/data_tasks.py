@@ -88,9 +88,10 @@ def self_train_rag_data(self, _id, metadata=None, train_type='document'):
         logger.info(f'任务开始，任务id:{uuid}, 执行worker:{worker}')
         try:
             if train_type == 'document':
-                train_document(_id, metadata=metadata)
+                delta = train_document(_id, metadata=metadata)
             else:
-                train_datamodel(_id, metadata=metadata)
+                delta = train_datamodel(_id, metadata=metadata)
+            logger.info(f'训练完成，知识段变化:{delta}')
         except Exception as e:
             logger.exception(e)
 
@@ -42,6 +42,9 @@ def normal_task(self, task_id):
                 if Runner is None:
                     raise ValueError(f'处理失败:未找到任务执行器')
                 else:
+                    if template_code == 'EtlTask' and isinstance(params, dict):
+                        # 增量水位按任务隔离，配置相同的不同任务互不影响
+                        params.setdefault('checkpoint_key', task_id)
                     task_runner = Runner(params=params, logger=logger)
             else:
                 runner_code = task_template_obj.runner_code
@@ -5,6 +5,8 @@ from config import REDIS_HOST, REDIS_PORT, REDIS_PASS, REDIS_DB
 import redis
 import time
 import json
+import threading
+from collections import OrderedDict
 
 pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASS, db=REDIS_DB)
 redis_cli = redis.Redis(connection_pool=pool)
@@ -39,6 +41,91 @@ def get_key_value(key):
         return None
 
 
+def delete_keys(*keys):
+    '''
+    删除键
+    :param keys:
+    :return:
+    '''
+    if not keys:
+        return 0
+    try:
+        return redis_cli.delete(*keys)
+    except Exception as e:
+        print(e)
+        return None
+
+
+def delete_pattern_keys(pattern, batch_size=500):
+    '''
+    按通配符模式删除键，使用scan分批遍历，不阻塞redis
+    :param pattern: 如 interface_result:xxx:*
+    :return: 删除数量
+    '''
+    count = 0
+    try:
+        keys = []
+        for key in redis_cli.scan_iter(match=pattern, count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                count += redis_cli.delete(*keys)
+                keys = []
+        if keys:
+            count += redis_cli.delete(*keys)
+    except Exception as e:
+        print(e)
+    return count
+
+
+def normalize_json_value(value):
+    '''
+    按缓存方式序列化后再解析，日期、Decimal等转为字符串，保证命中与未命中缓存时返回值一致
+    '''
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class LocalLRUCache(object):
+    '''
+    进程内LRU缓存，带过期时间，线程安全
+    '''
+    def __init__(self, maxsize=1000, exp_time=10):
+        '''
+        :param maxsize: 最大缓存条数
+        :param exp_time: 过期时间(秒)
+        '''
+        self.maxsize = maxsize
+        self.exp_time = exp_time
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expire = item
+            if expire < time.time():
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.exp_time)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
 def hset_dict(name, key, p_dict):
     '''
     对哈希设置键和值
@@ -103,6 +190,81 @@ def release_lock(name, value):
         redis_cli.delete(name)
 
 
+class _SingleFlightCall(object):
+    '''
+    进程内正在执行的缓存计算
+    '''
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_single_flight_calls = {}
+_single_flight_lock = threading.Lock()
+
+
+def get_or_set_cache(cache_key, func, exp_time, lock_timeout=30):
+    '''
+    读取json缓存，未命中时执行func并缓存结果，相同key的并发请求只执行一次func：
+    进程内其他线程等待当前计算结果，其他进程通过redis锁等待结果写入缓存
+    :param cache_key: 缓存键
+    :param func: 计算函数，返回(是否缓存, 结果)
+    :param exp_time: 缓存过期时间(秒)
+    :param lock_timeout: 等待其他计算的最长时间(秒)
+    :return: 结果, 是否命中缓存
+    '''
+    value = get_key_value(cache_key)
+    if value is not None:
+        return json.loads(value), True
+    with _single_flight_lock:
+        call = _single_flight_calls.get(cache_key)
+        is_leader = call is None
+        if is_leader:
+            call = _SingleFlightCall()
+            _single_flight_calls[cache_key] = call
+    if not is_leader:
+        call.event.wait(lock_timeout)
+        if call.error is not None:
+            raise call.error
+        if call.event.is_set():
+            return normalize_json_value(call.result), True
+        return normalize_json_value(func()[1]), False
+    lock_key = f'{cache_key}:lock'
+    try:
+        try:
+            locked = redis_cli.set(lock_key, 1, nx=True, ex=lock_timeout)
+        except Exception as e:
+            print(e)
+            locked = True
+        if not locked:
+            # 其他进程正在计算，等待结果写入缓存
+            deadline = time.time() + lock_timeout
+            while time.time() < deadline:
+                time.sleep(0.05)
+                value = get_key_value(cache_key)
+                if value is not None:
+                    call.result = json.loads(value)
+                    return call.result, True
+        try:
+            cacheable, result = func()
+            value = json.dumps(result, ensure_ascii=False, default=str)
+            call.result = json.loads(value)
+            if cacheable:
+                set_key_exp(cache_key, value, exp_time)
+        finally:
+            if locked:
+                delete_keys(lock_key)
+        return call.result, False
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _single_flight_lock:
+            _single_flight_calls.pop(cache_key, None)
+        call.event.set()
+
+
 if __name__ == '__main__':
     a = set_key_exp('test', 1, 10, nx=True)
     print(a)
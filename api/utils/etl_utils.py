@@ -1,7 +1,29 @@
 #-*- coding:utf-8 -*-
+import json
 from web_apps.datamodel.services.datamodel_service import gen_datasource_model_info, gen_extract_info, gen_load_info
 from etl.utils import get_reader, get_writer
+from etl.utils.checkpoint_utils import CheckpointStore, encode_watermark, decode_watermark
 from etl.etl_task import EtlTask
+from utils.cache_utils import get_key_value, set_key_exp, delete_keys
+
+
+class RedisCheckpointStore(CheckpointStore):
+    '''
+    redis水位检查点存储，多worker间共享
+    '''
+    key_prefix = 'etl_checkpoint:'
+
+    def get(self, key):
+        value = get_key_value(f'{self.key_prefix}{key}')
+        if value is None:
+            return None
+        return decode_watermark(json.loads(value))
+
+    def set(self, key, value):
+        set_key_exp(f'{self.key_prefix}{key}', json.dumps(encode_watermark(value)), None)
+
+    def delete(self, key):
+        delete_keys(f'{self.key_prefix}{key}')
 
 
 class MyEtlTask(EtlTask):
@@ -16,20 +38,34 @@ class MyEtlTask(EtlTask):
         '''
         self.extract_info = self.params.get('extract', {})
         self.extract_type = self.extract_info.get('extract_type', 'once')
+        self.init_watermark()
         flag, reader = get_reader_model(self.extract_info)
         if flag:
             self.reader = reader
         else:
             self.error_list.append(reader)
             self.reader = None
-        if self.load_info is not None:
-            flag, writer = get_writer_model(self.load_info)
-            if flag:
-                self.writer = writer
-            else:
-                self.writer = None
-        else:
-            self.writer = None
+        self.check_watermark()
+        self.writer = self.new_writer()
+
+    def get_checkpoint_store(self):
+        '''
+        获取水位检查点存储，使用redis
+        :return:
+        '''
+        return RedisCheckpointStore()
+
+    def new_writer(self):
+        '''
+        创建写入数据模型
+        :return:
+        '''
+        if self.load_info is None:
+            return None
+        flag, writer = get_writer_model(self.load_info)
+        if flag:
+            return writer
+        return None
 
 
 def get_reader_model(extract_info):
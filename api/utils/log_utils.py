@@ -13,7 +13,7 @@ def get_sys_logger():
         'duration': 0
     }
     if LOGGER_TYPE == 'es':
-        logger = get_es_logger(p_name='system_log', index=SYS_LOG_INDEX, log_level=LOG_LEVEL, **sys_log_keys)
+        logger = get_es_logger(p_name='system_log', index=SYS_LOG_INDEX, log_level=LOG_LEVEL, async_flush=True, **sys_log_keys)
     else:
         logger = get_logger(p_name='system_log', f_name=SYS_LOG_INDEX, log_level=LOG_LEVEL)
     return logger
@@ -21,7 +21,8 @@ def get_sys_logger():
 
 def get_interface_logger(interface_log_keys={}):
     if LOGGER_TYPE == 'es':
-        logger = get_es_logger(p_name='interface_log', index=INTERFACE_LOG_INDEX, log_level=LOG_LEVEL, **interface_log_keys)
+        logger = get_es_logger(p_name='interface_log', index=INTERFACE_LOG_INDEX, log_level=LOG_LEVEL, async_flush=True,
+                               **interface_log_keys)
     else:
         logger = get_logger(p_name='interface_log', f_name=INTERFACE_LOG_INDEX, log_level=LOG_LEVEL)
     return logger
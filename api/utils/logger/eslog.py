@@ -7,7 +7,9 @@ Elasticsearch logging handler
 import logging
 import datetime
 import socket
-from threading import Timer, Lock
+import os
+from collections import deque
+from threading import Timer, Lock, Event, Thread
 from enum import Enum
 from elasticsearch import helpers as eshelpers
 from elasticsearch import Elasticsearch, RequestsHttpConnection
@@ -95,6 +97,7 @@ class CMRESHandler(logging.Handler):
     __DEFAULT_INDEX_FREQUENCY = IndexNameFrequency.NOTHING
     __DEFAULT_BUFFER_SIZE = 1000
     __DEFAULT_FLUSH_FREQ_INSEC = 1
+    __DEFAULT_MAX_BUFFER_SIZE = 10000
     __DEFAULT_ADDITIONAL_FIELDS = {}
     __DEFAULT_ES_INDEX_NAME = 'python_logger'
     __DEFAULT_ES_DOC_TYPE = '_doc'
@@ -172,7 +175,9 @@ class CMRESHandler(logging.Handler):
                  es_doc_type=__DEFAULT_ES_DOC_TYPE,
                  es_additional_fields=__DEFAULT_ADDITIONAL_FIELDS,
                  raise_on_indexing_exceptions=__DEFAULT_RAISE_ON_EXCEPTION,
-                 default_timestamp_field_name=__DEFAULT_TIMESTAMP_FIELD_NAME):
+                 default_timestamp_field_name=__DEFAULT_TIMESTAMP_FIELD_NAME,
+                 async_flush=False,
+                 max_buffer_size=__DEFAULT_MAX_BUFFER_SIZE):
         """ Handler constructor
 
         :param hosts: The list of hosts that elasticsearch clients will connect. The list can be provided
@@ -206,6 +211,10 @@ class CMRESHandler(logging.Handler):
                     to the logs, such the application, environment, etc.
         :param raise_on_indexing_exceptions: A boolean, True only for debugging purposes to raise exceptions
                     caused when
+        :param async_flush: A boolean, when True emit only appends to a bounded ring buffer and a background
+                    thread ships the records, so logging never blocks the caller
+        :param max_buffer_size: An int, the ring buffer size in async mode. When the sink is slower than the
+                    producers the oldest records are dropped and counted in ```dropped_count```
         :return: A ready to be used CMRESHandler.
         """
         logging.Handler.__init__(self)
@@ -230,9 +239,17 @@ class CMRESHandler(logging.Handler):
         self.default_timestamp_field_name = default_timestamp_field_name
 
         self._client = None
-        self._buffer = []
+        self.async_flush = async_flush
+        self._buffer = deque(maxlen=max_buffer_size if async_flush else None)
         self._buffer_lock = Lock()
+        self._flush_lock = Lock()
         self._timer = None
+        self._flush_event = Event()
+        self._flush_thread = None
+        self._flush_pid = None
+        self.dropped_count = 0
+        self.failed_count = 0
+        self._reported_dropped = 0
         self._index_name_func = CMRESHandler._INDEX_FREQUENCY_FUNCION_DICT[self.index_name_frequency]
         self.serializer = CMRESSerializer()
 
@@ -242,6 +259,22 @@ class CMRESHandler(logging.Handler):
             self._timer.setDaemon(True)
             self._timer.start()
 
+    def __start_flush_thread(self):
+        # 按进程启动后台刷新线程，fork出的子进程中重新启动
+        if self._flush_thread is None or self._flush_pid != os.getpid() or not self._flush_thread.is_alive():
+            self._flush_pid = os.getpid()
+            self._flush_thread = Thread(target=self.__flush_loop, daemon=True)
+            self._flush_thread.start()
+
+    def __flush_loop(self):
+        while True:
+            self._flush_event.wait(self.flush_frequency_in_sec)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(e)
+
     def __get_es_client(self):
         if self.auth_type == CMRESHandler.AuthType.NO_AUTH:
             if self._client is None:
@@ -254,7 +287,7 @@ class CMRESHandler(logging.Handler):
 
         if self.auth_type == CMRESHandler.AuthType.BASIC_AUTH:
             if self._client is None:
-                return Elasticsearch(hosts=self.hosts,
+                self._client = Elasticsearch(hosts=self.hosts,
                                      http_auth=self.auth_details,
                                      use_ssl=self.use_ssl,
                                      verify_certs=self.verify_certs,
@@ -318,11 +351,17 @@ class CMRESHandler(logging.Handler):
             self._timer.cancel()
         self._timer = None
 
-        if self._buffer:
+        with self._flush_lock:
+            if not self._buffer:
+                return
+            with self._buffer_lock:
+                logs_buffer = self._buffer
+                self._buffer = deque(maxlen=logs_buffer.maxlen)
+                dropped_count = self.dropped_count
+            if dropped_count > self._reported_dropped:
+                print(f'{self.es_index_name} log buffer full, dropped {dropped_count - self._reported_dropped} records')
+                self._reported_dropped = dropped_count
             try:
-                with self._buffer_lock:
-                    logs_buffer = self._buffer
-                    self._buffer = []
                 actions = (
                     {
                         '_index': self._index_name_func.__func__(self.es_index_name),
@@ -337,6 +376,7 @@ class CMRESHandler(logging.Handler):
                     stats_only=True
                 )
             except Exception as exception:
+                self.failed_count += len(logs_buffer)
                 if self.raise_on_indexing_exceptions:
                     raise exception
 
@@ -345,7 +385,7 @@ class CMRESHandler(logging.Handler):
 
         :return: None
         """
-        if self._timer is not None:
+        if self._timer is not None or self.async_flush:
             self.flush()
         self._timer = None
 
@@ -370,9 +410,16 @@ class CMRESHandler(logging.Handler):
             rec['msg'] = ''
         rec[self.default_timestamp_field_name] = self.__get_es_datetime_str(record.created)
         with self._buffer_lock:
+            if self._buffer.maxlen is not None and len(self._buffer) >= self._buffer.maxlen:
+                # 环形缓冲区已满，丢弃最早的记录
+                self.dropped_count += 1
             self._buffer.append(rec)
 
-        if len(self._buffer) >= self.buffer_size:
+        if self.async_flush:
+            self.__start_flush_thread()
+            if len(self._buffer) >= self.buffer_size:
+                self._flush_event.set()
+        elif len(self._buffer) >= self.buffer_size:
             self.flush()
         else:
             self.__schedule_flush()
@@ -4,7 +4,7 @@
 """
 import logging
 from utils.logger.eslog import CMRESHandler
-from config import ES_CONF, ES_HOSTS,  SYS_LOG_INDEX, LOG_LEVEL
+from config import ES_CONF, ES_HOSTS,  SYS_LOG_INDEX, LOG_LEVEL, LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL, LOG_BUFFER_MAX
 import datetime
 import time
 
@@ -19,9 +19,10 @@ auth_type = CMRESHandler.AuthType.BASIC_AUTH if ES_CONF.get('http_auth') else CM
 auth_details = ES_CONF.get('http_auth') if ES_CONF.get('http_auth') else ('', '')
 
 
-def get_es_logger(p_name, hosts=ES_HOSTS, index=SYS_LOG_INDEX, auth_type=auth_type, auth_details=auth_details, log_level=LOG_LEVEL, **kwargs):
+def get_es_logger(p_name, hosts=ES_HOSTS, index=SYS_LOG_INDEX, auth_type=auth_type, auth_details=auth_details, log_level=LOG_LEVEL, async_flush=False, **kwargs):
     """
     example: get_logger('test', [{'host': 'localhost'}], 'test_log_1', **{'event_id': 1000})
+    async_flush: 异步批量写入，日志先写入有界环形缓冲区，后台线程按数量或时间批量写入es，不阻塞调用方
     """
     es_enable = kwargs.get('es_enable', True)
     _logger = logging.getLogger(p_name)
@@ -36,7 +37,10 @@ def get_es_logger(p_name, hosts=ES_HOSTS, index=SYS_LOG_INDEX, auth_type=auth_ty
                                 auth_type=auth_type,
                                 auth_details=auth_details,
                                 es_index_name=index,
-                                buffer_size=0,
+                                buffer_size=LOG_FLUSH_SIZE if async_flush else 0,
+                                flush_frequency_in_sec=LOG_FLUSH_INTERVAL,
+                                async_flush=async_flush,
+                                max_buffer_size=LOG_BUFFER_MAX,
                                 # 额外增加环境标识
                                 es_additional_fields=kwargs)
         _handler.formatter = formatter
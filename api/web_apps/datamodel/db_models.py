@@ -56,6 +56,7 @@ class DataInterface(BaseModel):
     review_time = db.Column(db.BIGINT, comment='审核时间')
     review_time_length = db.Column(db.String(50), default='forever', comment='授权时长')
     status = db.Column(db.SmallInteger, nullable=False, default=1, comment='状态0禁用1启用')
+    cache_time = db.Column(db.Integer, default=0, comment='结果缓存时间(秒)，0不缓存')
 
 
 if __name__ == '__main__':
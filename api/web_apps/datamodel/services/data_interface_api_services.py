@@ -2,12 +2,15 @@
 数据接口api服务
 '''
 import json
+import threading
 from web_apps import db
 from utils.query_utils import get_base_query
 from utils.auth import set_insert_user, set_update_user, get_auth_token_info
-from utils.common_utils import gen_json_response, gen_uuid, get_now_time, parse_json, timestamp_to_date, trans_dict_to_rules, trans_time_length
+from utils.common_utils import gen_json_response, gen_uuid, get_now_time, parse_json, timestamp_to_date, trans_dict_to_rules, trans_time_length, md5
+from utils.cache_utils import get_or_set_cache
 from web_apps.datamodel.db_models import DataInterface, DataModel
-from web_apps.datamodel.services.datamodel_service import gen_datamodel_conf, gen_datasource_conf
+from web_apps.datamodel.services.datamodel_service import gen_datamodel_conf, get_datasource_cache, \
+    get_interface_cache, set_interface_cache, clear_interface_cache
 from utils.etl_utils import get_reader_model, get_res_fields
 from utils.web_utils import validate_params
 import pandas as pd
@@ -24,7 +27,10 @@ interface_log_keys = {
     'apply_user_id': '',
     'apply_user': '',
     'valid_time': '',
-    'valid_fields': ''
+    'valid_fields': '',
+    'cache_status': '',
+    'cache_hits': 0,
+    'cache_misses': 0
 }
 interface_logger = get_interface_logger(interface_log_keys)
 
@@ -63,18 +69,35 @@ def serialize_data_interface_model(obj, ser_type='list'):
 
 def gen_interface_info(api_key):
     '''
-    组合数据接口信息
+    组合数据接口信息，缓存中只保存数据源id，数据源连接配置含账号密码，使用时从进程内缓存或数据库加载
+    :param api_key:
+    :return:
+    '''
+    interface_info = get_interface_cache(api_key)
+    # 旧版本缓存中含数据源配置而无数据源id，按未缓存处理并覆盖
+    if interface_info is None or 'datasource_id' not in interface_info:
+        flag, interface_info = gen_interface_cache_info(api_key)
+        if not flag:
+            return False, interface_info
+    source = get_datasource_cache(interface_info['datasource_id'])
+    if source is None:
+        return False, '未找到数据源'
+    interface_info['source'] = source
+    return True, interface_info
+
+
+def gen_interface_cache_info(api_key):
+    '''
+    查询数据库组合待缓存的数据接口信息，不含数据源连接配置
     :param api_key:
     :return:
     '''
-    # todo: redis缓存
     interface_obj = get_base_query(DataInterface).filter(DataInterface.api_key == api_key).first()
     if interface_obj is None:
         return False, '无效api_key'
     datamodel_obj = get_base_query(DataModel).filter(DataModel.id == interface_obj.datamodel_id).first()
     if datamodel_obj is None:
         return False, '未找到数据模型'
-    _source = gen_datasource_conf(datamodel_obj.datasource_id)
     model_conf = gen_datamodel_conf(interface_obj.datamodel_id)
     interface_info = {
         'api_key': interface_obj.api_key,
@@ -86,12 +109,52 @@ def gen_interface_info(api_key):
         'valid_time': interface_obj.valid_time,
         'valid_fields': interface_obj.valid_fields.split(','),
         'status': interface_obj.status,
+        'cache_time': interface_obj.cache_time or 0,
         'model': model_conf,
-        'source': _source
+        'datasource_id': datamodel_obj.datasource_id
     }
+    set_interface_cache(api_key, interface_info)
     return True, interface_info
 
 
+def gen_result_cache_key(api_key, extract_rules, page, pagesize, show_info=''):
+    '''
+    生成查询结果缓存键，筛选规则归一化后计算哈希，与规则顺序无关
+    :return:
+    '''
+    if isinstance(extract_rules, dict):
+        extract_rules = trans_dict_to_rules(extract_rules)
+    rules = []
+    for i in extract_rules:
+        rules.append(json.dumps({
+            'field': i.get('field', ''),
+            'rule': i.get('rule', ''),
+            'value': i.get('value', '')
+        }, sort_keys=True, ensure_ascii=False, default=str))
+    rules.sort()
+    params = json.dumps([rules, int(page), int(pagesize), str(show_info)], ensure_ascii=False)
+    return f'interface_result:{api_key}:{md5(params)}'
+
+
+# 各接口结果缓存命中、未命中次数，进程内累计
+result_cache_stats = {}
+result_cache_lock = threading.Lock()
+
+
+def count_result_cache(interface_id, cache_status):
+    '''
+    累计接口结果缓存命中次数
+    :return: 命中次数, 未命中次数
+    '''
+    with result_cache_lock:
+        stats = result_cache_stats.setdefault(interface_id, [0, 0])
+        if cache_status == 'hit':
+            stats[0] += 1
+        elif cache_status == 'miss':
+            stats[1] += 1
+        return stats[0], stats[1]
+
+
 class DataInterfaceApiService(object):
     def __init__(self):
         pass
@@ -125,12 +188,12 @@ class DataInterfaceApiService(object):
         }
         page = int(req_dict.get('page', 1))
         pagesize = int(req_dict.get('pagesize', 10))
-        flag, reader = get_reader_model(interface_info)
-        if not flag:
-            return gen_json_response(code=400, msg=reader)
         ai_query = req_dict.get('ai_query', False)
         query_prompt = req_dict.get('query_prompt', '')
         if ai_query and query_prompt != '':
+            flag, reader = get_reader_model(interface_info)
+            if not flag:
+                return gen_json_response(code=400, msg=reader)
             _llm = get_llm()
             if _llm is None:
                 return gen_json_response(code=400, msg='未找到对应llm配置')
@@ -149,25 +212,42 @@ class DataInterfaceApiService(object):
                 'search_type_list': reader.get_search_type_list()
             }
             return gen_json_response(data=res_data)
-        flag, res_data = reader.read_page(page=page, pagesize=pagesize)
+
+        def read_result():
+            '''
+            读取数据，查询成功的结果可缓存
+            '''
+            flag, reader = get_reader_model(interface_info)
+            if not flag:
+                return False, gen_json_response(code=400, msg=reader)
+            flag, res_data = reader.read_page(page=page, pagesize=pagesize)
+            if not flag:
+                return False, gen_json_response(code=400, msg=res_data)
+            if str(show_info) == '1' and res_data['code'] == 200:
+                res_data['data']['fields'] = get_res_fields(res_data['data'])
+                res_data['data']['extract_rules'] = reader.get_extract_rules()
+                res_data['data']['search_type_list'] = reader.get_search_type_list()
+            return res_data['code'] == 200, res_data
+
+        cache_time = int(interface_info.get('cache_time') or 0)
+        if cache_time > 0:
+            cache_key = gen_result_cache_key(api_key, extract_rules, page, pagesize, show_info)
+            res_data, hit = get_or_set_cache(cache_key, read_result, cache_time)
+            cache_status = 'hit' if hit else 'miss'
+        else:
+            res_data = read_result()[1]
+            cache_status = 'none'
         # 记录接口日志
         interface_log_info = {}
         for k in interface_log_keys:
             interface_log_info[k] = interface_info.get(k, '')
         et = get_now_time('')
         interface_log_info['duration'] = round(et - st, 3)
-        print(interface_log_info)
+        interface_log_info['cache_status'] = cache_status
+        interface_log_info['cache_hits'], interface_log_info['cache_misses'] = count_result_cache(
+            interface_info['interface_id'], cache_status)
         interface_logger.info(interface_log_info)
-        if flag:
-            if str(show_info) == '1' and res_data['code'] == 200:
-                res_data['data']['fields'] = get_res_fields(res_data['data'])
-                extract_rules = reader.get_extract_rules()
-                search_type_list = reader.get_search_type_list()
-                res_data['data']['extract_rules'] = extract_rules
-                res_data['data']['search_type_list'] = search_type_list
-            return res_data
-        else:
-            return gen_json_response(code=400, msg=res_data)
+        return res_data
 
     def get_obj_list(self, req_dict):
         '''
@@ -271,6 +351,7 @@ class DataInterfaceApiService(object):
         obj = db.session.query(DataInterface).filter(DataInterface.id == obj_id).first()
         if obj is None:
             return gen_json_response(code=400, msg='未找到数据')
+        old_api_key = obj.api_key
         for key in req_dict:
             # if key in ['valid_fields']:
             #     v = req_dict[key].split(',')
@@ -288,6 +369,8 @@ class DataInterfaceApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        # api_key可能被修改，新旧接口缓存均清除
+        clear_interface_cache([old_api_key, obj.api_key])
         return gen_json_response(msg='操作成功', extends={'success': True})
 
     def edit_obj_status(self, req_dict):
@@ -303,6 +386,7 @@ class DataInterfaceApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        clear_interface_cache([obj.api_key])
         return gen_json_response(msg='操作成功', extends={'success': True})
     
     def delete_obj(self, req_dict):
@@ -318,6 +402,7 @@ class DataInterfaceApiService(object):
         db.session.add(del_obj)
         db.session.commit()
         db.session.flush()
+        clear_interface_cache([del_obj.api_key])
         return gen_json_response(code=200, msg='删除成功', extends={'success': True})
     
     def delete_batch(self, req_dict):
@@ -334,6 +419,7 @@ class DataInterfaceApiService(object):
             db.session.add(del_obj)
             db.session.commit()
             db.session.flush()
+        clear_interface_cache([i.api_key for i in del_objs])
         return gen_json_response(code=200, msg='删除成功', extends={'success': True})
     
     def importExcel(self, file):
@@ -8,7 +8,7 @@ from utils.auth import set_insert_user, set_update_user, get_auth_token_info
 from utils.common_utils import gen_json_response, gen_uuid, parse_json
 from web_apps.datamodel.db_models import DataModel
 from web_apps.datasource.db_models import DataSource
-from web_apps.datamodel.services.datamodel_service import gen_extract_info
+from web_apps.datamodel.services.datamodel_service import gen_extract_info, clear_datamodel_cache
 from utils.etl_utils import get_reader_model
 from utils.web_utils import validate_params
 import pandas as pd
@@ -243,6 +243,7 @@ class DataModelApiService(object):
         obj = db.session.query(DataModel).filter(DataModel.id == obj_id).first()
         if obj is None:
             return gen_json_response(code=400, msg='未找到数据')
+        clear_datamodel_cache(obj)
         for key in req_dict:
             if key in ['model_conf']:
                 setattr(obj, key, json.dumps(req_dict[key], ensure_ascii=False, indent=2))
@@ -263,6 +264,7 @@ class DataModelApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        clear_datamodel_cache(obj)
         return gen_json_response(msg='编辑成功', extends={'success': True})
     
     def delete_obj(self, req_dict):
@@ -273,6 +275,7 @@ class DataModelApiService(object):
         del_obj = db.session.query(DataModel).filter(DataModel.id == obj_id).first()
         if del_obj is None:
             return gen_json_response(code=400, msg='未找到数据')
+        clear_datamodel_cache(del_obj)
         del_obj.del_flag = 1
         set_update_user(del_obj)
         db.session.add(del_obj)
@@ -289,6 +292,7 @@ class DataModelApiService(object):
             del_ids = del_ids.split(',')
         del_objs = db.session.query(DataModel).filter(DataModel.id.in_(del_ids)).all()
         for del_obj in del_objs:
+            clear_datamodel_cache(del_obj)
             del_obj.del_flag = 1
             set_update_user(del_obj)
             db.session.add(del_obj)
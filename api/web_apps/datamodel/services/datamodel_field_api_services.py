@@ -10,7 +10,7 @@ from web_apps.datamodel.db_models import DataModelField
 from utils.web_utils import validate_params
 import pandas as pd
 import io
-from web_apps.datamodel.services.datamodel_service import gen_extract_info
+from web_apps.datamodel.services.datamodel_service import gen_extract_info, clear_datamodel_cache
 from utils.etl_utils import get_reader_model
 
 
@@ -231,6 +231,7 @@ class DataModelFieldApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        clear_datamodel_cache(obj.datamodel_id)
         return gen_json_response(msg='添加成功', extends={'success': True})
     
     def edit_obj(self, req_dict):
@@ -263,6 +264,7 @@ class DataModelFieldApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        clear_datamodel_cache(obj.datamodel_id)
         return gen_json_response(msg='编辑成功', extends={'success': True})
     
     def delete_obj(self, req_dict):
@@ -278,6 +280,7 @@ class DataModelFieldApiService(object):
         db.session.add(del_obj)
         db.session.commit()
         db.session.flush()
+        clear_datamodel_cache(del_obj.datamodel_id)
         return gen_json_response(code=200, msg='删除成功', extends={'success': True})
     
     def delete_batch(self, req_dict):
@@ -294,6 +297,8 @@ class DataModelFieldApiService(object):
             db.session.add(del_obj)
             db.session.commit()
             db.session.flush()
+        for datamodel_id in set(i.datamodel_id for i in del_objs):
+            clear_datamodel_cache(datamodel_id)
         return gen_json_response(code=200, msg='删除成功', extends={'success': True})
     
     def importExcel(self, file):
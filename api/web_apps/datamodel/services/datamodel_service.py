@@ -5,7 +5,14 @@ import json
 from web_apps import db
 from utils.query_utils import get_base_query
 from web_apps.datasource.db_models import DataSource
-from web_apps.datamodel.db_models import DataModel, DataModelField
+from web_apps.datamodel.db_models import DataModel, DataModelField, DataInterface
+from etl.utils.db_utils import clear_database_cache
+from utils.cache_utils import set_key_exp, get_key_value, delete_keys, delete_pattern_keys, LocalLRUCache
+from config import INTERFACE_CACHE_EXP, INTERFACE_LOCAL_CACHE_EXP
+# 数据接口信息进程内缓存，位于redis缓存之前
+interface_local_cache = LocalLRUCache(maxsize=1000, exp_time=INTERFACE_LOCAL_CACHE_EXP)
+# 数据源配置进程内缓存，含连接账号密码，只缓存在进程内不写入redis
+datasource_local_cache = LocalLRUCache(maxsize=1000, exp_time=INTERFACE_LOCAL_CACHE_EXP)
 
 
 def gen_datasource_conf(datasource_obj):
@@ -58,6 +65,117 @@ def gen_datamodel_conf(data_model_obj):
     return model_conf
 
 
+def get_datasource_cache(datasource_id):
+    '''
+    获取数据源配置，优先读取进程内缓存，未缓存时查询数据库
+    :param datasource_id:
+    :return: 数据源配置字典，数据源不存在时返回None
+    '''
+    cache_key = f'datasource_conf:{datasource_id}'
+    value = datasource_local_cache.get(cache_key)
+    if value is None:
+        source_conf = gen_datasource_conf(datasource_id)
+        if source_conf is None:
+            return None
+        value = json.dumps(source_conf, ensure_ascii=False)
+        datasource_local_cache.set(cache_key, value)
+    # 每次返回新对象，调用方修改不影响缓存
+    return json.loads(value)
+
+
+def get_interface_cache(api_key):
+    '''
+    获取缓存的数据接口信息，依次读取进程内缓存、redis缓存
+    :param api_key:
+    :return: 接口信息字典，未缓存时返回None
+    '''
+    cache_key = f'interface_info:{api_key}'
+    value = interface_local_cache.get(cache_key)
+    if value is None:
+        value = get_key_value(cache_key)
+        if value is None:
+            return None
+        interface_local_cache.set(cache_key, value)
+    # 每次返回新对象，调用方修改不影响缓存
+    return json.loads(value)
+
+
+def set_interface_cache(api_key, interface_info):
+    '''
+    缓存数据接口信息
+    :param api_key:
+    :param interface_info:
+    :return:
+    '''
+    cache_key = f'interface_info:{api_key}'
+    value = json.dumps(interface_info, ensure_ascii=False)
+    set_key_exp(cache_key, value, INTERFACE_CACHE_EXP)
+    interface_local_cache.set(cache_key, value)
+
+
+def clear_interface_cache(api_keys):
+    '''
+    清除数据接口信息缓存及查询结果缓存
+    :param api_keys: api_key列表
+    :return:
+    '''
+    api_keys = [api_key for api_key in api_keys if api_key]
+    cache_keys = [f'interface_info:{api_key}' for api_key in api_keys]
+    for cache_key in cache_keys:
+        interface_local_cache.delete(cache_key)
+    delete_keys(*cache_keys)
+    for api_key in api_keys:
+        delete_pattern_keys(f'interface_result:{api_key}:*')
+
+
+def clear_datamodel_interface_cache(datamodel_ids):
+    '''
+    清除数据模型下所有数据接口信息缓存
+    :param datamodel_ids: 数据模型id列表
+    :return:
+    '''
+    if not datamodel_ids:
+        return
+    objs = db.session.query(DataInterface.api_key).filter(DataInterface.datamodel_id.in_(datamodel_ids)).all()
+    clear_interface_cache([i.api_key for i in objs])
+
+
+def clear_datasource_cache(datasource_obj):
+    '''
+    清除数据源对应的数据库连接引擎及表模型缓存
+    :return:
+    '''
+    source_conf = gen_datasource_conf(datasource_obj)
+    if source_conf is None:
+        return
+    conn_conf = source_conf['conn_conf']
+    conn_conf['type'] = source_conf['type']
+    clear_database_cache(conn_conf)
+    datasource_id = datasource_obj if isinstance(datasource_obj, str) else datasource_obj.id
+    datasource_local_cache.delete(f'datasource_conf:{datasource_id}')
+    datamodel_ids = [i.id for i in db.session.query(DataModel.id).filter(DataModel.datasource_id == datasource_id).all()]
+    clear_datamodel_interface_cache(datamodel_ids)
+
+
+def clear_datamodel_cache(data_model_obj):
+    '''
+    清除数据模型对应的表模型缓存，字段或模型配置变更后调用
+    :return:
+    '''
+    model_conf = gen_datamodel_conf(data_model_obj)
+    if model_conf is None:
+        return
+    clear_datamodel_interface_cache([model_conf['id']])
+    source_conf = gen_datasource_conf(model_conf['datasource_id'])
+    if source_conf is None:
+        return
+    conn_conf = source_conf['conn_conf']
+    conn_conf['type'] = source_conf['type']
+    table_name = model_conf['model_conf'].get('name')
+    if table_name:
+        clear_database_cache(conn_conf, table_name)
+
+
 def gen_datasource_model_info(datasource_id):
     '''
     根据单数据源组合数据模型配置
@@ -98,6 +216,8 @@ def gen_extract_info(extract_info):
                 'source': _source,
                 'model': _model,
                 'extract_info': {
+                    # 透传其他抽取参数，如batch_mode、seek_field、total_type
+                    **{k: v for k, v in extract_info.items() if k not in ['model_id', 'search_text', 'search_type']},
                     'batch_size': extract_info.get('batch_size', 1000),
                     'extract_rules': extract_rules
                 }
@@ -12,6 +12,7 @@ from utils.web_utils import validate_params
 import pandas as pd
 import io
 from utils.etl_utils import get_reader_model
+from web_apps.datamodel.services.datamodel_service import clear_datasource_cache
 from tasks.data_tasks import self_gen_datasource_model
 
 
@@ -158,6 +159,7 @@ class DataSourceApiService(object):
         obj = db.session.query(DataSource).filter(DataSource.id == obj_id).first()
         if obj is None:
             return gen_json_response(code=400, msg='未找到数据')
+        clear_datasource_cache(obj)
         for key in req_dict:
             if key in ['conn_conf']:
                 setattr(obj, key, json.dumps(req_dict[key], ensure_ascii=False, indent=2))
@@ -173,6 +175,8 @@ class DataSourceApiService(object):
         db.session.add(obj)
         db.session.commit()
         db.session.flush()
+        # 提交后再次清除，避免提交前并发请求按旧连接信息重新缓存
+        clear_datasource_cache(obj)
         return gen_json_response(msg='编辑成功', extends={'success': True})
     
     def delete_obj(self, req_dict):
@@ -188,6 +192,7 @@ class DataSourceApiService(object):
         del_obj = db.session.query(DataSource).filter(DataSource.id == obj_id).first()
         if del_obj is None:
             return gen_json_response(code=400, msg='未找到数据')
+        clear_datasource_cache(del_obj)
         del_obj.del_flag = 1
         set_update_user(del_obj)
         db.session.add(del_obj)
@@ -209,6 +214,7 @@ class DataSourceApiService(object):
             return gen_json_response(code=400, msg='数据源存在关联数据模型，无法删除')
         del_objs = db.session.query(DataSource).filter(DataSource.id.in_(del_ids)).all()
         for del_obj in del_objs:
+            clear_datasource_cache(del_obj)
             del_obj.del_flag = 1
             set_update_user(del_obj)
             db.session.add(del_obj)
@@ -2,6 +2,7 @@
 rag模块数据模型
 '''
 import pickle
+import numpy as np
 from web_apps import db
 from models import BaseModel
 
@@ -27,6 +28,8 @@ class Document(BaseModel):
     document_type = db.Column(db.String(32), nullable=True, default='', comment='文档类型')
     name = db.Column(db.String(200), nullable=True, default='', comment='名称', index=True)
     status = db.Column(db.SmallInteger, nullable=True, default=1, comment='状态( 1待训练，2训练中，3训练成功，4训练失败)', index=True)
+    progress = db.Column(db.SmallInteger, nullable=True, default=0, comment='训练进度(0-100)')
+    fingerprint = db.Column(db.String(32), nullable=True, default='', comment='上次训练成功时的源文件指纹')
     meta_data = db.Column(db.Text, nullable=True, default='{}', comment='文档元信息')
     chunk_strategy = db.Column(db.Text, nullable=True, default='{}', comment='分段策略')
 
@@ -48,23 +51,44 @@ class Chunk(BaseModel):
     content = db.Column(db.Text, nullable=True, default='', comment='内容')
     hash = db.Column(db.String(32), nullable=True, default='', comment='内容hash', index=True)
     position = db.Column(db.Integer, nullable=True, default=1, comment='分段位置')
+    chunk_source = db.Column(db.String(32), nullable=True, default='manual', comment='来源(train：训练生成 manual：手动添加)', index=True)
     status = db.Column(db.SmallInteger, nullable=True, default=1, comment='状态( 1已同步 0未同步)', index=True)
     star_flag = db.Column(db.SmallInteger, default=0, comment='标星状态( 1为标星 0没有标星)', index=True)
 
 
+# float32向量二进制存储标识，无此前缀的为旧版pickle格式
+EMBEDDING_MAGIC = b'EF32'
+
+
+def encode_embedding(embedding_data):
+    '''
+    向量转为float32紧凑二进制
+    '''
+    return EMBEDDING_MAGIC + np.asarray(embedding_data, dtype='<f4').tobytes()
+
+
+def decode_embedding(data):
+    '''
+    二进制转为向量，兼容旧版pickle格式
+    '''
+    if data[:len(EMBEDDING_MAGIC)] == EMBEDDING_MAGIC:
+        return np.frombuffer(data, dtype='<f4', offset=len(EMBEDDING_MAGIC)).tolist()
+    return pickle.loads(data)
+
+
 class Embedding(db.Model):
     __tablename__ = 'rag_embedding'
 
     id = db.Column(db.String(36), primary_key=True)
-    hash = db.Column(db.String(32), nullable=False, index=True)
+    hash = db.Column(db.String(32), nullable=False, index=True, unique=True)
     embedding = db.Column(db.LargeBinary, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, server_default=db.text('CURRENT_TIMESTAMP(0)'))
 
     def set_embedding(self, embedding_data: list[float]):
-        self.embedding = pickle.dumps(embedding_data, protocol=pickle.HIGHEST_PROTOCOL)
+        self.embedding = encode_embedding(embedding_data)
 
     def get_embedding(self) -> list[float]:
-        return pickle.loads(self.embedding)
+        return decode_embedding(self.embedding)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,81 @@
 from abc import ABC
 from typing import List
 from langchain.embeddings.base import Embeddings
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import insert
 from web_apps import db
-from web_apps.rag.db_models import Embedding
+from web_apps.rag.db_models import Embedding, encode_embedding, decode_embedding
 from utils.common_utils import md5, gen_uuid
+from utils.cache_utils import LocalLRUCache
+from config import EMBEDDING_LOCAL_CACHE_SIZE, EMBEDDING_LOCAL_CACHE_EXP
+
+# 进程内最近使用向量缓存，位于数据库缓存表之前
+embedding_local_cache = LocalLRUCache(maxsize=EMBEDDING_LOCAL_CACHE_SIZE, exp_time=EMBEDDING_LOCAL_CACHE_EXP)
+# 单次IN查询及批量写入的最大条数
+EMBEDDING_BATCH_SIZE = 500
+
+
+def gen_insert_ignore_stmt():
+    '''
+    按数据库类型生成忽略hash冲突的批量插入语句
+    '''
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(Embedding).on_conflict_do_nothing(index_elements=['hash'])
+    if dialect == 'sqlite':
+        return insert(Embedding).prefix_with('OR IGNORE')
+    return insert(Embedding).prefix_with('IGNORE')
+
+
+def get_cache_embeddings(hashes):
+    '''
+    批量获取缓存向量，先查进程内缓存，未命中的按IN批量查询数据库
+    :param hashes: 去重后的hash列表
+    :return: {hash: embedding}
+    '''
+    result = {}
+    db_hashes = []
+    for hash in hashes:
+        embedding = embedding_local_cache.get(hash)
+        if embedding is not None:
+            result[hash] = embedding
+        else:
+            db_hashes.append(hash)
+    for start in range(0, len(db_hashes), EMBEDDING_BATCH_SIZE):
+        chunk = db_hashes[start:start + EMBEDDING_BATCH_SIZE]
+        try:
+            rows = db.session.query(Embedding.hash, Embedding.embedding).filter(Embedding.hash.in_(chunk)).all()
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            continue
+        for hash, data in rows:
+            embedding = decode_embedding(data)
+            result[hash] = embedding
+            embedding_local_cache.set(hash, embedding)
+    return result
+
+
+def set_cache_embeddings(hash_embeddings):
+    '''
+    批量写入缓存向量，已存在的hash忽略
+    :param hash_embeddings: {hash: embedding}
+    :return:
+    '''
+    for hash, embedding in hash_embeddings.items():
+        embedding_local_cache.set(hash, embedding)
+    rows = [{'id': gen_uuid(), 'hash': hash, 'embedding': encode_embedding(embedding)}
+            for hash, embedding in hash_embeddings.items()]
+    if rows == []:
+        return
+    try:
+        stmt = gen_insert_ignore_stmt()
+        for start in range(0, len(rows), EMBEDDING_BATCH_SIZE):
+            db.session.execute(stmt, rows[start:start + EMBEDDING_BATCH_SIZE])
+        db.session.commit()
+    except Exception as e:
+        print('Failed to add embedding to db', e)
+        db.session.rollback()
 
 
 class CacheEmbeddings(Embeddings, ABC):
@@ -14,69 +85,31 @@ class CacheEmbeddings(Embeddings, ABC):
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed search docs."""
-
         # use doc embedding cache or store if not exists
-        text_embeddings_0 = []
-        embedding_queue_texts = []
-
-        status = []  # 0-has cache 1-has no cache
-        for text in texts:
-            hash = md5(text)
-            embedding = db.session.query(Embedding).filter_by(hash=hash).first()
-            if embedding:
-                text_embeddings_0.append(embedding.get_embedding())
-                status.append(0)
-            else:
-                embedding_queue_texts.append(text)
-                status.append(1)
-
-        text_embeddings_1 = self.embeddings.embed_documents(embedding_queue_texts) if embedding_queue_texts != [] else []
-
-        i = 0
-        for text in embedding_queue_texts:
-            hash = md5(text)
-
-            try:
-                embedding = Embedding(id=gen_uuid(), hash=hash)
-                embedding.set_embedding(text_embeddings_1[i])
-                db.session.add(embedding)
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()
-                continue
-            except:
-                print('Failed to add embedding to db')
-                continue
-
-            i += 1
-
-        text_embeddings = []
-
-        for s in status:
-            if s == 0:
-                text_embeddings.append(text_embeddings_0.pop(0))
-            else:
-                text_embeddings.append(text_embeddings_1.pop(0))
-
-        return text_embeddings
+        hashes = [md5(text) for text in texts]
+        hash_embeddings = get_cache_embeddings(list(dict.fromkeys(hashes)))
+
+        # 未命中的文本去重后批量生成向量
+        queue_texts = {}
+        for hash, text in zip(hashes, texts):
+            if hash not in hash_embeddings and hash not in queue_texts:
+                queue_texts[hash] = text
+        if queue_texts:
+            new_embeddings = self.embeddings.embed_documents(list(queue_texts.values()))
+            new_hash_embeddings = dict(zip(queue_texts.keys(), new_embeddings))
+            set_cache_embeddings(new_hash_embeddings)
+            hash_embeddings.update(new_hash_embeddings)
+
+        return [list(hash_embeddings[hash]) for hash in hashes]
 
     def embed_query(self, text: str) -> List[float]:
         """Embed query text."""
         # use doc embedding cache or store if not exists
         hash = md5(text)
-        embedding = db.session.query(Embedding).filter_by(hash=hash).first()
-        if embedding:
-            return embedding.get_embedding()
+        embedding = get_cache_embeddings([hash]).get(hash)
+        if embedding is not None:
+            return list(embedding)
 
         embedding_results = self.embeddings.embed_query(text)
-
-        try:
-            embedding = Embedding(id=gen_uuid(), hash=hash)
-            embedding.set_embedding(embedding_results)
-            db.session.add(embedding)
-            db.session.commit()
-        except IntegrityError:
-            db.session.rollback()
-        except:
-            print('Failed to add embedding to db')
-        return embedding_results
\ No newline at end of file
+        set_cache_embeddings({hash: embedding_results})
+        return embedding_results
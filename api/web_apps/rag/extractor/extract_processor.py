@@ -5,7 +5,7 @@ from typing import Union
 from urllib.parse import unquote
 
 import requests
-from flask import current_app
+from flask import current_app, has_request_context
 
 from web_apps.rag.extractor.csv_extractor import CSVExtractor
 from web_apps.rag.extractor.entity.datasource_type import DatasourceType
@@ -96,11 +96,13 @@ class ExtractProcessor:
                 etl_type = current_app.config.get('ETL_TYPE', '')
                 unstructured_api_url = current_app.config.get('UNSTRUCTURED_API_URL', '')
                 unstructured_api_key = current_app.config.get('UNSTRUCTURED_API_KEY', '')
+                # web请求线程中不fork解析子进程，多进程解析只用于celery任务
+                pdf_extract_workers = 1 if has_request_context() else current_app.config.get('PDF_EXTRACT_WORKERS', 1)
                 if etl_type == 'Unstructured':
                     if file_extension == '.xlsx' or file_extension == '.xls':
                         extractor = ExcelExtractor(file_path)
                     elif file_extension == '.pdf':
-                        extractor = PdfExtractor(file_path)
+                        extractor = PdfExtractor(file_path, num_workers=pdf_extract_workers)
                     elif file_extension in ['.md', '.markdown']:
                         extractor = UnstructuredMarkdownExtractor(file_path, unstructured_api_url) if is_automatic \
                             else MarkdownExtractor(file_path, autodetect_encoding=True)
@@ -130,7 +132,7 @@ class ExtractProcessor:
                     if file_extension == '.xlsx' or file_extension == '.xls':
                         extractor = ExcelExtractor(file_path)
                     elif file_extension == '.pdf':
-                        extractor = PdfExtractor(file_path)
+                        extractor = PdfExtractor(file_path, num_workers=pdf_extract_workers)
                     elif file_extension in ['.md', '.markdown']:
                         extractor = MarkdownExtractor(file_path, autodetect_encoding=True)
                     elif file_extension in ['.htm', '.html']:
@@ -94,8 +94,10 @@ def _is_page_all_images(elements: List[PdfElement]) -> bool:
 def _batch_extract_elements_content(elements: List[Tuple[int, List[PdfElement]]],
                                     document_id: str,
                                     file_name: str,
-                                    keep_ocr_image: bool = True) -> Dict[str, str]:
-    num_workers = 1
+                                    keep_ocr_image: bool = True,
+                                    num_workers: int = 1) -> Dict[str, str]:
+    # 图片上传、ocr等为io操作，使用线程池
+    num_workers = max(num_workers, 1)
     futures = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
         for page_num, page_elements in elements:
@@ -147,7 +149,8 @@ class PdfExtractor(BaseExtractor):
             ignore_image_side_less_than: Optional[int] = 0,
             show_progress: Optional[bool] = False,
             keep_ocr_image: Optional[bool] = True,
-            extract_image: Optional[bool] = True
+            extract_image: Optional[bool] = True,
+            num_workers: Optional[int] = 1
     ):
         """Initialize with file path.
         :return_full_document 将文档所有内容合并为一个document展示
@@ -155,6 +158,7 @@ class PdfExtractor(BaseExtractor):
         :optimize_table 表格优化开关(去空行空列、对齐等)
         :optimize_image 图片优化开关
         :ignore_image_side_less_than 图片优化开关开启后，当图片的长宽小于某个长度时，剔除图片
+        :num_workers 解析进程数，大于1时按页范围多进程解析，结果按页序合并后再去除页头页尾
         """
         self._file_path = file_path
         self._file_cache_key = file_cache_key
@@ -166,6 +170,7 @@ class PdfExtractor(BaseExtractor):
         self.show_progress = show_progress
         self.keep_ocr_image = keep_ocr_image and extract_image
         self.extract_image = extract_image
+        self.num_workers = num_workers
 
     @staticmethod
     def _filter_header_footers_by_text(page_group_elements: List[List[PdfElement]],
@@ -346,12 +351,13 @@ class PdfExtractor(BaseExtractor):
                                             self.optimize_table,
                                             self.optimize_image,
                                             self.ignore_image_side_less_than,
-                                            self.extract_image)
+                                            self.extract_image,
+                                            self.num_workers)
         logging.info(f"文件[{file_name}]元素解析完成")
         # 元素内容转换: id->content
         logging.info(f"文件[{file_name}]元素内容提取开始")
         pdf_elements_content_dict = _batch_extract_elements_content(pdf_elements, document_id, file_name,
-                                                                    self.keep_ocr_image)
+                                                                    self.keep_ocr_image, self.num_workers)
         logging.info(f"文件[{file_name}]元素内容提取完成")
 
         # 按页面处理头尾
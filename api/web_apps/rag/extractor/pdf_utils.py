@@ -1,7 +1,10 @@
 import gc
 import logging
+import math
+import multiprocessing
 import pathlib
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from io import BufferedReader, BytesIO
 from typing import List, Union, Tuple, Set
 import fitz
@@ -125,18 +128,22 @@ class PdfImage:
         self.ext = ext
 
 
+def _extract_page_as_image_elements(page: Page) -> List[PdfElement]:
+    pix = page.get_pixmap(dpi=200, alpha=False)
+    element = PdfElement(type='image', bbox=tuple(page.rect), content=PdfImage(height=pix.height,
+                                                                                width=pix.width,
+                                                                                image=pix.tobytes(),
+                                                                                ext='png'))
+    return [element]
+
+
 def _extract_pdf_as_image_elements(pdf_file) -> List[Tuple[int, List[PdfElement]]]:
     results = []
     with fitz.open(pdf_file) as doc:
         total_page = doc.page_count
         for index in range(0, total_page):
             page: Page = doc[index]
-            pix = page.get_pixmap(dpi=200, alpha=False)
-            element = PdfElement(type='image', bbox=page.rect, content=PdfImage(height=pix.height,
-                                                                                width=pix.width,
-                                                                                image=pix.tobytes(),
-                                                                                ext='png'))
-            results.append((index, [element]))
+            results.append((index, _extract_page_as_image_elements(page)))
     _release_mypdf_cache()
     return results
 
@@ -157,56 +164,123 @@ def _release_mypdf_cache():
     gc.collect()
 
 
+# 页数不少于该值时才启用多进程解析
+PARALLEL_MIN_PAGES = 8
+
+
+def _extract_page_elements(page: Page, ignore_image_side_less_than=50) -> List[PdfElement]:
+    """
+    将单页解析成文本、图片、表格元素
+    """
+    page_blocks = _extract_page_blocks(page, ignore_image_side_less_than, ignore_image_bytes_less_than=1024)
+    page_elements = []
+    for page_block in page_blocks:
+        if page_block["type"] == 0:
+            element = PdfElement("text",
+                                 tuple(page_block["bbox"]),
+                                 page_block["text"])
+            page_elements.append(element)
+        if page_block["type"] == 1:
+            element = PdfElement("image",
+                                 tuple(page_block["bbox"]),
+                                 PdfImage(height=page_block["height"],
+                                          width=page_block["width"],
+                                          ext=page_block["ext"],
+                                          image=page_block["image"]
+                                          ))
+            page_elements.append(element)
+        if page_block["type"] == 2:
+            element = PdfElement("table",
+                                 tuple(page_block["bbox"]),
+                                 page_block["table"])
+            page_elements.append(element)
+    return page_elements
+
+
+def _extract_page_range_elements(pdf_file, start, end, ignore_image_side_less_than=50,
+                                 as_image=False) -> List[Tuple[int, List[PdfElement]]]:
+    """
+    子进程中独立打开文件，解析[start, end)范围内的页
+    """
+    results = []
+    with fitz.open(pdf_file) as doc:
+        for index in range(start, end):
+            page: Page = doc[index]
+            if as_image:
+                results.append((index, _extract_page_as_image_elements(page)))
+            else:
+                results.append((index, _extract_page_elements(page, ignore_image_side_less_than)))
+    _release_mypdf_cache()
+    return results
+
+
+def _can_use_process_pool(pdf_file, num_workers, total_page) -> bool:
+    if num_workers <= 1 or total_page < PARALLEL_MIN_PAGES:
+        return False
+    # 子进程需自行打开文件，只支持文件路径
+    if not isinstance(pdf_file, (str, pathlib.Path)):
+        return False
+    # 守护进程中不能再创建子进程，celery prefork worker的子进程即为守护进程，需使用solo模式运行才能并行解析
+    if multiprocessing.current_process().daemon:
+        return False
+    return True
+
+
+def _parallel_extract_elements(pdf_file, total_page, num_workers, ignore_image_side_less_than=50,
+                               as_image=False) -> List[Tuple[int, List[PdfElement]]]:
+    """
+    多进程按页范围解析，每个进程处理一段连续页，结果按页号合并
+    """
+    # 切分为进程数两倍的页范围，平衡各页解析耗时差异
+    range_size = math.ceil(total_page / (num_workers * 2))
+    page_ranges = [(start, min(start + range_size, total_page)) for start in range(0, total_page, range_size)]
+    # 使用fork避免子进程重新导入web应用
+    methods = multiprocessing.get_all_start_methods()
+    mp_context = multiprocessing.get_context('fork') if 'fork' in methods else None
+    results = []
+    with ProcessPoolExecutor(max_workers=min(num_workers, len(page_ranges)), mp_context=mp_context) as executor:
+        futures = [executor.submit(_extract_page_range_elements, str(pdf_file), start, end,
+                                   ignore_image_side_less_than, as_image) for start, end in page_ranges]
+        for future in futures:
+            results.extend(future.result())
+    results.sort(key=lambda x: x[0])
+    return results
+
+
 def extract_pdf_elements(pdf_file: Union[str, pathlib.Path, BufferedReader, BytesIO],
                          show_progress=False,
                          table_settings=None,
                          optimize_table=True,
                          optimize_image=True,
                          ignore_image_side_less_than=50,
-                         extract_image=True
+                         extract_image=True,
+                         num_workers=1
                          ) -> List[Tuple[int, List[PdfElement]]]:
     """
     将PDF使用mupdf工具解析成文本、图片、表格
+    :param num_workers: 解析进程数，大于1且页数较多时按页范围多进程解析
     """
-    if detect_pdf_invalid_chars2(pdf_file):
-        return _extract_pdf_as_image_elements(pdf_file)
+    as_image = detect_pdf_invalid_chars2(pdf_file)
     MAX_PAGES = 1000
     MAX_PER_PAGE_ELEMENTS = 300
 
-    results = []
-
     with fitz.open(pdf_file) as doc:
         total_page = len(doc)
-        if total_page > MAX_PAGES:
-            import os
-            file_name = os.path.basename(pdf_file)
-            raise RuntimeError(f"{file_name}文件超过了{MAX_PAGES}页")
+    if not as_image and total_page > MAX_PAGES:
+        import os
+        file_name = os.path.basename(pdf_file)
+        raise RuntimeError(f"{file_name}文件超过了{MAX_PAGES}页")
+    if _can_use_process_pool(pdf_file, num_workers, total_page):
+        return _parallel_extract_elements(pdf_file, total_page, num_workers, ignore_image_side_less_than, as_image)
+    if as_image:
+        return _extract_pdf_as_image_elements(pdf_file)
 
+    results = []
+
+    with fitz.open(pdf_file) as doc:
         for index in range(0, total_page):
             page: Page = doc[index]
-            page_blocks = _extract_page_blocks(page, ignore_image_side_less_than, ignore_image_bytes_less_than=1024)
-            page_elements = []
-            for page_block in page_blocks:
-                if page_block["type"] == 0:
-                    element = PdfElement("text",
-                                         tuple(page_block["bbox"]),
-                                         page_block["text"])
-                    page_elements.append(element)
-                if page_block["type"] == 1:
-                    element = PdfElement("image",
-                                         tuple(page_block["bbox"]),
-                                         PdfImage(height=page_block["height"],
-                                                  width=page_block["width"],
-                                                  ext=page_block["ext"],
-                                                  image=page_block["image"]
-                                                  ))
-                    page_elements.append(element)
-                if page_block["type"] == 2:
-                    element = PdfElement("table",
-                                         tuple(page_block["bbox"]),
-                                         page_block["table"])
-                    page_elements.append(element)
-            results.append((index, page_elements))
+            results.append((index, _extract_page_elements(page, ignore_image_side_less_than)))
 
     _release_mypdf_cache()
 
@@ -19,12 +19,12 @@ class RerankRunner:
         :return:
         """
         docs = []
-        doc_id = []
+        doc_id = set()
         unique_documents = []
         for document in documents:
             _hash = md5(document.page_content)
             if _hash not in doc_id:
-                doc_id.append(_hash)
+                doc_id.add(_hash)
                 docs.append(document.page_content)
                 unique_documents.append(document)
 
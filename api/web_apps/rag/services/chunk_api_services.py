@@ -20,7 +20,7 @@ def serialize_chunk_model(obj, ser_type='list'):
     dic = obj.to_dict()
     if ser_type == 'list':
         res = {}
-        for k in ['id', 'dataset_id', 'document_id', 'datasource_id', 'datamodel_id', 'chunk_type', 'question', 'answer', 'content', 'hash', 'position', 'status', 'star_flag', 'create_by', 'create_time', 'update_by', 'update_time', 'del_flag', 'sort_no', 'description']:
+        for k in ['id', 'dataset_id', 'document_id', 'datasource_id', 'datamodel_id', 'chunk_type', 'question', 'answer', 'content', 'hash', 'position', 'chunk_source', 'status', 'star_flag', 'create_by', 'create_time', 'update_by', 'update_time', 'del_flag', 'sort_no', 'description']:
             if k in []:
                 res[k] = json.loads(dic[k])
             else:
@@ -20,7 +20,7 @@ def serialize_document_model(obj, ser_type='list'):
     dic = obj.to_dict()
     if ser_type == 'list':
         res = {}
-        for k in ['id', 'dataset_id', 'document_type', 'name', 'meta_data', 'chunk_strategy', 'status', 'create_by', 'create_time', 'update_by', 'update_time', 'del_flag', 'sort_no', 'description']:
+        for k in ['id', 'dataset_id', 'document_type', 'name', 'meta_data', 'chunk_strategy', 'status', 'progress', 'create_by', 'create_time', 'update_by', 'update_time', 'del_flag', 'sort_no', 'description']:
             if k in ['meta_data', 'chunk_strategy']:
                 res[k] = json.loads(dic[k])
             else:
@@ -131,9 +131,9 @@ class DocumentApiService(object):
         from web_apps.rag.services.rag_service import train_document
         try:
             # 设置用户信息到metadata中
-            metadata = {'user_name': user_info['username']}
-            train_document(obj.id, metadata=metadata)
-            return gen_json_response(msg='训练任务已启动', extends={'success': True})
+            metadata = {'user_name': user_info['username'], 'incremental': req_dict.get('incremental', 1)}
+            delta = train_document(obj.id, metadata=metadata)
+            return gen_json_response(data=delta, msg='训练任务已启动', extends={'success': True})
         except Exception as e:
             return gen_json_response(code=500, msg=f'训练任务启动失败: {str(e)}', extends={'success': False})
 
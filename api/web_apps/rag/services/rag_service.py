@@ -2,68 +2,286 @@ from web_apps import db, app
 from utils.auth import set_insert_user, set_update_user
 from utils.etl_utils import get_reader_model
 from utils.common_utils import gen_uuid, md5, parse_json
+from utils.storage_utils import storage
 from web_apps.rag.splitter.text_splitter import RecursiveCharacterTextSplitter
 from web_apps.rag.db_models import Document, Chunk
 from web_apps.datamodel.db_models import DataModel
 from web_apps.rag.extractor.extract_processor import ExtractProcessor, ExtractSetting
 from web_apps.rag.extractor.entity.extract_setting import WebsiteInfo
-from web_apps.rag.utils import vector_index, text_index, rerank_runner
+from web_apps.rag.utils import vector_index, text_index, rerank_runner, EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from copy import deepcopy
+from pathlib import Path
+import hashlib
+import json
+import os
+import tempfile
 
 
-def add_chunks_to_store(contents, metadatas):
+# 按hash批量查询已有知识段时单次IN查询的最大条数
+CHUNK_QUERY_SIZE = 500
+# 倒数排名融合平滑常数
+RRF_K = 60
+# 单路召回最大条数
+MAX_FETCH_K = 100
+
+
+def add_chunks_to_store(contents, metadatas, refresh=True):
     '''
     添加知识段到存储
+    :param refresh: 是否立即刷新索引，批量写入时关闭，写完后统一刷新
     '''
     with app.app_context():
         ids = [i['chunk_id'] for i in metadatas]
         if vector_index is not None:
-            vector_index.add_texts(contents, metadatas=metadatas, ids=ids)
+            vector_index.add_texts(contents, metadatas=metadatas, ids=ids, refresh_indices=refresh)
         if text_index is not None:
             # 添加全文索引
-            text_index.add_texts(contents, metadatas=metadatas, ids=ids)
+            text_index.add_texts(contents, metadatas=metadatas, ids=ids, refresh_indices=refresh)
+
+
+def refresh_store():
+    '''
+    刷新存储索引
+    '''
+    with app.app_context():
+        if vector_index is not None:
+            vector_index.refresh()
+        if text_index is not None:
+            text_index.refresh()
+
+
+def bulk_save_chunks(chunks, filters, chunk_info, user_name=None, incremental=False, remove_missing=True):
+    '''
+    批量保存知识段，一次查询已有记录，新增、更新、删除分别批量提交
+    :param chunks: 分段文本列表
+    :param filters: 查询已有知识段的条件
+    :param chunk_info: 知识段公共字段
+    :param user_name:
+    :param incremental: 增量模式，已在检索存储中且内容未变化的知识段不再重新写入
+    :param remove_missing: 是否删除本次分段中已消失的知识段，只处理训练生成(chunk_source为train)的记录，手动添加的知识段保留
+    :return: 需写入检索存储的[(chunk_id, content)]，已消失的知识段id列表，变化统计
+    '''
+    items = {}
+    for position, chunk in enumerate(chunks, start=1):
+        content = chunk.strip()
+        if content == '':
+            continue
+        _hash = md5(content)
+        # 同一文档内重复内容只保留首次出现的位置
+        if _hash not in items:
+            items[_hash] = (content, position)
+    # 有效记录优先，同hash重复记录只保留一条
+    rows = db.session.query(Chunk.id, Chunk.hash, Chunk.del_flag, Chunk.position, Chunk.chunk_source).filter(
+        *filters,
+        Chunk.chunk_type == 'chunk'
+    ).order_by(Chunk.del_flag).all()
+    exist_map = {}
+    removed_ids = []
+    for row in rows:
+        if row.hash in items and row.hash not in exist_map:
+            exist_map[row.hash] = row
+        elif remove_missing and row.del_flag == 0 and row.chunk_source == 'train':
+            removed_ids.append(row.id)
+    insert_rows = []
+    update_rows = []
+    result = []
+    delta = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': len(removed_ids)}
+    for _hash, (content, position) in items.items():
+        row = exist_map.get(_hash)
+        if row is None:
+            _uuid = gen_uuid()
+            insert_rows.append(dict(chunk_info, id=_uuid, chunk_type='chunk', chunk_source='train', content=content,
+                                    hash=_hash, position=position, create_by=user_name))
+            delta['added'] += 1
+        elif incremental and row.del_flag == 0:
+            # 内容未变化，只更新位置及来源
+            if row.position != position or row.chunk_source != 'train':
+                update_rows.append({'id': row.id, 'position': position, 'chunk_source': 'train',
+                                    'update_by': user_name})
+            delta['unchanged'] += 1
+            continue
+        else:
+            _uuid = row.id
+            update_rows.append({'id': _uuid, 'del_flag': 0, 'position': position, 'chunk_source': 'train',
+                                'update_by': user_name})
+            delta['updated'] += 1
+        result.append((_uuid, content))
+    if insert_rows:
+        db.session.bulk_insert_mappings(Chunk, insert_rows)
+    if update_rows:
+        db.session.bulk_update_mappings(Chunk, update_rows)
+    db.session.commit()
+    return result, removed_ids, delta
+
+
+def bulk_remove_chunks(chunk_ids, user_name=None):
+    '''
+    从检索存储中批量删除知识段并软删除记录
+    '''
+    if chunk_ids == []:
+        return
+    delete_chunks(chunk_ids, raise_error=True)
+    for start in range(0, len(chunk_ids), CHUNK_QUERY_SIZE):
+        db.session.query(Chunk).filter(Chunk.id.in_(chunk_ids[start:start + CHUNK_QUERY_SIZE])).update(
+            {'del_flag': 1, 'update_by': user_name}, synchronize_session=False)
+    db.session.commit()
+
+
+def gen_file_fingerprint(file_path, chunk_strategy):
+    '''
+    生成源文件指纹：文件大小、内容hash及分段策略，任一变化都需重新训练
+    '''
+    file_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(block)
+    return md5(f"{os.path.getsize(file_path)}_{file_hash.hexdigest()}_{json.dumps(chunk_strategy, sort_keys=True)}")
+
+
+def bulk_add_chunks_to_store(chunk_items, meta_data, progress_callback=None):
+    '''
+    知识段分批向量化并写入存储，每批一次向量化请求和一次批量写入，多批并发
+    :param chunk_items: [(chunk_id, content)]
+    :param meta_data: 知识段公共元信息
+    :param progress_callback: 进度回调，参数为已完成批数、总批数
+    :return:
+    '''
+    batches = [chunk_items[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(chunk_items), EMBEDDING_BATCH_SIZE)]
+    if batches == []:
+        return
+
+    def add_batch(batch):
+        metadatas = [dict(meta_data, chunk_id=chunk_id) for chunk_id, _ in batch]
+        add_chunks_to_store([content for _, content in batch], metadatas=metadatas, refresh=False)
+
+    # 首批同步写入，保证索引已创建，避免并发创建冲突
+    add_batch(batches[0])
+    if progress_callback is not None:
+        progress_callback(1, len(batches))
+    if len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(batches) - 1, EMBEDDING_WORKERS)) as executor:
+            futures = [executor.submit(add_batch, batch) for batch in batches[1:]]
+            try:
+                finished = 1
+                for future in as_completed(futures):
+                    future.result()
+                    finished += 1
+                    if progress_callback is not None:
+                        progress_callback(finished, len(batches))
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    refresh_store()
+
+
+def gen_progress_callback(document_obj):
+    '''
+    生成训练进度回调，进度变化时更新文档记录
+    '''
+    def progress_callback(finished, total):
+        progress = int(finished * 100 / total)
+        if progress != document_obj.progress:
+            document_obj.progress = progress
+            db.session.add(document_obj)
+            db.session.commit()
+    return progress_callback
 
 
 def delete_chunk(id):
     '''
     从存储中删除知识段
     '''
+    delete_chunks([id])
+
+
+def delete_chunks(ids, raise_error=False):
+    '''
+    从存储中批量删除知识段
+    '''
     with app.app_context():
         try:
             if vector_index is not None:
                 # 从向量索引中删除
-                vector_index.delete_by_ids([id])
+                vector_index.delete_by_ids(ids)
             if text_index is not None:
                 # 从全文索引中删除
-                text_index.delete_by_ids([id])
+                text_index.delete_by_ids(ids)
         except Exception as e:
             print(e)
+            if raise_error:
+                raise
 
 
-def query_knowledge(question, search_kwargs):
+def query_vector_knowledge(question, filters, k, score_threshold=0):
+    '''
+    向量检索，问题只向量化一次，多个数据集/模型条件合并为一次terms查询
+    score为余弦相似度+1(0~2)，与原ElasticVectorSearch检索口径一致，score_threshold按该范围过滤
+    '''
     with app.app_context():
-        retrieval_type = search_kwargs.get('retrieval_type', 'vector')
-        if 'retrieval_type' in search_kwargs:
-            search_kwargs.pop('retrieval_type')
-        kwargs = {
-            'search_kwargs': search_kwargs,
-            'search_type': 'similarity_score_threshold'
-        }
-        documents = []
-        if retrieval_type in ['all', 'vector'] and vector_index is not None:
-            # 向量检索
-            try:
-                documents += vector_index.search(question, **kwargs)
-            except Exception as e:
-                print(e)
-        if retrieval_type in ['all', 'keyword'] and text_index is not None:
-            # 全文检索
-            try:
-                documents += text_index.search(question, **kwargs)
-            except Exception as e:
-                print(e)
-        return documents
+        try:
+            query_vector = vector_index.embed_query(question)
+            results = vector_index.search_by_vector(query_vector, k=k, filters=filters)
+            return [(document, score) for document, score in results if score >= score_threshold]
+        except Exception as e:
+            print(e)
+            return []
+
+
+def query_text_knowledge(question, filters, k):
+    '''
+    全文检索
+    '''
+    try:
+        return text_index.search_by_filters(question, k=k, filters=filters)
+    except Exception as e:
+        print(e)
+        return []
+
+
+def query_knowledge(question, filters, k, score_threshold=0, retrieval_type='vector'):
+    '''
+    多路召回，向量检索与全文检索并发执行
+    :return: 各路召回结果列表[[(document, score)]]
+    '''
+    tasks = []
+    if retrieval_type in ['all', 'vector'] and vector_index is not None:
+        tasks.append((query_vector_knowledge, (question, filters, k, score_threshold)))
+    if retrieval_type in ['all', 'keyword'] and text_index is not None:
+        tasks.append((query_text_knowledge, (question, filters, k)))
+    if len(tasks) <= 1:
+        return [func(*args) for func, args in tasks]
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = [executor.submit(func, *args) for func, args in tasks]
+        return [future.result() for future in futures]
+
+
+def reciprocal_rank_fusion(result_lists, rrf_k=RRF_K):
+    '''
+    倒数排名融合多路召回结果，不同检索方式的分数不可比，只按各路排名计算融合分数，按内容hash去重
+    metadata['score']保留首个召回该文档的检索分数，融合分数写入metadata['rrf_score']
+    :param result_lists: 各路召回结果[[(document, score)]]，已按相关性降序
+    :param rrf_k: 平滑常数
+    :return: 按融合分数降序的文档列表
+    '''
+    fused = {}
+    for results in result_lists:
+        seen = set()
+        for rank, (document, score) in enumerate(results, start=1):
+            _hash = md5(document.page_content)
+            # 同一路中重复内容只取最高排名
+            if _hash in seen:
+                continue
+            seen.add(_hash)
+            if _hash not in fused:
+                document.metadata['score'] = score
+                fused[_hash] = [document, 0]
+            fused[_hash][1] += 1 / (rrf_k + rank)
+    documents = []
+    for document, rrf_score in sorted(fused.values(), key=lambda x: x[1], reverse=True):
+        document.metadata['rrf_score'] = rrf_score
+        documents.append(document)
+    return documents
 
 
 def get_knowledge(question, metadata=None, res_type='text'):
@@ -78,51 +296,23 @@ def get_knowledge(question, metadata=None, res_type='text'):
         else:
             score_threshold = 0
         k = int(metadata.get('k', 5))
-        search_kwargs = {
-            'filter': {},
-            'score_threshold': score_threshold,
-            'k': k,
-            'retrieval_type': metadata.get('retrieval_type', 'vector')
-        }
+        retrieval_type = metadata.get('retrieval_type', 'vector')
         datamodel_ids = []
         if 'datamodel_id' in metadata:
             datamodel_ids = metadata['datamodel_id'].split(',') if isinstance(metadata['datamodel_id'], str) else metadata['datamodel_id']
         dataset_ids = []
         if 'dataset_id' in metadata:
             dataset_ids = metadata['dataset_id'].split(',') if isinstance(metadata['dataset_id'], str) else metadata['dataset_id']
-        search_kwargs_list = []
-        if dataset_ids == [] and datamodel_ids == []:
-            search_kwargs_list = [search_kwargs]
-        else:
-            # 遍历每个条件，组成查询参数
-            for dataset_id in dataset_ids:
-                _search_kwargs = deepcopy(search_kwargs)
-                _search_kwargs['filter']['dataset_id'] = dataset_id
-                search_kwargs_list.append(_search_kwargs)
-            for datamodel_id in datamodel_ids:
-                _search_kwargs = deepcopy(search_kwargs)
-                _search_kwargs['filter']['datamodel_id'] = datamodel_id
-                search_kwargs_list.append(_search_kwargs)
-        if len(search_kwargs_list) <= 1:
-            documents = query_knowledge(question, search_kwargs_list[0])
-        else:
-            # 多线程召回
-            documents = []  # 存储所有文档的总列表
-            with ThreadPoolExecutor(max_workers=min(len(search_kwargs_list), 8)) as executor:
-                future_to_search_kwargs = {executor.submit(query_knowledge, question, kwargs): kwargs for kwargs in
-                                           search_kwargs_list}
-                for future in as_completed(future_to_search_kwargs):
-                    result = future.result()  # 获取返回的文档
-                    documents.extend(result)  # 将返回的文档添加到总列表中
-        # 结果去重
-        doc_id = []
-        unique_documents = []
-        for document in documents:
-            _hash = md5(document.page_content)
-            if _hash not in doc_id:
-                doc_id.append(_hash)
-                unique_documents.append(document)
-        documents = unique_documents
+        filters = {
+            'dataset_id': [i for i in dataset_ids if i],
+            'datamodel_id': [i for i in datamodel_ids if i],
+        }
+        # 合并为一次查询后，按条件数放大召回数量，保持与分别召回时相近的候选规模
+        filter_count = len(filters['dataset_id']) + len(filters['datamodel_id'])
+        fetch_k = min(k * max(filter_count, 1), MAX_FETCH_K)
+        result_lists = query_knowledge(question, filters, fetch_k, score_threshold, retrieval_type)
+        # 融合排序并去重
+        documents = reciprocal_rank_fusion(result_lists)
         if len(documents) > k:
             # 召回数量过多，重排序取 topk
             if str(metadata.get('rerank')) == '1' and rerank_runner is not None:
@@ -133,8 +323,7 @@ def get_knowledge(question, metadata=None, res_type='text'):
                     rerank_score_threshold = 0
                 documents = rerank_runner.run(question, documents, top_n=k,  score_threshold=rerank_score_threshold)
             else:
-                # 直接按分数排序
-                documents = sorted(documents, key=lambda x: x.metadata.get('score', 0), reverse=True)[:k]
+                documents = documents[:k]
         if res_type == 'documents':
             return documents
         if documents == []:
@@ -317,43 +506,25 @@ def train_datamodel(datamodel_id, metadata=None, chunk_strategy=None):
         metadata_text = info_prompt.split('# MetaData:')[1] if '# MetaData:' in info_prompt else info_prompt
         spliter = RecursiveCharacterTextSplitter(separators=['\n\n'], chunk_size=chunk_strategy.get('chunk_size', 1024))
         chunks = spliter.split_text(metadata_text)
-        for chunk in chunks:
-            content = chunk.strip()
-            _hash = md5(content)
-            chunk_obj = db.session.query(Chunk).filter(
-                Chunk.datamodel_id == datamodel_id,
-                Chunk.hash == _hash,
-            ).first()
-            if chunk_obj is None:
-                _uuid = gen_uuid()
-                chunk_obj = Chunk(
-                    id=_uuid,
-                    datasource_id=datasource_id,
-                    datamodel_id=datamodel_id,
-                    chunk_type='chunk',
-                    content=content,
-                    hash=_hash
-                )
-                set_insert_user(chunk_obj, metadata.get('user_name'))
-            else:
-                _uuid = chunk_obj.id
-                chunk_obj.del_flag = 0
-                set_update_user(chunk_obj, metadata.get('user_name'))
-            db.session.add(chunk_obj)
-            db.session.flush()
-            db.session.commit()
-            # 加入检索数据库
-            meta_data = {
-                'chunk_id': _uuid,
-                'datasource_id': datasource_id,
-                'datamodel_id': datamodel_id
-            }
-            add_chunks_to_store([content], metadatas=[meta_data])
+        chunk_info = {
+            'datasource_id': datasource_id,
+            'datamodel_id': datamodel_id,
+        }
+        chunk_items, _, delta = bulk_save_chunks(chunks, [Chunk.datamodel_id == datamodel_id], chunk_info,
+                                                 metadata.get('user_name'),
+                                                 str(metadata.get('incremental', 0)) == '1', remove_missing=False)
+        # 加入检索数据库
+        bulk_add_chunks_to_store(chunk_items, chunk_info)
+        print(f"数据模型训练完成: {datamodel_id}, {delta}")
+        return delta
 
 
 def train_document(document_id, metadata=None):
     '''
     将文档训练加入知识库
+    默认增量训练：上次训练成功且源文件指纹未变化时跳过，否则只写入新增知识段并删除已消失的知识段；
+    metadata中incremental为0时全量训练
+    :return: 变化统计
     '''
     if metadata is None:
         metadata = {}
@@ -369,8 +540,11 @@ def train_document(document_id, metadata=None):
             print(f"文档不存在: {document_id}")
             return
         print(f"找到文档: {document_obj.id}, 名称: {document_obj.name}")
+        # 上次训练未成功时检索存储状态未知，需全量训练
+        incremental = str(metadata.get('incremental', 1)) == '1' and document_obj.status == 3
         # 标记训练中
         document_obj.status = 2
+        document_obj.progress = 0
         db.session.add(document_obj)
         db.session.flush()
         db.session.commit()
@@ -386,75 +560,69 @@ def train_document(document_id, metadata=None):
             print(f"meta_data: {meta_data}")
             print(f"chunk_strategy: {chunk_strategy}")
             
-            setting_args = {}
-            if document_obj.document_type == 'upload_file':
-                upload_file_path = meta_data.get('upload_file')
-                print(f"上传文件路径: {upload_file_path}")
-                if upload_file_path:
-                    file_name = upload_file_path.split('/')[-1]
-                    setting_args['upload_file'] = file_name
-                    print(f"提取的文件名: {file_name}")
+            with tempfile.TemporaryDirectory() as temp_dir:
+                setting_args = {}
+                file_path = None
+                fingerprint = None
+                if document_obj.document_type == 'upload_file':
+                    upload_file_path = meta_data.get('upload_file')
+                    print(f"上传文件路径: {upload_file_path}")
+                    if upload_file_path:
+                        file_name = upload_file_path.split('/')[-1]
+                        setting_args['upload_file'] = file_name
+                        print(f"提取的文件名: {file_name}")
+                    else:
+                        raise Exception("上传文件路径为空")
+                    # 先下载文件计算指纹，未变化时跳过解析
+                    file_path = f"{temp_dir}/source{Path(file_name).suffix}"
+                    storage.download(file_name, file_path)
+                    fingerprint = gen_file_fingerprint(file_path, chunk_strategy)
+                    if incremental and fingerprint == document_obj.fingerprint:
+                        delta = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'skipped': True}
+                        print(f"文档未变化，跳过训练: {document_id}")
+                        document_obj.status = 3
+                        document_obj.progress = 100
+                        db.session.add(document_obj)
+                        db.session.commit()
+                        return delta
                 else:
-                    raise Exception("上传文件路径为空")
-            else:
-                setting_args['website_info'] = WebsiteInfo(
-                    url=meta_data.get('url'),
-                    mode=meta_data.get('mode', 'scrape'),
-                    provider=meta_data.get('provider', 'base')
+                    setting_args['website_info'] = WebsiteInfo(
+                        url=meta_data.get('url'),
+                        mode=meta_data.get('mode', 'scrape'),
+                        provider=meta_data.get('provider', 'base')
+                    )
+                extract_setting = ExtractSetting(
+                    datasource_type=document_obj.document_type,
+                    **setting_args
                 )
-            extract_setting = ExtractSetting(
-                datasource_type=document_obj.document_type,
-                **setting_args
-            )
-            documents = ExtractProcessor.extract(extract_setting)
+                documents = ExtractProcessor.extract(extract_setting, file_path=file_path)
             content = '\n'.join([i.page_content for i in documents])
+            if fingerprint is None:
+                # 网页等无源文件时以解析内容作为指纹
+                fingerprint = md5(f"{content}_{json.dumps(chunk_strategy, sort_keys=True)}")
             spliter = RecursiveCharacterTextSplitter(chunk_size=chunk_strategy.get('chunk_size', 1024))
             chunks = spliter.split_text(content)
-            position = 1
-            for chunk in chunks:
-                content = chunk.strip()
-                _hash = md5(content)
-                chunk_obj = db.session.query(Chunk).filter(
-                    Chunk.document_id == document_id,
-                    Chunk.hash == _hash,
-                ).first()
-                if chunk_obj is None:
-                    _uuid = gen_uuid()
-                    chunk_obj = Chunk(
-                        id=_uuid,
-                        dataset_id=dataset_id,
-                        document_id=document_id,
-                        datasource_id=datasource_id,
-                        datamodel_id=datamodel_id,
-                        chunk_type='chunk',
-                        content=content,
-                        hash=_hash,
-                        position=position
-                    )
-                    set_insert_user(chunk_obj, metadata.get('user_name'))
-                else:
-                    _uuid = chunk_obj.id
-                    chunk_obj.del_flag = 0
-                    chunk_obj.position = position
-                    set_update_user(chunk_obj, metadata.get('user_name'))
-                db.session.add(chunk_obj)
-                db.session.flush()
-                db.session.commit()
-                # 加入检索数据库
-                meta_data = {
-                    'chunk_id': _uuid,
-                    'dataset_id': dataset_id,
-                    'document_id': document_id,
-                    'datasource_id': datasource_id,
-                    'datamodel_id': datamodel_id
-                }
-                add_chunks_to_store([content], metadatas=[meta_data])
-                position += 1
+            chunk_info = {
+                'dataset_id': dataset_id,
+                'document_id': document_id,
+                'datasource_id': datasource_id,
+                'datamodel_id': datamodel_id
+            }
+            chunk_items, removed_ids, delta = bulk_save_chunks(chunks, [Chunk.document_id == document_id], chunk_info,
+                                                               metadata.get('user_name'), incremental)
+            # 加入检索数据库
+            bulk_add_chunks_to_store(chunk_items, chunk_info, gen_progress_callback(document_obj))
+            # 删除已消失的知识段
+            bulk_remove_chunks(removed_ids, metadata.get('user_name'))
+            print(f"文档训练完成: {document_id}, {delta}")
             # 标记训练成功
             document_obj.status = 3
+            document_obj.progress = 100
+            document_obj.fingerprint = fingerprint
             db.session.add(document_obj)
             db.session.flush()
             db.session.commit()
+            return delta
         except Exception as e:
             import traceback
             error_msg = f"训练文档失败: {str(e)}\n{traceback.format_exc()}"
@@ -39,6 +39,37 @@ def _default_query(question, filter: Optional[dict]) -> Dict:
     return query
 
 
+def gen_terms_filter(filters: Optional[Dict[str, List[str]]]) -> Optional[Dict]:
+    """Build an OR filter of terms queries on metadata fields, e.g. {"dataset_id": ["a", "b"]}."""
+    should = [
+        {"terms": {f"metadata.{key}.keyword": values}}
+        for key, values in (filters or {}).items() if values
+    ]
+    if not should:
+        return None
+    return {"bool": {"should": should, "minimum_should_match": 1}}
+
+
+def hits_to_documents(response: Dict) -> List[Tuple[Document, float]]:
+    return [
+        (
+            Document(
+                page_content=hit["_source"]["text"],
+                metadata=hit["_source"]["metadata"],
+            ),
+            hit["_score"],
+        )
+        for hit in response["hits"]["hits"]
+    ]
+
+
+def bulk_delete_by_ids(client: Any, index_name: str, ids: List[str]) -> None:
+    """Delete documents by ids in one bulk request, missing ids are ignored."""
+    from elasticsearch.helpers import bulk
+    requests = [{"_op_type": "delete", "_index": index_name, "_id": _id} for _id in ids]
+    bulk(client, requests, raise_on_error=False)
+
+
 class EsTextIndex:
 
     def __init__(
@@ -56,6 +87,7 @@ class EsTextIndex:
                 "Please install it with `pip install elasticsearch`."
             )
         self.index_name = index_name
+        self._version_num = None
         _ssl_verify = ssl_verify or {}
         try:
             self.client = elasticsearch.Elasticsearch(
@@ -122,6 +154,9 @@ class EsTextIndex:
             self.client.indices.refresh(index=self.index_name)
         return ids
 
+    def refresh(self) -> None:
+        self.client.indices.refresh(index=self.index_name)
+
     def search(
             self, query: str,
             **kwargs
@@ -169,18 +204,27 @@ class EsTextIndex:
         response = self.client_search(
             self.client, self.index_name, _query, size=k
         )
-        hits = [hit for hit in response["hits"]["hits"]]
-        docs_and_scores = [
-            (
-                Document(
-                    page_content=hit["_source"]["text"],
-                    metadata=hit["_source"]["metadata"],
-                ),
-                hit["_score"],
-            )
-            for hit in hits
-        ]
-        return docs_and_scores
+        return hits_to_documents(response)
+
+    def search_by_filters(
+            self, query: str, k: int = 4, filters: Optional[Dict[str, List[str]]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Return docs matching the query, filters are OR-ed terms on metadata fields.
+        Args:
+            query: Text to look up documents.
+            k: Number of Documents to return. Defaults to 4.
+            filters: Metadata field to allowed values.
+        Returns:
+            List of Documents and scores.
+        """
+        _query = {"bool": {"must": [{"match": {"text": query}}]}}
+        terms_filter = gen_terms_filter(filters)
+        if terms_filter:
+            _query["bool"]["filter"] = [terms_filter]
+        response = self.client_search(
+            self.client, self.index_name, _query, size=k
+        )
+        return hits_to_documents(response)
 
     def create_index(self, client: Any, index_name: str, mapping: Dict) -> None:
         version_num = client.info()["version"]["number"][0]
@@ -193,8 +237,7 @@ class EsTextIndex:
     def client_search(
             self, client: Any, index_name: str, query: Dict, size: int
     ) -> Any:
-        version_num = client.info()["version"]["number"][0]
-        version_num = int(version_num)
+        version_num = self._get_version_num(client)
         if version_num >= 8:
             response = client.search(index=index_name, query=query, size=size)
         else:
@@ -203,6 +246,12 @@ class EsTextIndex:
             )
         return response
 
+    def _get_version_num(self, client: Any) -> int:
+        # 版本号只需获取一次，避免每次检索多一次请求
+        if self._version_num is None:
+            self._version_num = int(client.info()["version"]["number"][0])
+        return self._version_num
+
     def delete_by_ids(self, ids: list[str]) -> None:
         """Delete by vector IDs.
 
@@ -213,9 +262,7 @@ class EsTextIndex:
         if ids is None:
             raise ValueError("No ids provided to delete.")
 
-        # TODO: Check if this can be done in bulk
-        for id in ids:
-            self.client.delete(index=self.index_name, id=id)
+        bulk_delete_by_ids(self.client, self.index_name, ids)
 
     def delete(self) -> None:
         """Delete by vector IDs.
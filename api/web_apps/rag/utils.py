@@ -1,5 +1,6 @@
 from langchain_community.embeddings import DashScopeEmbeddings
 from web_apps.rag.vector_index.es_vector_index import EsVectorIndex
+from web_apps.rag.vector_index.local_vector_index import LocalVectorIndex
 from web_apps.rag.text_index.es_text_index import EsTextIndex
 from web_apps.rag.embedding.cached_embedding import CacheEmbeddings
 from web_apps.rag.rerank.rerank import RerankRunner
@@ -8,6 +9,9 @@ from config import SYS_CONF
 
 # embeddings
 EMBEDDING_TYPE = SYS_CONF.get('EMBEDDING_TYPE', '')
+# 训练时每批向量化的文本条数(不超过向量模型单次请求上限)及并发数
+EMBEDDING_BATCH_SIZE = int(SYS_CONF.get('EMBEDDING_BATCH_SIZE', 10))
+EMBEDDING_WORKERS = int(SYS_CONF.get('EMBEDDING_WORKERS', 4))
 # 知识存储
 VECTOR_STORE_TYPE = SYS_CONF.get('VECTOR_STORE_TYPE', '')
 TEXT_STORE_TYPE = SYS_CONF.get('TEXT_STORE_TYPE', 'elasticsearch')
@@ -29,6 +33,8 @@ def get_vector_index():
     embeddings = get_embeddings()
     if VECTOR_STORE_TYPE == 'elasticsearch':
         return EsVectorIndex(embeddings)
+    if VECTOR_STORE_TYPE == 'local':
+        return LocalVectorIndex(embeddings)
     return None
 
 
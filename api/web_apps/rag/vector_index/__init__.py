@@ -37,6 +37,17 @@ class BaseVectorIndex(ABC):
             search_kwargs=search_kwargs
         ).get_relevant_documents(query)
 
+    def embed_query(self, query: str) -> list[float]:
+        return self._embeddings.embed_query(query)
+
+    @abstractmethod
+    def search_by_vector(self, query_vector: list[float], k: int = 4, filters: dict = None):
+        '''
+        按已生成的问题向量检索，filters为字段到可选值列表的映射，各字段间为或关系
+        :return: [(document, score)]，按相似度降序
+        '''
+        raise NotImplementedError
+
     def get_retriever(self, **kwargs):
         vector_store = self._get_vector_store()
         return vector_store.as_retriever(**kwargs)
@@ -45,6 +56,12 @@ class BaseVectorIndex(ABC):
         vector_store = self._get_vector_store()
         vector_store.add_texts(texts, **kwargs)
 
+    def refresh(self) -> None:
+        '''
+        刷新索引使写入数据可被检索，批量写入时关闭单次刷新，写完后统一调用
+        '''
+        pass
+
     def delete_by_ids(self, ids: list[str]) -> None:
         vector_store = self._get_vector_store()
         vector_store.delete(ids)
@@ -1,4 +1,5 @@
 from web_apps.rag.vector_index import BaseVectorIndex
+from web_apps.rag.text_index.es_text_index import bulk_delete_by_ids, gen_terms_filter, hits_to_documents
 from langchain_community.vectorstores import VectorStore
 from langchain_community.vectorstores import ElasticVectorSearch
 from config import SYS_CONF
@@ -22,3 +23,26 @@ class EsVectorIndex(BaseVectorIndex):
         )
         return self._vector_store
 
+    def search_by_vector(self, query_vector, k=4, filters=None):
+        vector_store = self._get_vector_store()
+        script_query = {
+            "script_score": {
+                "query": gen_terms_filter(filters) or {"match_all": {}},
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'vector') + 1.0",
+                    "params": {"query_vector": query_vector},
+                },
+            }
+        }
+        response = vector_store.client_search(
+            vector_store.client, vector_store.index_name, script_query, size=k
+        )
+        return hits_to_documents(response)
+
+    def refresh(self) -> None:
+        vector_store = self._get_vector_store()
+        vector_store.client.indices.refresh(index=vector_store.index_name)
+
+    def delete_by_ids(self, ids: list[str]) -> None:
+        vector_store = self._get_vector_store()
+        bulk_delete_by_ids(vector_store.client, vector_store.index_name, ids)
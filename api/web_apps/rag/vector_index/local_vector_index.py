@@ -0,0 +1,462 @@
+'''
+本地向量索引，向量以float32矩阵追加写入磁盘并内存映射读取，无需部署elasticsearch
+目录结构:
+    manifest.json            当前代次及向量维度
+    vectors.{gen}.f32        归一化后的向量矩阵，按行追加
+    meta.{gen}.jsonl         新增/删除操作日志，记录每行的id、文本和元信息
+    hnsw.{gen}.bin/.json     hnsw索引及其包含的行数，refresh时保存，加载后补齐新增行
+多进程共享同一目录，写入时加文件锁，检索前按日志增量同步其他进程的写入；
+删除只记录日志，无效行过多时压缩为新的代次
+'''
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+from web_apps.rag.vector_index import BaseVectorIndex
+from config import SYS_CONF
+
+VECTOR_STORE_PATH = SYS_CONF.get('VECTOR_STORE_PATH', os.path.join(os.getcwd(), 'data', 'vector_index'))
+VECTOR_STORE_INDEX = SYS_CONF.get('VECTOR_STORE_INDEX', 'rag_store_index')
+# flat 精确检索，hnsw 近似检索(需安装hnswlib)
+VECTOR_INDEX_TYPE = SYS_CONF.get('VECTOR_INDEX_TYPE', 'flat')
+# hnsw检索时的候选集大小，越大召回率越高、耗时越长
+HNSW_EF = int(SYS_CONF.get('VECTOR_INDEX_HNSW_EF', 200))
+# 过滤后候选行数不超过该值时直接精确计算，避免hnsw过滤后召回不足
+FLAT_SEARCH_MAX_ROWS = 20000
+# 无效行占比超过该值时压缩
+COMPACT_RATIO = 0.3
+COMPACT_MIN_ROWS = 1000
+
+
+class LocalVectorIndex(BaseVectorIndex):
+    '''
+    本地向量索引，相似度分数与EsVectorIndex一致，为余弦相似度+1
+    '''
+
+    def __init__(self, embeddings, path=None, index_type=None):
+        super().__init__(embeddings)
+        self.path = path or os.path.join(VECTOR_STORE_PATH, VECTOR_STORE_INDEX)
+        self.index_type = index_type or VECTOR_INDEX_TYPE
+        if self.index_type == 'hnsw':
+            try:
+                import hnswlib
+            except ImportError:
+                raise ImportError(
+                    "Could not import hnswlib python package. "
+                    "Please install it with `pip install hnswlib`."
+                )
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._manifest_mtime = None
+        self._reset_state(generation=0, dim=None)
+
+    def _get_vector_store(self):
+        raise NotImplementedError('本地向量索引不提供langchain VectorStore')
+
+    def _reset_state(self, generation, dim):
+        self._generation = generation
+        self._dim = dim
+        self._log_offset = 0
+        self._rows = 0
+        self._vectors = None
+        self._vector_rows = 0
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._live = np.zeros(0, dtype=bool)
+        self._id_rows = {}
+        self._inverted = defaultdict(lambda: defaultdict(set))
+        self._hnsw = None
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _vector_file(self, generation=None):
+        return self._file(f'vectors.{self._generation if generation is None else generation}.f32')
+
+    def _meta_file(self, generation=None):
+        return self._file(f'meta.{self._generation if generation is None else generation}.jsonl')
+
+    @contextmanager
+    def _file_lock(self):
+        '''
+        跨进程写锁
+        '''
+        with open(self._file('lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(self._file('manifest.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'generation': 0, 'dim': None}
+
+    def _write_manifest(self, generation, dim):
+        tmp_file = self._file('manifest.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'generation': generation, 'dim': dim}, f)
+        os.replace(tmp_file, self._file('manifest.json'))
+
+    def _sync(self):
+        '''
+        同步磁盘上其他进程的写入，代次变化时全量重新加载，否则只读取新增日志
+        '''
+        try:
+            mtime = os.stat(self._file('manifest.json')).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            manifest = self._read_manifest()
+            self._manifest_mtime = mtime
+            if manifest['generation'] != self._generation or self._dim is None:
+                self._reset_state(manifest['generation'], manifest['dim'])
+        try:
+            size = os.path.getsize(self._meta_file())
+        except FileNotFoundError:
+            return
+        if size <= self._log_offset:
+            return
+        with open(self._meta_file(), 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read(size - self._log_offset)
+        # 只处理完整的行
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return
+        self._log_offset += end
+        for line in data[:end].splitlines():
+            if line:
+                self._apply_op(json.loads(line))
+        self._open_vectors()
+        if self._hnsw is None and self.index_type == 'hnsw':
+            self._load_hnsw()
+        self._sync_hnsw()
+
+    def _apply_op(self, op):
+        if op['op'] == 'add':
+            row = op['row']
+            if row >= self._rows:
+                grow = row + 1 - self._rows
+                self._ids.extend([None] * grow)
+                self._texts.extend([''] * grow)
+                self._metadatas.extend([{}] * grow)
+                self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+                self._rows = row + 1
+            self._ids[row] = op['id']
+            self._texts[row] = op['text']
+            self._metadatas[row] = op['metadata']
+            self._live[row] = True
+            self._id_rows[op['id']] = row
+            for key, value in op['metadata'].items():
+                if isinstance(value, (str, int)):
+                    self._inverted[key][str(value)].add(row)
+        elif op['op'] == 'delete':
+            for _id in op['ids']:
+                row = self._id_rows.pop(_id, None)
+                if row is None:
+                    continue
+                self._live[row] = False
+                for key, value in self._metadatas[row].items():
+                    if isinstance(value, (str, int)):
+                        self._inverted[key][str(value)].discard(row)
+                if self._hnsw is not None and row < self._hnsw.get_current_count():
+                    try:
+                        self._hnsw.mark_deleted(row)
+                    except RuntimeError:
+                        pass
+
+    def _open_vectors(self):
+        if self._dim is None or self._rows == 0:
+            return
+        rows = os.path.getsize(self._vector_file()) // (self._dim * 4)
+        if rows != self._vector_rows:
+            self._vectors = np.memmap(self._vector_file(), dtype='<f4', mode='r', shape=(rows, self._dim))
+            self._vector_rows = rows
+
+    def _new_hnsw(self, max_elements):
+        import hnswlib
+        index = hnswlib.Index(space='ip', dim=self._dim)
+        index.init_index(max_elements=max(max_elements, 1024), ef_construction=200, M=16)
+        return index
+
+    def _load_hnsw(self):
+        '''
+        加载已保存的hnsw索引，不存在时新建
+        '''
+        import hnswlib
+        index_file = self._file(f'hnsw.{self._generation}.bin')
+        info_file = self._file(f'hnsw.{self._generation}.json')
+        if os.path.exists(index_file) and os.path.exists(info_file):
+            try:
+                index = hnswlib.Index(space='ip', dim=self._dim)
+                index.load_index(index_file, max_elements=max(self._rows, 1024), allow_replace_deleted=False)
+                self._hnsw = index
+                # 保存后删除的行重新标记
+                for row in np.flatnonzero(~self._live[:index.get_current_count()]):
+                    try:
+                        index.mark_deleted(int(row))
+                    except RuntimeError:
+                        pass
+                return
+            except Exception as e:
+                print(e)
+        self._hnsw = self._new_hnsw(self._rows)
+
+    def _sync_hnsw(self):
+        '''
+        将hnsw索引中缺少的行补齐
+        '''
+        if self._hnsw is None:
+            return
+        start = self._hnsw.get_current_count()
+        end = min(self._rows, self._vector_rows)
+        if end <= start:
+            return
+        if end > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(end, self._hnsw.get_max_elements() * 2))
+        labels = np.arange(start, end)
+        self._hnsw.add_items(np.asarray(self._vectors[start:end]), labels)
+        for row in labels[~self._live[start:end]]:
+            try:
+                self._hnsw.mark_deleted(int(row))
+            except RuntimeError:
+                pass
+
+    def _append_log(self, ops):
+        with open(self._meta_file(), 'ab') as f:
+            f.write(''.join([json.dumps(op, ensure_ascii=False) + '\n' for op in ops]).encode('utf-8'))
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if texts == []:
+            return []
+        embeddings = self._embeddings.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        '''
+        写入已生成的向量，id已存在时覆盖
+        '''
+        vectors = np.asarray(embeddings, dtype='<f4')
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._write_manifest(self._generation, self._dim)
+                self._manifest_mtime = os.stat(self._file('manifest.json')).st_mtime_ns
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f'向量维度{vectors.shape[1]}与索引维度{self._dim}不一致')
+            vector_file = self._vector_file()
+            start = os.path.getsize(vector_file) // (self._dim * 4) if os.path.exists(vector_file) else 0
+            with open(vector_file, 'ab') as f:
+                f.write(vectors.tobytes())
+            ops = []
+            exist_ids = [_id for _id in ids if _id in self._id_rows]
+            if exist_ids:
+                ops.append({'op': 'delete', 'ids': exist_ids})
+            for i, text in enumerate(texts):
+                ops.append({'op': 'add', 'row': start + i, 'id': ids[i], 'text': text, 'metadata': metadatas[i]})
+            self._append_log(ops)
+            self._sync()
+        return ids
+
+    def delete_by_ids(self, ids: list[str]) -> None:
+        with self._lock, self._file_lock():
+            self._sync()
+            ids = [_id for _id in ids if _id in self._id_rows]
+            if ids == []:
+                return
+            self._append_log([{'op': 'delete', 'ids': ids}])
+            self._sync()
+            dead_rows = self._rows - int(self._live.sum())
+            if self._rows >= COMPACT_MIN_ROWS and dead_rows / self._rows > COMPACT_RATIO:
+                self._compact()
+
+    def _compact(self):
+        '''
+        只保留有效行写入新的代次，需在锁内调用
+        '''
+        generation = self._generation + 1
+        rows = np.flatnonzero(self._live[:self._vector_rows])
+        with open(self._vector_file(generation), 'wb') as f:
+            for start in range(0, len(rows), 10000):
+                f.write(np.asarray(self._vectors[rows[start:start + 10000]]).tobytes())
+        with open(self._meta_file(generation), 'wb') as f:
+            for new_row, row in enumerate(rows):
+                op = {'op': 'add', 'row': new_row, 'id': self._ids[row], 'text': self._texts[row],
+                      'metadata': self._metadatas[row]}
+                f.write((json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8'))
+        old_generation = self._generation
+        self._write_manifest(generation, self._dim)
+        for name in [f'vectors.{old_generation}.f32', f'meta.{old_generation}.jsonl',
+                     f'hnsw.{old_generation}.bin', f'hnsw.{old_generation}.json']:
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+        self._manifest_mtime = None
+        self._sync()
+
+    def refresh(self) -> None:
+        '''
+        保存hnsw索引，其他进程加载时无需重建
+        '''
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._hnsw is None:
+                return
+            self._hnsw.save_index(self._file(f'hnsw.{self._generation}.bin'))
+            with open(self._file(f'hnsw.{self._generation}.json'), 'w') as f:
+                json.dump({'count': self._hnsw.get_current_count()}, f)
+
+    def delete(self) -> None:
+        with self._lock, self._file_lock():
+            for name in os.listdir(self.path):
+                if name != 'lock':
+                    os.remove(self._file(name))
+            self._manifest_mtime = None
+            self._reset_state(generation=0, dim=None)
+
+    def _filter_rows(self, filters):
+        '''
+        按元信息过滤，各字段间为或关系，返回有效行号数组，不过滤时返回None
+        '''
+        filters = {key: values if isinstance(values, (list, tuple, set)) else [values]
+                   for key, values in (filters or {}).items() if values}
+        if not filters:
+            return None
+        rows = set()
+        for key, values in filters.items():
+            for value in values:
+                rows |= self._inverted[key].get(str(value), set())
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def search_by_vector(self, query_vector, k=4, filters=None):
+        query = np.asarray(query_vector, dtype='<f4')
+        norm = np.linalg.norm(query)
+        query = query / (norm if norm else 1)
+        with self._lock:
+            self._sync()
+            if self._vectors is None:
+                return []
+            rows = self._filter_rows(filters)
+            limit = min(self._rows, self._vector_rows)
+            if rows is not None:
+                rows = rows[rows < limit]
+            if self._hnsw is not None and (rows is None or len(rows) > FLAT_SEARCH_MAX_ROWS):
+                labels, scores = self._search_hnsw(query, k, rows)
+            else:
+                labels, scores = self._search_flat(query, k, rows, limit)
+            return [
+                (Document(page_content=self._texts[row], metadata=dict(self._metadatas[row])), float(score) + 1.0)
+                for row, score in zip(labels, scores)
+            ]
+
+    def _search_flat(self, query, k, rows, limit):
+        if rows is None:
+            scores = np.asarray(self._vectors[:limit]) @ query
+            scores[~self._live[:limit]] = -np.inf
+            rows = np.arange(limit)
+        else:
+            if len(rows) == 0:
+                return [], []
+            scores = np.asarray(self._vectors[rows]) @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        return rows[top].tolist(), scores[top].tolist()
+
+    def _search_hnsw(self, query, k, rows):
+        live_count = int(self._live.sum()) if rows is None else len(rows)
+        k = min(k, live_count)
+        if k == 0:
+            return [], []
+        self._hnsw.set_ef(max(k * 2, HNSW_EF))
+        row_filter = None
+        if rows is not None:
+            row_filter = set(rows.tolist()).__contains__
+        try:
+            labels, distances = self._hnsw.knn_query(query, k=k, filter=row_filter)
+        except RuntimeError:
+            # 过滤后图中可达的结果不足k条时退回精确计算
+            return self._search_flat(query, k, rows, min(self._rows, self._vector_rows))
+        return labels[0].tolist(), (1 - distances[0]).tolist()
+
+    def search(self, query: str, **kwargs):
+        search_kwargs = kwargs.get('search_kwargs') if kwargs.get('search_kwargs') else {}
+        k = int(search_kwargs.get('k', 4))
+        score_threshold = search_kwargs.get('score_threshold')
+        results = self.search_by_vector(self.embed_query(query), k=k, filters=search_kwargs.get('filter'))
+        docs = []
+        for doc, score in results:
+            if score_threshold is not None and score < float(score_threshold):
+                continue
+            doc.metadata['score'] = score
+            docs.append(doc)
+        return docs
+
+    def get_retriever(self, **kwargs):
+        raise NotImplementedError('本地向量索引不支持retriever')
+
+
+def benchmark(indexes, query_vectors, k=5):
+    '''
+    对比多个向量索引的召回率与检索耗时，以第一个索引的结果作为基准
+    例如 benchmark({'es': EsVectorIndex(embeddings), 'hnsw': LocalVectorIndex(embeddings, index_type='hnsw')}, vectors)
+    :param indexes: 名称到索引的字典，需实现search_by_vector
+    :param query_vectors: 问题向量列表
+    :return: {名称: {'recall': 召回率, 'latency_ms': 平均耗时}}
+    '''
+    results = {}
+    base_hits = None
+    for name, index in indexes.items():
+        hits = []
+        cost = 0
+        for vector in query_vectors:
+            start = time.perf_counter()
+            docs = index.search_by_vector(vector, k=k)
+            cost += time.perf_counter() - start
+            hits.append({doc.page_content for doc, _ in docs})
+        if base_hits is None:
+            base_hits = hits
+        total = sum([len(i) for i in base_hits])
+        same = sum([len(hits[i] & base_hits[i]) for i in range(len(hits))])
+        results[name] = {
+            'recall': same / total if total else 0,
+            'latency_ms': cost * 1000 / max(len(query_vectors), 1)
+        }
+    return results
+
+
+if __name__ == '__main__':
+    import tempfile
+    dim = 256
+    data = np.random.rand(20000, dim).astype('<f4') - 0.5
+    queries = np.random.rand(100, dim).astype('<f4') - 0.5
+    with tempfile.TemporaryDirectory() as temp_dir:
+        indexes = {}
+        for index_type in ['flat', 'hnsw']:
+            index = LocalVectorIndex(None, path=os.path.join(temp_dir, index_type), index_type=index_type)
+            for start in range(0, len(data), 1000):
+                rows = range(start, start + 1000)
+                index.add_embeddings([f'text{i}' for i in rows], data[start:start + 1000],
+                                     metadatas=[{'dataset_id': str(i % 10)} for i in rows],
+                                     ids=[str(i) for i in rows])
+            indexes[index_type] = index
+        print(benchmark(indexes, queries, k=10))
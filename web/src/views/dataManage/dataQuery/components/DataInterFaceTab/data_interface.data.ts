@@ -152,6 +152,14 @@ export const formReviewSchema: FormSchema[] = [
       ],
     },
   },
+  {
+    label: '结果缓存(秒)',
+    field: 'cache_time',
+    required: false,
+    component: 'InputNumber',
+    defaultValue: 0,
+    helpMessage: '相同查询条件的结果缓存时间，0为不缓存',
+  },
   {
     label: '审核说明',
     field: 'review_caption',
@@ -229,6 +237,14 @@ export const formSchema: FormSchema[] = [
       ],
     },
   },
+  {
+    label: '结果缓存(秒)',
+    field: 'cache_time',
+    required: false,
+    component: 'InputNumber',
+    defaultValue: 0,
+    helpMessage: '相同查询条件的结果缓存时间，0为不缓存',
+  },
   {
     label: '审核说明',
     field: 'review_caption',
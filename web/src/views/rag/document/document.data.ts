@@ -113,11 +113,11 @@ export const columns: BasicColumn[] = [
     title: '状态',
     align: 'center',
     dataIndex: 'status',
-    customRender: ({ text }) => {
+    customRender: ({ text, record }) => {
       if (text == 1) {
         return '待训练';
       } else if (text == 2) {
-        return '训练中';
+        return `训练中(${record.progress || 0}%)`;
       } else if (text == 3) {
         return '训练成功';
       } else if (text == 4) {